@@ -0,0 +1,289 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from array import array
+from datetime import date
+from functools import lru_cache
+import math
+
+# Quantiles come back within this relative error of a true value at that rank
+RELATIVE_ACCURACY = 0.01
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Values at or below this count as zero; log buckets cannot hold them
+_MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """Streaming quantile sketch with relative-error guarantees (DDSketch-style).
+
+    A positive value lands in bucket ceil(log_gamma(value)), and a quantile
+    is read back as the middle of its bucket. Buckets are plain counts, so
+    sketches merge by adding them and a value can be taken out again, which
+    lets rollups follow listings being replaced or removed.
+
+    Quantiles are clamped to the smallest and largest values added, so a
+    single $340 offer reads back as 340 rather than its bucket's middle.
+    Taking values out does not narrow those bounds until the sketch empties;
+    wider bounds only clamp less.
+    """
+
+    __slots__ = ("buckets", "zeros", "count", "low", "high")
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.low = math.inf
+        self.high = -math.inf
+
+    def add(self, value: float, weight: int = 1) -> None:
+        """Add a value, or take it out again with a negative weight."""
+        self.count += weight
+        if weight > 0:
+            self.low = min(self.low, value)
+            self.high = max(self.high, value)
+        elif self.count <= 0:
+            self.low, self.high = math.inf, -math.inf
+        if value <= _MIN_VALUE:
+            self.zeros += weight
+            return
+        key = math.ceil(math.log(value) / _LOG_GAMMA)
+        count = self.buckets.get(key, 0) + weight
+        if count:
+            self.buckets[key] = count
+        else:
+            del self.buckets[key]
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.count += other.count
+        self.zeros += other.zeros
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        buckets = self.buckets
+        for key, count in other.buckets.items():
+            buckets[key] = buckets.get(key, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0-1) by nearest rank, or None for an empty sketch.
+
+        That is the ceil(q * count)-th smallest value, so p90 of a handful of
+        offers is the top one rather than something between the top two.
+        """
+        if self.count <= 0:
+            return None
+        # Rounded first so that 0.9 * 10 is rank 9, not 10
+        rank = max(1, math.ceil(round(q * self.count, 9)))
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen >= rank:
+                break
+        return min(max(2 * _GAMMA ** key / (_GAMMA + 1), self.low), self.high)
+
+
+class Rollup:
+    """Offer figures for one category over one day or month."""
+
+    __slots__ = ("offers", "amount_sum", "ratio_sum", "amounts", "ratios")
+
+    def __init__(self) -> None:
+        self.offers = 0
+        self.amount_sum: float = 0
+        self.ratio_sum: float = 0
+        self.amounts = QuantileSketch()
+        self.ratios = QuantileSketch()
+
+    def add(self, amount: float, ratio: Optional[float], weight: int = 1) -> None:
+        self.offers += weight
+        self.amount_sum += weight * amount
+        self.amounts.add(amount, weight)
+        if ratio is not None:
+            self.ratio_sum += weight * ratio
+            self.ratios.add(ratio, weight)
+
+    def merge(self, other: "Rollup") -> None:
+        self.offers += other.offers
+        self.amount_sum += other.amount_sum
+        self.ratio_sum += other.ratio_sum
+        self.amounts.merge(other.amounts)
+        self.ratios.merge(other.ratios)
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float], digits: int) -> Optional[float]:
+            return round(value, digits) if value is not None else None
+
+        return {
+            "offers": self.offers,
+            "avg_offer": rounded(self.amount_sum / self.offers, 2) if self.offers else None,
+            "offer_p50": rounded(self.amounts.quantile(0.5), 2),
+            "offer_p90": rounded(self.amounts.quantile(0.9), 2),
+            "avg_ratio": rounded(self.ratio_sum / self.ratios.count, 3) if self.ratios.count else None,
+            "ratio_p50": rounded(self.ratios.quantile(0.5), 3),
+            "ratio_p90": rounded(self.ratios.quantile(0.9), 3),
+        }
+
+
+@lru_cache(maxsize=4096)
+def month_of(day: int) -> int:
+    """Months since year 0 of a date.toordinal() day."""
+    d = date.fromordinal(day)
+    return d.year * 12 + d.month - 1
+
+
+def month_days(month: int) -> Tuple[int, int]:
+    """First and last day ordinals of a month_of() month."""
+    year, index = divmod(month, 12)
+    first = date(year, index + 1, 1).toordinal()
+    following = date(year + (index == 11), (index + 1) % 12 + 1, 1).toordinal()
+    return first, following - 1
+
+
+def offer_day(offer: Dict[str, Any]) -> Optional[int]:
+    try:
+        return date.fromisoformat(offer.get("date") or "").toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+class OfferAnalytics:
+    """Offer rollups per category, by day and by month of the offer date, for windowed reports.
+
+    Kept up to date as the catalog indexes listings and offers, so a report
+    merges at most a few dozen rollups per category instead of scanning
+    offers: whole months inside a window come from the monthly rollups,
+    and only the days at its edges from the daily ones. Ratios are offer
+    amounts over the listing's current asking price. Offers without a
+    valid date are left out.
+    """
+
+    def __init__(self) -> None:
+        # category -> day or month -> rollup
+        self._daily: Dict[str, Dict[int, Rollup]] = {}
+        self._monthly: Dict[str, Dict[int, Rollup]] = {}
+        # Offers on each day, over all categories
+        self._day_offers: Dict[int, int] = {}
+        # (days, amounts) of each listing's dated offers, to take them out again
+        self._listings: Dict[str, Tuple[array, array]] = {}
+
+    def add_listing(self, item_id: str, category: str, asking_price: float, offers: Iterable[Dict[str, Any]]) -> None:
+        days, amounts = array("l"), array("d")
+        for offer in offers:
+            day = offer_day(offer)
+            if day is not None:
+                days.append(day)
+                amounts.append(offer["amount"])
+        if days:
+            self._listings[item_id] = (days, amounts)
+            for day, amount in zip(days, amounts):
+                self._add(category, asking_price, day, amount, 1)
+
+    def add_offer(self, item_id: str, category: str, asking_price: float, offer: Dict[str, Any]) -> None:
+        day = offer_day(offer)
+        if day is None:
+            return
+        days, amounts = self._listings.setdefault(item_id, (array("l"), array("d")))
+        days.append(day)
+        amounts.append(offer["amount"])
+        self._add(category, asking_price, day, offer["amount"], 1)
+
+    def remove_listing(self, item_id: str, category: str, asking_price: float) -> None:
+        """Take out a listing's offers, given the category and price it was added with."""
+        days, amounts = self._listings.pop(item_id, ((), ()))
+        for day, amount in zip(days, amounts):
+            self._add(category, asking_price, day, amount, -1)
+
+    def _add(self, category: str, asking_price: float, day: int, amount: float, weight: int) -> None:
+        ratio = amount / asking_price if asking_price > 0 else None
+        for rollups, period in ((self._daily, day), (self._monthly, month_of(day))):
+            periods = rollups.setdefault(category, {})
+            rollup = periods.get(period)
+            if rollup is None:
+                rollup = periods[period] = Rollup()
+            rollup.add(amount, ratio, weight)
+            if not rollup.offers:
+                del periods[period]
+                if not periods:
+                    del rollups[category]
+        offers = self._day_offers.get(day, 0) + weight
+        if offers:
+            self._day_offers[day] = offers
+        else:
+            del self._day_offers[day]
+
+    def latest_day(self) -> Optional[int]:
+        """Day ordinal of the most recent dated offer, or None if there are none."""
+        return max(self._day_offers) if self._day_offers else None
+
+    def report(
+        self, category: str = "", days: int = 30, first: Optional[int] = None, last: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Figures for offers dated from day first through day last, per category and overall.
+
+        The window ends at the latest offer date unless last is given, and
+        spans days days unless first is given. category narrows the report
+        to one category, matched case-insensitively.
+        """
+        if last is None:
+            latest = self.latest_day()
+            last = latest if latest is not None else date.today().toordinal()
+        if first is None:
+            first = last - days + 1
+        categories = [name for name in self._daily if not category or name.lower() == category.lower()]
+        total = Rollup()
+        by_category: List[Dict[str, Any]] = []
+        daily: Dict[int, int] = {}
+        for name in sorted(categories):
+            rollup = self._window(name, first, last)
+            if not rollup.offers:
+                continue
+            total.merge(rollup)
+            category_daily = self._daily_offers(name, first, last)
+            for day, offers in category_daily:
+                daily[day] = daily.get(day, 0) + offers
+            by_category.append(dict(
+                rollup.summary(), category=name,
+                daily=[[date.fromordinal(day).isoformat(), offers] for day, offers in category_daily],
+            ))
+        return dict(
+            total.summary(),
+            since=date.fromordinal(first).isoformat(), until=date.fromordinal(last).isoformat(),
+            categories=by_category,
+            daily=[[date.fromordinal(day).isoformat(), daily[day]] for day in sorted(daily)],
+        )
+
+    def _window(self, category: str, first: int, last: int) -> Rollup:
+        daily, monthly = self._daily.get(category, {}), self._monthly.get(category, {})
+        merged = Rollup()
+        # Walk whole months where the window covers them, single days at its edges
+        day = first
+        while day <= last:
+            month = month_of(day)
+            month_first, month_last = month_days(month)
+            if day == month_first and month_last <= last:
+                rollup = monthly.get(month)
+                if rollup is not None:
+                    merged.merge(rollup)
+                day = month_last + 1
+                continue
+            stop = min(month_last, last)
+            if len(daily) < stop - day + 1:
+                # Fewer rollups than days: scan the rollups instead
+                for rollup_day, rollup in daily.items():
+                    if day <= rollup_day <= stop:
+                        merged.merge(rollup)
+            else:
+                for edge_day in range(day, stop + 1):
+                    rollup = daily.get(edge_day)
+                    if rollup is not None:
+                        merged.merge(rollup)
+            day = stop + 1
+        return merged
+
+    def _daily_offers(self, category: str, first: int, last: int) -> List[Tuple[int, int]]:
+        daily = self._daily.get(category, {})
+        if len(daily) < last - first + 1:
+            return sorted((day, rollup.offers) for day, rollup in daily.items() if first <= day <= last)
+        return [(day, daily[day].offers) for day in range(first, last + 1) if day in daily]
@@ -0,0 +1,436 @@
+"""Load test and benchmark for the marketplace tools.
+
+Generates synthetic catalogs, then drives search_items, get_item_details and
+get_marketplace_stats with many concurrent clients, either in-process or over
+the SSE transport, and prints one JSON report with throughput, p50/p99
+latency and peak RSS per catalog size:
+
+    python bench.py --sizes 1000,10000,100000 --modes inprocess,sse --clients 32
+
+Every run happens in a fresh server process seeded through MARKETPLACE_SEED,
+so load time and peak RSS belong to that catalog size alone. The startup
+mode instead times the first response of a server that builds its catalog
+against one started from an index snapshot:
+
+    python bench.py --sizes 1000,100000 --modes startup
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from geo import city_table
+
+# Relative weight of each tool in the simulated traffic
+WORKLOAD = {"search_items": 6, "get_item_details": 3, "get_marketplace_stats": 1}
+
+CATEGORIES = {
+    # category: (relative share of listings, median asking price)
+    "Electronics": (30, 250),
+    "Furniture": (20, 180),
+    "Sports": (15, 120),
+    "Clothing": (15, 40),
+    "Books": (10, 15),
+    "Toys": (10, 30),
+}
+CONDITIONS = ["Like New", "Excellent", "Good", "Fair", "Poor"]
+VOCABULARY = (
+    "vintage used new classic portable wireless leather wooden electric mountain road "
+    "phone laptop camera bike sofa table chair desk lamp guitar watch jacket boots "
+    "console games book series lego puzzle blender speaker monitor keyboard bag dresser "
+    "black white brown red blue small large original rare working tested clean cozy "
+    "pickup cash shipping bundle extra charger case manual box scratches wear"
+).split()
+# Zipf-like word frequencies, so some query terms are far more selective than others
+WORD_WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+
+def synthetic_listings(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield count listings in the MARKETPLACE_ITEMS shape, reproducibly for a seed.
+
+    Offer counts are heavy-tailed: most listings have none or a few, a small
+    share of hot listings draws dozens. Offers cluster below the asking price.
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    shares = [CATEGORIES[category][0] for category in categories]
+    # "city, st" for every US city in the bundled table
+    locations = [key.rsplit(", ", 1)[0] for key in city_table() if key.count(",") == 2 and key.endswith(", us")]
+    sellers = max(count // 20, 1)
+    buyers = max(count // 5, 1)
+    today = date(2024, 6, 1)
+    for n in range(1, count + 1):
+        category = rng.choices(categories, shares)[0]
+        asking_price = max(1, round(rng.lognormvariate(math.log(CATEGORIES[category][1]), 0.8)))
+        posted = today - timedelta(days=rng.randrange(365))
+        offers = []
+        for _ in range(min(int(rng.paretovariate(1.3)) - 1, 200)):
+            offers.append({
+                "buyer": f"buyer{rng.randrange(buyers)}",
+                "amount": max(1, round(asking_price * min(max(rng.gauss(0.85, 0.12), 0.3), 1.1))),
+                "message": " ".join(rng.choices(VOCABULARY, WORD_WEIGHTS, k=6)),
+                "date": (posted + timedelta(days=rng.randrange(1, 30))).isoformat(),
+            })
+        city, state = rng.choice(locations).split(", ")
+        yield {
+            "id": str(n),
+            "title": " ".join(rng.choices(VOCABULARY, WORD_WEIGHTS, k=4)).title(),
+            "description": " ".join(rng.choices(VOCABULARY, WORD_WEIGHTS, k=rng.randint(15, 40))),
+            "category": category,
+            "condition": rng.choice(CONDITIONS),
+            "seller": f"seller{rng.randrange(sellers)}",
+            "seller_rating": round(rng.uniform(3.0, 5.0), 1),
+            "location": f"{city.title()}, {state.upper()}",
+            "posted_date": posted.isoformat(),
+            "images": [f"img{n}_{i}.jpg" for i in range(rng.randint(0, 4))],
+            "offers": offers,
+            "asking_price": asking_price,
+            "status": "active",
+        }
+
+
+def catalog_file(size: int, seed: int, data_dir: str) -> str:
+    """Path of the JSONL catalog for a size, generated on first use and then reused."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"catalog-{size}-{seed}.jsonl")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            for item in synthetic_listings(size, seed):
+                f.write(json.dumps(item))
+                f.write("\n")
+        os.replace(partial, path)
+    return path
+
+
+def random_call(rng: random.Random, size: int) -> Tuple[str, Dict[str, Any]]:
+    """Pick a tool and arguments the way a buyer's agent might."""
+    tool = rng.choices(list(WORKLOAD), list(WORKLOAD.values()))[0]
+    if tool == "get_item_details":
+        return tool, {"item_id": str(rng.randint(1, size))}
+    if tool == "search_items":
+        args: Dict[str, Any] = {"query": " ".join(rng.choices(VOCABULARY, WORD_WEIGHTS, k=rng.randint(1, 2)))}
+        if rng.random() < 0.3:
+            args["category"] = rng.choice(list(CATEGORIES))
+        if rng.random() < 0.3:
+            args["max_price"] = rng.choice([25, 50, 100, 250, 500])
+        if rng.random() < 0.2:
+            args["limit"] = 10
+        return tool, args
+    return tool, {}
+
+
+def is_error(text: str) -> bool:
+    return text.startswith("Error") or text.startswith('{"error"')
+
+
+class Recorder:
+    """Collects per-tool latencies and error counts."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {tool: [] for tool in WORKLOAD}
+        self.errors: Dict[str, int] = {tool: 0 for tool in WORKLOAD}
+        self.response_bytes = 0
+
+    def record(self, tool: str, seconds: float, text: str) -> None:
+        self.latencies[tool].append(seconds)
+        self.response_bytes += len(text)
+        if is_error(text):
+            self.errors[tool] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        tools = {tool: summarize(latencies, self.errors[tool], elapsed) for tool, latencies in self.latencies.items()}
+        everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        overall = summarize(everything, sum(self.errors.values()), elapsed)
+        overall["response_bytes"] = self.response_bytes
+        return {"overall": overall, "tools": tools}
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    to_ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": to_ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": to_ms(percentile(ordered, 0.50)),
+        "p99_ms": to_ms(percentile(ordered, 0.99)),
+        "max_ms": to_ms(ordered[-1]) if ordered else None,
+    }
+
+
+async def drive(call, size: int, clients: int, duration: float, warmup: float, seed: int) -> Dict[str, Any]:
+    """Run clients concurrent loops of call(tool, args) -> text and report their latencies.
+
+    Calls made during the warm-up period are not recorded.
+    """
+    recorder = Recorder()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def client(number: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        while True:
+            tool, args = random_call(rng, size)
+            began = time.perf_counter()
+            if began >= deadline:
+                return
+            text = await call(number, tool, args)
+            if began >= measure_from:
+                recorder.record(tool, time.perf_counter() - began, text)
+
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return recorder.report(time.perf_counter() - measure_from)
+
+
+def peak_rss_kb() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def process_peak_rss_kb(pid: int) -> Optional[int]:
+    """High-water RSS of another process, where /proc exposes it."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_inprocess(args: argparse.Namespace) -> Dict[str, Any]:
+    """Child process: load the seeded server module and call its tools directly."""
+    began = time.perf_counter()
+    import server
+    load_seconds = time.perf_counter() - began
+    tools = {name: getattr(server, name) for name in WORKLOAD}
+
+    async def call(client: int, tool: str, tool_args: Dict[str, Any]) -> str:
+        return await tools[tool](**tool_args)
+
+    result = asyncio.run(drive(call, args.size, args.clients, args.duration, args.warmup, args.seed))
+    result.update(load_seconds=round(load_seconds, 3), peak_rss_kb=peak_rss_kb(), catalog_items=len(server.CATALOG))
+    return result
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Child process: serve the seeded app from create_starlette_app over SSE."""
+    import uvicorn
+    import server
+    # Per-request INFO logging would cost more than many of the requests
+    logging.getLogger().setLevel(logging.WARNING)
+    app = server.create_starlette_app(server.mcp._mcp_server)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(url: str, process: subprocess.Popen, timeout: float, interval: float = 0.2) -> float:
+    import httpx
+    began = time.perf_counter()
+    while time.perf_counter() - began < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode} before it was ready")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - began
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def time_startup(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    """Start a server process and time its first response, polling every few milliseconds."""
+    import httpx
+    port = free_port()
+    began = time.perf_counter()
+    process = subprocess.Popen([sys.executable, __file__, "_serve", "--port", str(port)], env=env)
+    try:
+        wait_for_server(f"http://127.0.0.1:{port}/", process, args.startup_timeout, interval=0.005)
+        first_response = time.perf_counter() - began
+        server_report = httpx.get(f"http://127.0.0.1:{port}/stats/startup", timeout=10).json()
+        # Wait for a background restore too, so its time shows in the report
+        restore_began = time.perf_counter()
+        while "catalog_built" not in server_report["seconds"] and time.perf_counter() - restore_began < args.startup_timeout:
+            time.sleep(0.05)
+            server_report = httpx.get(f"http://127.0.0.1:{port}/stats/startup", timeout=10).json()
+        return {"first_response_seconds": round(first_response, 3), "peak_rss_kb": process_peak_rss_kb(process.pid),
+                "server": server_report}
+    finally:
+        stop(process)
+
+
+def run_startup(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    """Time a cold start, which builds the catalog from the store, against one from an index snapshot."""
+    cold = time_startup(args, env)
+    snapshot_dir = os.path.join(args.data_dir, f"snapshot-{args.size}-{args.seed}-{args.store}")
+    began = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+                    "snapshot", snapshot_dir], env=env, check=True, stdout=subprocess.DEVNULL)
+    snapshot_seconds = time.perf_counter() - began
+    restored = time_startup(args, dict(env, MARKETPLACE_INDEX_SNAPSHOT=snapshot_dir))
+    return {"cold": cold, "snapshot": restored, "snapshot_write_seconds": round(snapshot_seconds, 3)}
+
+
+def run_sse(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    """Start a server process and drive it through /sse and /messages/ with one session per client."""
+    from mcp import ClientSession
+    from mcp.client.sse import sse_client
+
+    port = free_port()
+    process = subprocess.Popen([sys.executable, __file__, "_serve", "--port", str(port)], env=env)
+    try:
+        load_seconds = wait_for_server(f"http://127.0.0.1:{port}/", process, args.startup_timeout)
+
+        async def run() -> Dict[str, Any]:
+            sessions: List[ClientSession] = []
+            async with contextlib.AsyncExitStack() as stack:
+                for _ in range(args.clients):
+                    read, write = await stack.enter_async_context(sse_client(f"http://127.0.0.1:{port}/sse"))
+                    session = await stack.enter_async_context(ClientSession(read, write))
+                    await session.initialize()
+                    sessions.append(session)
+
+                async def call(client: int, tool: str, tool_args: Dict[str, Any]) -> str:
+                    result = await sessions[client].call_tool(tool, tool_args)
+                    text = "".join(getattr(content, "text", "") for content in result.content)
+                    return "Error: " + text if result.isError else text
+
+                return await drive(call, args.size, args.clients, args.duration, args.warmup, args.seed)
+
+        # Client CPU time shows when the load generator, not the server, is the bottleneck
+        cpu_before = time.process_time()
+        result = asyncio.run(run())
+        result.update(load_seconds=round(load_seconds, 3), peak_rss_kb=process_peak_rss_kb(process.pid),
+                      client_cpu_seconds=round(time.process_time() - cpu_before, 3))
+        return result
+    finally:
+        stop(process)
+
+
+def child_env(args: argparse.Namespace, seed_file: str, data_dir: str) -> Dict[str, str]:
+    env = dict(os.environ, MARKETPLACE_SEED=seed_file, MARKETPLACE_STORE=args.store)
+    if args.store == "sqlite":
+        # A fresh database each run, so the seed file is what gets loaded
+        db = os.path.join(data_dir, f"bench-{os.getpid()}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db + suffix):
+                os.remove(db + suffix)
+        env["MARKETPLACE_DB"] = db
+    return env
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the marketplace MCP tools")
+    parser.add_argument("command", nargs="?", default="run", choices=("run", "_inprocess", "_serve"),
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated catalog sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--modes", default="inprocess,sse", help="comma-separated: inprocess, sse, startup")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent simulated clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each run")
+    parser.add_argument("--store", default="columnar", choices=("columnar", "memory", "sqlite"))
+    parser.add_argument("--seed", type=int, default=0, help="random seed for catalogs and traffic")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "marketplace-bench"),
+                        help="where generated catalogs are cached")
+    parser.add_argument("--startup-timeout", type=float, default=900.0, help="seconds to wait for a server to load")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == "_inprocess":
+        print(json.dumps(run_inprocess(args)))
+        return
+    if args.command == "_serve":
+        serve(args)
+        return
+
+    runs = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        seed_file = catalog_file(size, args.seed, args.data_dir)
+        for mode in args.modes.split(","):
+            print(f"Benchmarking {size} listings ({mode}, {args.clients} clients)...", file=sys.stderr)
+            env = child_env(args, seed_file, args.data_dir)
+            args.size = size
+            if mode == "inprocess":
+                child = subprocess.run(
+                    [sys.executable, __file__, "_inprocess", "--size", str(size), "--clients", str(args.clients),
+                     "--duration", str(args.duration), "--warmup", str(args.warmup), "--seed", str(args.seed)],
+                    env=env, capture_output=True, text=True,
+                )
+                if child.returncode != 0:
+                    raise SystemExit(f"In-process run failed:\n{child.stderr}")
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+            elif mode == "sse":
+                result = run_sse(args, env)
+            elif mode == "startup":
+                result = run_startup(args, env)
+            else:
+                raise SystemExit(f"Unknown mode '{mode}' (expected 'inprocess', 'sse' or 'startup')")
+            runs.append({"size": size, "mode": mode, **result})
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {"clients": args.clients, "duration": args.duration, "warmup": args.warmup,
+                   "store": args.store, "seed": args.seed, "workload": WORKLOAD},
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+from collections import OrderedDict
+from email.utils import formatdate
+import asyncio
+import gzip
+import hashlib
+import sys
+import threading
+import time
+
+# Brotli compresses HTML noticeably better than gzip; offer it when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class FragmentCache:
+    """LRU cache of rendered per-listing fragments, bounded by memory.
+
+    Entries are keyed by (kind, item_id) and tagged with the listing version
+    they were rendered from, so a lookup with a newer version is a miss.
+    Catalog change notifications drop a listing's entries eagerly so their
+    memory is freed. Entries older than ``ttl`` seconds, if set, also miss.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        # (kind, item_id) -> (version, fragment, rendered_at, size)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, str, float, int]]" = OrderedDict()
+        self._kinds: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, kind: str, item_id: str, version: int) -> Optional[str]:
+        key = (kind, item_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and (
+                self.ttl is None or time.monotonic() - entry[2] < self.ttl
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, kind: str, item_id: str, version: int, fragment: str) -> None:
+        size = sys.getsizeof(fragment)
+        if size > self.max_bytes:
+            return
+        key = (kind, item_id)
+        with self._lock:
+            self._kinds.add(kind)
+            self._discard(key)
+            self._entries[key] = (version, fragment, time.monotonic(), size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, _, _, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def render(self, kind: str, item_id: str, version: Optional[int], render: Callable[[], str]) -> str:
+        """Return the cached fragment, or call render() and cache its result.
+
+        version must have been read before the listing was loaded. Listings
+        without a version (not in the catalog) are rendered uncached.
+        """
+        if version is None:
+            return render()
+        fragment = self.get(kind, item_id, version)
+        if fragment is None:
+            fragment = render()
+            self.put(kind, item_id, version, fragment)
+        return fragment
+
+    def invalidate(self, item_id: str) -> None:
+        """Drop every fragment rendered for a listing."""
+        with self._lock:
+            for kind in self._kinds:
+                self._discard((kind, item_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[3]
+
+
+class QueryCache:
+    """Bounded LRU cache of whole query results, invalidated by catalog generation.
+
+    Each result is stored with the catalog generation it was computed at and
+    only served while the catalog is still at that generation, so any
+    listing or offer change invalidates every cached result at once.
+    Concurrent misses for the same key share one computation instead of each
+    running their own.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # key -> (generation, result)
+        self._entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[Hashable, int], "asyncio.Future[Any]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_compute(self, key: Hashable, generation: int, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result for key, or await compute() once for all callers.
+
+        generation must have been read before compute() starts reading the
+        catalog. Exceptions from compute() reach every waiting caller and are
+        not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        flight_key = (key, generation)
+        task = self._in_flight.get(flight_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._in_flight[flight_key] = task
+            task.add_done_callback(lambda done: self._finish(key, generation, done))
+        # Shielded so one caller giving up does not cancel the shared computation
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, generation: int, task: "asyncio.Future[Any]") -> None:
+        self._in_flight.pop((key, generation), None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > generation:
+            return
+        self._entries[key] = (generation, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+class EncodedPage:
+    """A rendered page as UTF-8 bytes plus its compressed encodings and validators."""
+
+    def __init__(self, generation: int, text: str) -> None:
+        self.generation = generation
+        body = text.encode("utf-8")
+        # encoding -> bytes, in order of preference
+        self.bodies: Dict[str, bytes] = {}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body)
+        self.bodies["gzip"] = gzip.compress(body, mtime=0)
+        self.bodies["identity"] = body
+        # Weak, so one tag covers every encoding of the same content
+        self.etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.rendered_at = time.time()
+        self.last_modified = formatdate(self.rendered_at, usegmt=True)
+
+
+class PageCache:
+    """A page rendered at most once per catalog generation.
+
+    Holds the encoded page for the latest generation seen; a lookup at a
+    different generation renders and encodes it again. The ETag hashes the
+    content, so it survives restarts and generations that change nothing
+    the page shows.
+    """
+
+    def __init__(self, render: Callable[[], str]) -> None:
+        self.render = render
+        self.renders = 0
+        self._page: Optional[EncodedPage] = None
+
+    def get(self, generation: int) -> EncodedPage:
+        """generation must be read before the page renders, so a concurrent change forces a re-render."""
+        page = self._page
+        if page is None or page.generation != generation:
+            page = EncodedPage(generation, self.render())
+            if self._page is not None and self._page.etag == page.etag:
+                # Same content: keep the validators clients already hold
+                page.rendered_at, page.last_modified = self._page.rendered_at, self._page.last_modified
+            self._page = page
+            self.renders += 1
+        return page
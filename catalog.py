@@ -0,0 +1,1040 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from bisect import bisect_left, bisect_right
+from datetime import date
+import base64
+import heapq
+import json
+import logging
+import math
+import sys
+import threading
+
+from analytics import OfferAnalytics
+from geo import GeoIndex, Point, distance_km, geocode
+from storage import MemoryStore, Store, WriteOp, offer_rank
+
+logger = logging.getLogger(__name__)
+
+# Title hits count for more than description hits when ranking
+TITLE_WEIGHT = 2
+
+# BM25 term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# What each listing signal adds to a relevance score, in BM25 points: seller
+# rating (scaled to 0-1), recency (1 when posted today, halving every
+# RECENCY_HALF_LIFE_DAYS) and offer heat (highest offer over asking, capped at 1)
+RATING_WEIGHT = 1.0
+RECENCY_WEIGHT = 1.0
+HEAT_WEIGHT = 1.5
+RECENCY_HALF_LIFE_DAYS = 30
+
+# Relevance scores are scaled by this and rounded, as integral sort keys require
+SCORE_SCALE = 1_000_000
+
+# Result orders search_keys() supports: relevance ranks text matches by BM25
+# plus listing signals, nearby listings nearest first and anything else by
+# listing signals alone; listed keeps catalog order
+SEARCH_SORTS = ("relevance", "listed")
+
+# A listing's precomputed ranking signals: (seller rating 0-1, date.toordinal()
+# of posted_date or 0 if it has none, offer heat 0-1)
+Signals = Tuple[float, int, float]
+
+# Position of a listing in a result list; results are ordered by ascending key
+SortKey = Tuple[int, ...]
+
+# (query, category, max_price, near point, radius_km), as search_keys() takes them
+SearchFilters = Tuple[str, str, float, Optional[Point], float]
+
+# What a committed write did to a listing, as passed to change listeners:
+# ("put", item, previous asking price, previous status), both None if the
+# listing is new, ("offer", item_id, offer) or ("remove", item_id)
+Change = Tuple[Any, ...]
+
+
+class WriteConflict(Exception):
+    """A conditional put found its listing changed since the version it was derived from."""
+
+
+def encode_cursor(key: SortKey) -> str:
+    """Opaque pagination cursor pointing just past the result with this key."""
+    return base64.urlsafe_b64encode(json.dumps(list(key), separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError(f"Invalid cursor '{cursor}'") from None
+    if not isinstance(key, list) or not key or not all(isinstance(part, int) for part in key):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return tuple(key)
+
+
+def copy_listing(item: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Copy a listing deep enough that later offers on it do not show up in the copy."""
+    return dict(item, offers=list(item["offers"])) if item is not None else None
+
+
+def listing_signals(item: Dict[str, Any]) -> Signals:
+    """The query-independent parts of a listing's relevance score."""
+    price = item["asking_price"]
+    best = max((offer["amount"] for offer in item["offers"]), default=0)
+    try:
+        posted = date.fromisoformat(item.get("posted_date") or "").toordinal()
+    except ValueError:
+        posted = 0
+    return (
+        min(max((item.get("seller_rating") or 0) / 5, 0.0), 1.0),
+        posted,
+        min(best / price, 1.0) if price > 0 else 0.0,
+    )
+
+
+def static_score(signals: Signals, today: int) -> float:
+    """Relevance a listing earns from its signals alone, as of the day with ordinal today."""
+    rating, posted, heat = signals
+    recency = 0.5 ** (max(today - posted, 0) / RECENCY_HALF_LIFE_DAYS) if posted else 0.0
+    return RATING_WEIGHT * rating + RECENCY_WEIGHT * recency + HEAT_WEIGHT * heat
+
+
+def bm25_scores(
+    frequencies: Dict[Any, int], lengths: Any, matching: int, documents: int, average_length: float,
+) -> Dict[Any, float]:
+    """BM25 score of one query term per listing, from its weighted frequency there and lengths[key].
+
+    matching is how many of all documents listings contain the term, and
+    average_length their mean length.
+    """
+    idf = math.log(1 + (documents - matching + 0.5) / (matching + 0.5))
+    saturation = BM25_K1 + 1
+    base = BM25_K1 * (1 - BM25_B) if average_length else BM25_K1
+    per_length = BM25_K1 * BM25_B / average_length if average_length else 0.0
+    return {
+        key: idf * frequency * saturation / (frequency + base + per_length * lengths[key])
+        for key, frequency in frequencies.items()
+    }
+
+
+def relevance_key(score: float, seq: int) -> SortKey:
+    return (-round(score * SCORE_SCALE), seq)
+
+
+def check_sort(sort: str) -> None:
+    if sort not in SEARCH_SORTS:
+        raise ValueError(f"Unknown sort '{sort}' (expected 'relevance' or 'listed')")
+
+
+def page_keys(
+    matches: List[Tuple[SortKey, str]], after: Optional[SortKey], limit: int,
+) -> Tuple[List[Tuple[SortKey, str]], int]:
+    """The first limit matches after the cursor key, in result order, and how many matches precede them.
+
+    matches may be in any order; a heap picks the page, so only the page is sorted.
+    """
+    if after is not None:
+        following = [match for match in matches if match[0] > after]
+        return heapq.nsmallest(limit, following), len(matches) - len(following)
+    return heapq.nsmallest(limit, matches), 0
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercased, whitespace-delimited tokens.
+
+    Tokens keep their punctuation so that any whitespace-free query which is a
+    substring of the text is also a substring of exactly one token.
+    """
+    return text.lower().split()
+
+
+def query_terms(query: str) -> List[Tuple[str, bool]]:
+    """(term, is_prefix) for each query term.
+
+    A trailing ``*`` makes a term match word prefixes only when the query
+    has several terms; a single-term query is always a plain substring
+    match, so "c++*" finds exactly what it did before terms were split.
+    A blank or whitespace-only query has no terms and filters nothing.
+    """
+    terms = tokenize(query)
+    if len(terms) == 1:
+        return [(terms[0], False)]
+    return [(term[:-1], True) if term.endswith("*") and len(term) > 1 else (term, False) for term in terms]
+
+
+def matches_filters(
+    item: Dict[str, Any], query: str = "", category: str = "", max_price: float = 0,
+    near: Optional[Point] = None, radius_km: float = 0, tokens: Optional[List[str]] = None,
+) -> bool:
+    """Whether one listing passes search filters, matching as Catalog.search_keys() does.
+
+    tokens, if given, are the listing's title and description tokens, for
+    callers that check one listing against many filters.
+    """
+    if category and item["category"].lower() != category.lower():
+        return False
+    if max_price > 0 and item["asking_price"] > max_price:
+        return False
+    if near is not None:
+        point = geocode(item["location"])
+        if point is None or distance_km(near, point) > radius_km:
+            return False
+    if tokens is None:
+        tokens = tokenize(item["title"]) + tokenize(item["description"])
+    for term, prefix in query_terms(query):
+        if prefix:
+            if not any(token.startswith(term) for token in tokens):
+                return False
+        elif not any(term in token for token in tokens):
+            return False
+    return True
+
+
+class TextIndex:
+    """Inverted index over listing titles and descriptions.
+
+    Every indexed token is stored together with all of its suffixes in a sorted
+    array, so both substring ("phone" -> "iphone") and prefix ("iph*") lookups
+    are a bisect plus a scan over the matching range only.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[str, int]] = {}  # token -> {item_id: weight}
+        self._doc_tokens: Dict[str, Dict[str, int]] = {}  # item_id -> {token: weight}
+        self._lengths: Dict[str, int] = {}  # item_id -> sum of its token weights
+        self.length = 0  # sum of every listing's length, for BM25's average
+        self._suffix_tokens: Dict[str, Set[str]] = {}  # suffix -> tokens ending with it
+        self._suffixes: List[str] = []  # sorted lazily, may hold stale entries
+        self._dirty = False
+        self._stale = 0
+
+    def add(self, item_id: str, title: str, description: str) -> None:
+        """Index a listing, replacing any previous entry for the same ID."""
+        if item_id in self._doc_tokens:
+            self.remove(item_id)
+
+        weights: Dict[str, int] = {}
+        for token in tokenize(title):
+            weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(description):
+            weights[token] = weights.get(token, 0) + 1
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._add_suffixes(token)
+            postings[item_id] = weight
+        self._doc_tokens[item_id] = weights
+        self._lengths[item_id] = sum(weights.values())
+        self.length += self._lengths[item_id]
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def remove(self, item_id: str) -> None:
+        """Drop a listing from the index. Unknown IDs are ignored."""
+        weights = self._doc_tokens.pop(item_id, None)
+        if weights is None:
+            return
+        self.length -= self._lengths.pop(item_id)
+        for token in weights:
+            postings = self._postings[token]
+            del postings[item_id]
+            if not postings:
+                del self._postings[token]
+                self._remove_suffixes(token)
+
+    def search(self, query: str) -> Dict[str, float]:
+        """Return {item_id: BM25 score} for listings matching every query term.
+
+        A term matches when it is a substring of a title or description token;
+        a prefix term (see query_terms()) only tokens starting with it. Its
+        frequency in a listing is the weight of every token it matches there.
+        """
+        documents = len(self._doc_tokens)
+        average_length = self.length / documents if documents else 0
+        scores: Optional[Dict[str, float]] = None
+        for term, prefix in query_terms(query):
+            if prefix:
+                tokens = self._tokens_with_prefix(term)
+            else:
+                tokens = self._tokens_containing(term)
+
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                for item_id, weight in self._postings[token].items():
+                    frequencies[item_id] = frequencies.get(item_id, 0) + weight
+            term_scores = bm25_scores(frequencies, self._lengths, len(frequencies), documents, average_length)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                # AND semantics: keep only listings matching every term so far
+                if len(term_scores) < len(scores):
+                    scores, term_scores = term_scores, scores
+                scores = {
+                    item_id: score + term_scores[item_id]
+                    for item_id, score in scores.items()
+                    if item_id in term_scores
+                }
+            if not scores:
+                return {}
+        return scores or {}
+
+    def _add_suffixes(self, token: str) -> None:
+        for i in range(len(token)):
+            suffix = token[i:]
+            owners = self._suffix_tokens.get(suffix)
+            if owners is None:
+                self._suffix_tokens[suffix] = {token}
+                self._suffixes.append(suffix)
+                self._dirty = True
+            else:
+                owners.add(token)
+
+    def _remove_suffixes(self, token: str) -> None:
+        for i in range(len(token)):
+            suffix = token[i:]
+            owners = self._suffix_tokens[suffix]
+            owners.discard(token)
+            if not owners:
+                # Leave the sorted entry in place; lookups skip it until compaction
+                del self._suffix_tokens[suffix]
+                self._stale += 1
+
+    def _sorted_suffixes(self) -> List[str]:
+        if self._stale > len(self._suffix_tokens):
+            self._suffixes = list(self._suffix_tokens)
+            self._stale = 0
+            self._dirty = True
+        if self._dirty:
+            # Appends land at the end of an already sorted run, which timsort
+            # merges in near-linear time
+            self._suffixes.sort()
+            self._dirty = False
+        return self._suffixes
+
+    def _suffix_range(self, prefix: str) -> Iterator[str]:
+        suffixes = self._sorted_suffixes()
+        i = bisect_left(suffixes, prefix)
+        while i < len(suffixes) and suffixes[i].startswith(prefix):
+            yield suffixes[i]
+            i += 1
+
+    def _tokens_containing(self, term: str) -> Set[str]:
+        tokens: Set[str] = set()
+        for suffix in self._suffix_range(term):
+            tokens.update(self._suffix_tokens.get(suffix, ()))
+        return tokens
+
+    def _tokens_with_prefix(self, prefix: str) -> Set[str]:
+        # A token is its own longest suffix, so prefix matches are the suffixes
+        # in range that are also whole tokens
+        return {suffix for suffix in self._suffix_range(prefix) if suffix in self._postings}
+
+
+class CategoryIndex:
+    """Hash index from lowercased category name to the IDs of its listings."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, Set[str]] = {}
+
+    def add(self, item_id: str, category: str) -> None:
+        self._ids.setdefault(category.lower(), set()).add(item_id)
+
+    def remove(self, item_id: str, category: str) -> None:
+        key = category.lower()
+        ids = self._ids.get(key)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del self._ids[key]
+
+    def lookup(self, category: str) -> Set[str]:
+        return self._ids.get(category.lower(), set())
+
+
+class PriceIndex:
+    """Listings sorted by asking price, for bisectable range queries."""
+
+    def __init__(self) -> None:
+        self._entries: List[Tuple[float, str]] = []  # (asking_price, item_id), sorted lazily
+        self._dirty = False
+
+    def add(self, item_id: str, price: float) -> None:
+        # Appended unsorted, so indexing a whole catalog costs one sort
+        self._entries.append((price, item_id))
+        self._dirty = True
+
+    def remove(self, item_id: str, price: float) -> None:
+        entries = self._sorted()
+        i = bisect_left(entries, (price, item_id))
+        if i < len(entries) and entries[i] == (price, item_id):
+            del entries[i]
+
+    def count_at_most(self, max_price: float) -> int:
+        """Number of listings priced at or below max_price, in O(log n)."""
+        return bisect_right(self._sorted(), max_price, key=lambda entry: entry[0])
+
+    def at_most(self, max_price: float) -> List[str]:
+        return [item_id for _, item_id in self._sorted()[:self.count_at_most(max_price)]]
+
+    def _sorted(self) -> List[Tuple[float, str]]:
+        if self._dirty:
+            self._entries.sort()
+            self._dirty = False
+        return self._entries
+
+
+class CatalogStats:
+    """Running totals over the catalog, updated on every listing or offer change."""
+
+    def __init__(self) -> None:
+        self.total_items = 0
+        self.total_offers = 0
+        self.asking_sum: float = 0
+        self.offer_sum: float = 0
+        self.category_items: Dict[str, int] = {}
+        self.category_offers: Dict[str, int] = {}
+
+    @classmethod
+    def recompute(cls, items: Iterable[Dict[str, Any]]) -> "CatalogStats":
+        """Build the totals from scratch with a full pass over the listings."""
+        stats = cls()
+        for item in items:
+            stats.add_item(item["category"], item["asking_price"], len(item["offers"]),
+                           sum(offer["amount"] for offer in item["offers"]))
+        return stats
+
+    @classmethod
+    def from_totals(cls, totals: Dict[str, Any]) -> "CatalogStats":
+        """Build from the totals a store computed with Store.aggregate()."""
+        stats = cls()
+        for name, value in totals.items():
+            setattr(stats, name, value)
+        return stats
+
+    def copy(self) -> "CatalogStats":
+        """Independent copy of the totals, which later changes to these do not affect."""
+        stats = CatalogStats()
+        for name, value in vars(self).items():
+            setattr(stats, name, dict(value) if isinstance(value, dict) else value)
+        return stats
+
+    def add_item(self, category: str, price: float, offer_count: int, offer_sum: float) -> None:
+        self.total_items += 1
+        self.asking_sum += price
+        self.category_items[category] = self.category_items.get(category, 0) + 1
+        self.category_offers[category] = self.category_offers.get(category, 0) + offer_count
+        self.total_offers += offer_count
+        self.offer_sum += offer_sum
+
+    def remove_item(self, category: str, price: float, offer_count: int, offer_sum: float) -> None:
+        self.total_items -= 1
+        self.asking_sum -= price
+        self.total_offers -= offer_count
+        self.offer_sum -= offer_sum
+        self.category_items[category] -= 1
+        self.category_offers[category] -= offer_count
+        if not self.category_items[category]:
+            del self.category_items[category]
+            del self.category_offers[category]
+
+    def add_offer(self, category: str, amount: float) -> None:
+        self.total_offers += 1
+        self.offer_sum += amount
+        self.category_offers[category] += 1
+
+    @property
+    def avg_asking(self) -> float:
+        return self.asking_sum / self.total_items if self.total_items else 0
+
+    @property
+    def avg_offer(self) -> float:
+        return self.offer_sum / self.total_offers if self.total_offers else 0
+
+    def drift(self, other: "CatalogStats") -> List[str]:
+        """Names of the counters that differ from another set of totals."""
+        fields = []
+        for name in ("total_items", "total_offers", "category_items", "category_offers"):
+            if getattr(self, name) != getattr(other, name):
+                fields.append(name)
+        for name in ("asking_sum", "offer_sum"):
+            if abs(getattr(self, name) - getattr(other, name)) > 1e-6:
+                fields.append(name)
+        return fields
+
+
+class Catalog:
+    """Marketplace listings together with the indexes used to query them.
+
+    Listing records live in a pluggable ``Store``; the catalog keeps only IDs
+    and the few fields its indexes need in memory. Index reads and writes are
+    serialized by a lock, so searches may run on worker threads.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = (), store: Optional[Store] = None) -> None:
+        self.store = store if store is not None else MemoryStore()
+        self._lock = threading.RLock()
+        # Called with the item_id of every listing that changes or is removed
+        self._listeners: List[Callable[[str], None]] = []
+        # Called with a Change describing each committed listing or offer write
+        self._change_listeners: List[Callable[[Change], None]] = []
+        # Pre-images ({item_id: listing}) kept for each open snapshot()
+        self._snapshots: List[Dict[str, Optional[Dict[str, Any]]]] = []
+        # Listings changed while reindex() is building new indexes
+        self._changed: Optional[Set[str]] = None
+        self._reset(generation=0)
+        # Index whatever a persistent store already holds, then add new items
+        for item in self.store:
+            self._index(item)
+        for item in items:
+            self.add_item(item)
+
+    # Everything _reset() sets up; reindex() swaps these in as one unit
+    _INDEX_STATE = ("_order", "_next_seq", "_indexed", "_last_id", "generation", "_versions",
+                    "stats", "text_index", "category_index", "price_index", "geo_index", "_signals", "_static",
+                    "_static_day", "offer_analytics", "_statuses")
+
+    def _reset(self, generation: int) -> None:
+        self._order: Dict[str, int] = {}
+        self._next_seq = 0
+        # (category, asking_price, offer_count, offer_sum) each listing was
+        # indexed under, so re-indexing a listing that was mutated in place
+        # can still find and back out its old index entries and totals
+        self._indexed: Dict[str, Tuple[str, float, int, float]] = {}
+        # Highest numeric ID handed out or indexed, for new listings
+        self._last_id = 0
+        # Bumped on every listing or offer change; each listing's version is
+        # the generation of its last change, so (id, version) pairs identify
+        # one state of a listing and never repeat
+        self.generation = generation
+        self._versions: Dict[str, int] = {}
+        self.stats = CatalogStats()
+        self.text_index = TextIndex()
+        self.category_index = CategoryIndex()
+        self.price_index = PriceIndex()
+        # Listings whose location geocodes against the bundled city table
+        self.geo_index = GeoIndex()
+        # listing_signals() of every listing, kept current as offers arrive,
+        # and the static_score() they give as of _static_day
+        self._signals: Dict[str, Signals] = {}
+        self._static: Dict[str, float] = {}
+        self._static_day = date.today().toordinal()
+        # Per-category offer rollups by offer date, for offer_report()
+        self.offer_analytics = OfferAnalytics()
+        # Each listing's status, so change listeners can be told what it was
+        self._statuses: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._indexed)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._indexed
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.store)
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Register a callback run, under the catalog lock, after each listing change."""
+        self._listeners.append(callback)
+
+    def add_change_listener(self, callback: Callable[[Change], None]) -> None:
+        """Register a callback run, under the catalog lock, with what each write changed.
+
+        Listings loaded by bulk_load() are indexed without notifying these.
+        """
+        self._change_listeners.append(callback)
+
+    def _notify(self, item_id: str, change: Optional[Change] = None) -> None:
+        for callback in self._listeners:
+            callback(item_id)
+        if change is not None:
+            for change_callback in self._change_listeners:
+                change_callback(change)
+
+    def version(self, item_id: str) -> Optional[int]:
+        """Current version of a listing, or None if it does not exist.
+
+        Read it before loading the record, so anything derived from the record
+        is never tagged with a newer version than the data it was built from.
+        """
+        return self._versions.get(item_id)
+
+    def versions(self, item_ids: Iterable[str]) -> List[Optional[int]]:
+        return [self._versions.get(item_id) for item_id in item_ids]
+
+    def seqs(self, item_ids: Iterable[str]) -> List[Optional[int]]:
+        """Catalog-order sequence numbers, as sort keys and cursors use them; None if absent."""
+        return [self._order.get(item_id) for item_id in item_ids]
+
+    def listing_ids(self) -> List[str]:
+        """IDs of every indexed listing, in catalog order."""
+        with self._lock:
+            return list(self._order)
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a listing by ID via the store's primary key."""
+        if item_id not in self._indexed:
+            return None
+        return self.store.get(item_id)
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        """Look up several listings at once; missing IDs map to None."""
+        return self.store.get_many(item_ids)
+
+    def add_item(self, item: Dict[str, Any]) -> None:
+        """Insert a listing, or replace the existing listing with the same ID."""
+        self.apply_writes([("put", item)])
+
+    def next_id(self) -> str:
+        """Reserve an unused listing ID."""
+        with self._lock:
+            self._last_id += 1
+            while str(self._last_id) in self._order:
+                self._last_id += 1
+            return str(self._last_id)
+
+    def apply_writes(self, ops: List[WriteOp]) -> None:
+        """Commit a batch of ("put", item) and ("offer", item_id, offer) writes.
+
+        The whole batch goes to the store as one write, then the indexes are
+        updated in order. Offers must target a listing that exists or is put
+        earlier in the batch; otherwise KeyError is raised and nothing is written.
+        A ("put", item, version) write is only made if the listing is still at
+        that version, and nothing earlier in the batch touches it; otherwise
+        WriteConflict is raised and nothing is written.
+        """
+        for op in ops:
+            if op[0] == "put":
+                # Offer books are kept best-first so readers never re-sort them
+                op[1]["offers"].sort(key=offer_rank)
+        with self._lock:
+            known: Set[str] = set()
+            for op in ops:
+                if op[0] == "put":
+                    item_id = op[1]["id"]
+                    if len(op) > 2 and (item_id in known or self._versions.get(item_id) != op[2]):
+                        raise WriteConflict(item_id)
+                    known.add(item_id)
+                elif op[1] not in self._indexed and op[1] not in known:
+                    raise KeyError(op[1])
+                else:
+                    known.add(op[1])
+            self._preserve([op[1]["id"] if op[0] == "put" else op[1] for op in ops])
+            self.store.write_batch(ops)
+            for op in ops:
+                if op[0] == "put":
+                    self._index(op[1])
+                else:
+                    self._index_offer(op[1], op[2])
+
+    def _index(self, item: Dict[str, Any]) -> None:
+        item_id = item["id"]
+        previous = self._indexed.get(item_id)
+        previous_status = self._statuses.get(item_id)
+        if item_id in self._order:
+            self._unindex(item_id)
+        else:
+            self._order[item_id] = self._next_seq
+            self._next_seq += 1
+            if item_id.isdigit():
+                self._last_id = max(self._last_id, int(item_id))
+        self._add_to_indexes(item)
+        self._touch(item_id, ("put", item, previous[1] if previous is not None else None, previous_status))
+
+    def _add_to_indexes(self, item: Dict[str, Any]) -> None:
+        item_id = item["id"]
+        self.text_index.add(item_id, item["title"], item["description"])
+        self.category_index.add(item_id, item["category"])
+        self.price_index.add(item_id, item["asking_price"])
+        point = geocode(item["location"])
+        if point is not None:
+            self.geo_index.add(item_id, point)
+        entry = (item["category"], item["asking_price"], len(item["offers"]),
+                 sum(offer["amount"] for offer in item["offers"]))
+        self.stats.add_item(*entry)
+        self._indexed[item_id] = entry
+        self._signals[item_id] = signals = listing_signals(item)
+        self._static[item_id] = static_score(signals, self._static_day)
+        self.offer_analytics.add_listing(item_id, item["category"], item["asking_price"], item["offers"])
+        self._statuses[item_id] = sys.intern(item["status"])
+
+    def _touch(self, item_id: str, change: Change) -> None:
+        self.generation += 1
+        self._versions[item_id] = self.generation
+        if self._changed is not None:
+            self._changed.add(item_id)
+        self._notify(item_id, change)
+
+    @classmethod
+    def restore(
+        cls, entries: Iterable[Tuple[Dict[str, Any], int, int]], generation: int,
+        store: Optional[Store] = None, batch_size: int = 1000,
+    ) -> "Catalog":
+        """Rebuild a catalog from (record, seq, version) entries saved in catalog order.
+
+        Listings keep the positions and versions they were saved with, so
+        cursors and version-tagged caches from before the restore stay valid.
+        An empty store is filled from the entries; a store that already holds
+        listings must hold exactly these, and is not read.
+        """
+        # Built empty, then given the store, so the constructor does not index it
+        catalog = cls()
+        if store is not None:
+            catalog.store = store
+        fill = len(catalog.store) == 0
+        batch: List[WriteOp] = []
+        for item, seq, version in entries:
+            item_id = item["id"]
+            catalog._order[item_id] = seq
+            catalog._next_seq = seq + 1
+            if item_id.isdigit():
+                catalog._last_id = max(catalog._last_id, int(item_id))
+            catalog._add_to_indexes(item)
+            catalog._versions[item_id] = version
+            if fill:
+                batch.append(("put", item))
+                if len(batch) >= batch_size:
+                    catalog.store.write_batch(batch)
+                    batch = []
+        if batch:
+            catalog.store.write_batch(batch)
+        catalog.generation = generation
+        return catalog
+
+    def bulk_load(self, items: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """Write listings straight to the store, then rebuild the indexes once.
+
+        Listings are written in batches as they are read, so memory stays
+        bounded by batch_size records plus the indexes. They become searchable
+        when the load finishes; if it fails part way, the listings written so
+        far are kept and indexed. Returns the number of listings written.
+        """
+        count = 0
+        batch: List[WriteOp] = []
+        try:
+            try:
+                for item in items:
+                    # Offer books are kept best-first so readers never re-sort them
+                    item["offers"].sort(key=offer_rank)
+                    batch.append(("put", item))
+                    if len(batch) >= batch_size:
+                        ops, batch = batch, []
+                        count += self._write_unindexed(ops)
+            finally:
+                # Listings read before a bad one are kept too
+                if batch:
+                    count += self._write_unindexed(batch)
+        finally:
+            self.reindex()
+        return count
+
+    def _write_unindexed(self, ops: List[WriteOp]) -> int:
+        with self._lock:
+            self._preserve([op[1]["id"] for op in ops])
+            self.store.write_batch(ops)
+        return len(ops)
+
+    def reindex(self) -> None:
+        """Rebuild every index and the running totals with one pass over the store.
+
+        The new indexes are built without holding the lock, so searches keep
+        using the old ones meanwhile. Listings changed during the build are
+        re-indexed from the store before the new indexes are swapped in.
+        """
+        with self._lock:
+            self._changed = set()
+            start_generation = self.generation
+        try:
+            fresh = Catalog.__new__(Catalog)
+            fresh._listeners = []
+            fresh._change_listeners = []
+            fresh._changed = None
+            fresh._reset(generation=start_generation)
+            for item in self.store:
+                fresh._index(item)
+        finally:
+            with self._lock:
+                changed, self._changed = self._changed, None
+        with self._lock:
+            last_id, generation = self._last_id, self.generation
+            for name in self._INDEX_STATE:
+                setattr(self, name, getattr(fresh, name))
+            # Never hand out an ID or a generation twice
+            self._last_id = max(self._last_id, last_id)
+            self.generation = max(self.generation, generation)
+            for item_id in changed:
+                item = self.store.get(item_id)
+                if item is not None:
+                    self._index(item)
+                elif item_id in self._order:
+                    self._unindex(item_id)
+                    del self._order[item_id]
+                    del self._versions[item_id]
+
+    def snapshot(self, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Iterate over every listing as it was when iteration started.
+
+        Writes carry on as usual while the snapshot is read: a listing about
+        to change is copied aside first, so the snapshot costs extra memory
+        only for listings written while it is open.
+        """
+        preimages: Dict[str, Optional[Dict[str, Any]]] = {}
+        with self._lock:
+            item_ids = list(self._order)
+            self._snapshots.append(preimages)
+        try:
+            for start in range(0, len(item_ids), batch_size):
+                batch = item_ids[start:start + batch_size]
+                with self._lock:
+                    stored = iter(self.store.get_many([item_id for item_id in batch if item_id not in preimages]))
+                    items = [preimages.pop(item_id) if item_id in preimages else copy_listing(next(stored))
+                             for item_id in batch]
+                for item in items:
+                    if item is not None:
+                        yield item
+        finally:
+            with self._lock:
+                self._snapshots.remove(preimages)
+
+    def _preserve(self, item_ids: List[str]) -> None:
+        """Copy listings about to change aside for every open snapshot."""
+        for preimages in self._snapshots:
+            # Listings the catalog does not index yet were not in the snapshot
+            missing = [item_id for item_id in item_ids if item_id not in preimages and item_id in self._order]
+            for item_id, item in zip(missing, self.store.get_many(missing)):
+                preimages[item_id] = copy_listing(item)
+
+    def update_item(self, item: Dict[str, Any]) -> None:
+        """Re-index a listing after its fields have changed."""
+        self.add_item(item)
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        """Record a new offer on a listing."""
+        self.apply_writes([("offer", item_id, offer)])
+
+    def _index_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        category, price, offer_count, offer_sum = self._indexed[item_id]
+        self._indexed[item_id] = (category, price, offer_count + 1, offer_sum + offer["amount"])
+        rating, posted, heat = self._signals[item_id]
+        if price > 0:
+            self._signals[item_id] = signals = (rating, posted, max(heat, min(offer["amount"] / price, 1.0)))
+            self._static[item_id] = static_score(signals, self._static_day)
+        self.stats.add_offer(category, offer["amount"])
+        self.offer_analytics.add_offer(item_id, category, price, offer)
+        self._touch(item_id, ("offer", item_id, offer))
+
+    @staticmethod
+    def best_offer(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Highest offer on a listing, read from the head of its offer book."""
+        return item["offers"][0] if item["offers"] else None
+
+    def remove_item(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a listing and return it, or None if it does not exist."""
+        with self._lock:
+            item = self.get(item_id)
+            if item is not None:
+                self._preserve([item_id])
+                self.store.delete(item_id)
+                self._unindex(item_id)
+                del self._order[item_id]
+                del self._versions[item_id]
+                if self._changed is not None:
+                    self._changed.add(item_id)
+                self.generation += 1
+                self._notify(item_id, ("remove", item_id))
+        return item
+
+    def verify_stats(self) -> bool:
+        """Recompute the running totals from scratch and repair any drift.
+
+        Returns True when the maintained counters were already correct.
+        """
+        with self._lock:
+            totals = self.store.aggregate()
+            fresh = CatalogStats.from_totals(totals) if totals is not None else CatalogStats.recompute(self.store)
+            drifted = self.stats.drift(fresh)
+            if drifted:
+                logger.warning("Catalog stats drifted (%s); replacing with recomputed totals", ", ".join(drifted))
+                self.stats = fresh
+        return not drifted
+
+    def offer_report(
+        self, category: str = "", days: int = 30, first: Optional[int] = None, last: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Offer prices and offer-to-asking ratios per category over a window of offer dates.
+
+        See OfferAnalytics.report(); first and last are date ordinals.
+        """
+        with self._lock:
+            return self.offer_analytics.report(category, days, first, last)
+
+    def _unindex(self, item_id: str) -> None:
+        entry = self._indexed.pop(item_id)
+        category, price = entry[0], entry[1]
+        self.stats.remove_item(*entry)
+        self.text_index.remove(item_id)
+        self.category_index.remove(item_id, category)
+        self.price_index.remove(item_id, price)
+        self.geo_index.remove(item_id)
+        del self._signals[item_id]
+        del self._static[item_id]
+        self.offer_analytics.remove_listing(item_id, category, price)
+        del self._statuses[item_id]
+
+    def stats_snapshot(self) -> CatalogStats:
+        """A consistent copy of the running totals, safe to read while writes continue."""
+        with self._lock:
+            return self.stats.copy()
+
+    def text_totals(self) -> Tuple[int, int]:
+        """(listings, summed length) of the text index, which BM25 scores are relative to."""
+        with self._lock:
+            return len(self.text_index), self.text_index.length
+
+    def estimate_matches(self, category: str = "", max_price: float = 0) -> int:
+        """Upper bound on how many listings a search with these filters can touch."""
+        estimate = len(self._indexed)
+        if category:
+            estimate = min(estimate, len(self.category_index.lookup(category)))
+        if max_price > 0:
+            estimate = min(estimate, self.price_index.count_at_most(max_price))
+        return estimate
+
+    def search_keys(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+    ) -> List[Tuple[SortKey, str]]:
+        """Return (sort_key, item_id) for every listing matching the filters, in result order.
+
+        By relevance, text matches are ranked by their BM25 score plus the
+        listing's static score (seller rating, recency, offer heat); without a
+        text query, listings within radius_km of near come back nearest first,
+        and anything else by static score. Listed order is catalog order. The
+        planner drives the query from whichever index yields the fewest
+        candidates and checks the remaining filters against those rows only.
+        No listing records are loaded.
+        """
+        matches = self._match_keys(query, category, max_price, near, radius_km, sort)
+        matches.sort()
+        return matches
+
+    def search_page(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+        after: Optional[SortKey] = None, limit: int = 50,
+    ) -> Tuple[List[Tuple[SortKey, str]], int, int]:
+        """One page of search_keys(): (the first limit keys after the cursor key, how many precede them, total)."""
+        matches = self._match_keys(query, category, max_price, near, radius_km, sort)
+        page, start = page_keys(matches, after, limit)
+        return page, start, len(matches)
+
+    def _match_keys(
+        self, query: str, category: str, max_price: float, near: Optional[Point], radius_km: float, sort: str,
+    ) -> List[Tuple[SortKey, str]]:
+        """search_keys() in no particular order."""
+        check_sort(sort)
+        with self._lock:
+            # (estimated size, candidate ID fetcher) for each active filter
+            plans: List[Tuple[int, Callable[[], Iterable[str]]]] = []
+            if category:
+                category_ids = self.category_index.lookup(category)
+                plans.append((len(category_ids), lambda: category_ids))
+            if max_price > 0:
+                price_count = self.price_index.count_at_most(max_price)
+                plans.append((price_count, lambda: self.price_index.at_most(max_price)))
+            scores = self.text_index.search(query) if query.strip() else None
+            if scores is not None:
+                plans.append((len(scores), lambda: scores))
+            distances = self.geo_index.within(near, radius_km) if near is not None else None
+            if distances is not None:
+                plans.append((len(distances), lambda: distances))
+
+            if not plans:
+                if sort == "listed":
+                    return [((seq,), item_id) for item_id, seq in self._order.items()]
+                static = self._static_scores()
+                return [((-round(static[item_id] * SCORE_SCALE), seq), item_id) for item_id, seq in self._order.items()]
+            return self._plan_matches(plans, scores, category, max_price, distances, sort)
+
+    @staticmethod
+    def cursor_position(keys: List[Tuple[SortKey, str]], after: Optional[SortKey]) -> int:
+        """Index of the first result that follows the cursor key."""
+        return bisect_right(keys, after, key=lambda entry: entry[0]) if after is not None else 0
+
+    def iter_results(
+        self, keys: List[Tuple[SortKey, str]], start: int = 0, stop: Optional[int] = None, batch_size: int = 100
+    ) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        """Load (version, record) pairs for keys[start:stop] in batches.
+
+        Only one batch of records is held at a time, so callers that format
+        and emit each batch keep memory bounded by the batch size.
+        """
+        stop = len(keys) if stop is None else min(stop, len(keys))
+        for batch_start in range(start, stop, batch_size):
+            batch = keys[batch_start:min(batch_start + batch_size, stop)]
+            item_ids = [item_id for _, item_id in batch]
+            versions = self.versions(item_ids)
+            # Records are loaded outside the lock so slow store reads don't block writers
+            items = self.store.get_many(item_ids)
+            yield [(version, item) for version, item in zip(versions, items) if item is not None]
+
+    def search(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+    ) -> List[Dict[str, Any]]:
+        """Return every listing matching the filters, in result order."""
+        keys = self.search_keys(query, category=category, max_price=max_price, near=near, radius_km=radius_km,
+                                sort=sort)
+        return [item for batch in self.iter_results(keys) for _, item in batch]
+
+    def _plan_matches(
+        self,
+        plans: List[Tuple[int, Callable[[], Iterable[str]]]],
+        scores: Optional[Dict[str, float]],
+        category: str,
+        max_price: float,
+        distances: Optional[Dict[str, float]] = None,
+        sort: str = "relevance",
+    ) -> List[Tuple[SortKey, str]]:
+        size, fetch = min(plans, key=lambda plan: plan[0])
+        if size == 0:
+            return []
+
+        category_key = category.lower()
+        static = self._static_scores()
+        matches = []
+        for item_id in fetch():
+            # Residual filters use the indexed fields, so no record is loaded
+            # until a listing is known to match
+            item_category, item_price = self._indexed[item_id][:2]
+            if category and item_category.lower() != category_key:
+                continue
+            if max_price > 0 and item_price > max_price:
+                continue
+            if distances is not None and item_id not in distances:
+                continue
+            if scores is not None and item_id not in scores:
+                continue
+            if sort == "listed":
+                matches.append(((self._order[item_id],), item_id))
+            elif scores is not None:
+                matches.append((relevance_key(scores[item_id] + static[item_id], self._order[item_id]), item_id))
+            elif distances is not None:
+                # Whole metres keep sort keys integral, as cursors require
+                matches.append(((round(distances[item_id] * 1000), self._order[item_id]), item_id))
+            else:
+                matches.append((relevance_key(static[item_id], self._order[item_id]), item_id))
+        return matches
+
+    def _static_scores(self) -> Dict[str, float]:
+        """static_score() of every listing as of today; recomputed once a day, as recency decays."""
+        today = date.today().toordinal()
+        if today != self._static_day:
+            self._static_day = today
+            self._static = {item_id: static_score(signals, today) for item_id, signals in self._signals.items()}
+        return self._static
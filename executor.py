@@ -0,0 +1,66 @@
+from typing import Any, Callable, Optional, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+T = TypeVar("T")
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when too many heavy tool calls are already queued."""
+
+
+class ToolExecutor:
+    """Runs expensive tool bodies off the event loop.
+
+    Calls whose estimated cost is below ``cost_threshold`` run inline, since a
+    thread hop costs more than they do. Heavier calls go to a thread pool, at
+    most ``max_concurrent`` at a time; once ``max_pending`` heavy calls are
+    waiting or running, new ones are rejected with ServerBusyError instead of
+    growing the queue, so cheap calls keep flowing during a spike.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        cost_threshold: int = 1000,
+        max_concurrent: int = 4,
+        max_pending: int = 64,
+    ) -> None:
+        self.cost_threshold = cost_threshold
+        self.max_pending = max_pending
+        self._max_workers = max_workers
+        self._max_concurrent = max_concurrent
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Heavy calls currently waiting for or holding a worker slot."""
+        return self._pending
+
+    async def run(self, func: Callable[..., T], *args: Any, cost: int = 0, **kwargs: Any) -> T:
+        """Call func(*args, **kwargs), in the pool if cost reaches the threshold."""
+        if cost < self.cost_threshold:
+            return func(*args, **kwargs)
+
+        if self._pending >= self.max_pending:
+            raise ServerBusyError("Server is busy, please retry shortly")
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tool")
+            self._slots = asyncio.Semaphore(self._max_concurrent)
+
+        self._pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+            self._slots = None
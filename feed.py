@@ -0,0 +1,284 @@
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
+import asyncio
+import itertools
+import logging
+import threading
+
+from catalog import Catalog, Change, SearchFilters, matches_filters, query_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Logger name on the MCP log notifications that carry watch events
+WATCH_LOGGER = "marketplace.watch"
+
+
+class Subscriber:
+    """One client session's watches and the notifications waiting to be sent to it."""
+
+    def __init__(self, session: Any) -> None:
+        self.session = session
+        self.watches: Set[str] = set()
+        self.queue: Deque[Tuple[str, Dict[str, Any]]] = deque()  # (watch_id, event)
+        self.ready = asyncio.Event()
+        # Final notice sent once the subscriber is dropped for falling behind
+        self.dropped: Optional[Dict[str, Any]] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+
+class ChangeFeed:
+    """Pushes new offers, price and status changes to watching sessions as MCP notifications.
+
+    Catalog writes report each change from whatever thread commits them; the
+    feed hands them to the event loop in batches, looks up item watches by
+    ID, and queues one event per matching watch. Search watches are filed
+    under their longest query term, or their category if they have no
+    query, so a changed listing is tokenized once and only checked against
+    the watches filed under one of its substrings or its category. Each session has a single sender task and a queue of at most
+    ``max_queue`` unsent events. A session that lets its queue fill up is
+    dropped: its watches are cancelled and it is sent one final notice, so a
+    slow client never delays writers or other subscribers. The transport
+    calls close_session() when a connection ends, so sessions that go away
+    quietly do not keep their watches.
+    """
+
+    def __init__(self, catalog: Catalog, max_queue: int = 256, max_watches: int = 100) -> None:
+        self.catalog = catalog
+        self.max_queue = max_queue
+        self.max_watches = max_watches
+        self.delivered = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._subscribers: Dict[Any, Subscriber] = {}  # session -> subscriber
+        self._watch_targets: Dict[str, Tuple[Subscriber, str, Any]] = {}  # watch_id -> (subscriber, kind, key)
+        self._item_watches: Dict[str, Dict[str, Subscriber]] = {}  # item_id -> {watch_id: subscriber}
+        # Search watches without a query: lowercased category, or "" for any -> {watch_id: (subscriber, filters)}
+        self._search_watches: Dict[str, Dict[str, Tuple[Subscriber, SearchFilters]]] = {}
+        # Search watches with a query: (longest term, is_prefix) -> {watch_id: (subscriber, filters)}
+        self._term_watches: Dict[Tuple[str, bool], Dict[str, Tuple[Subscriber, SearchFilters]]] = {}
+        # (length, is_prefix) -> how many _term_watches keys have that shape
+        self._term_shapes: Dict[Tuple[int, bool], int] = {}
+        self._pending: List[Change] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        catalog.add_change_listener(self._on_change)
+
+    def watch_item(self, session: Any, item_id: str) -> str:
+        """Watch one listing for new offers, price and status changes. Returns the watch ID."""
+        subscriber, watch_id = self._new_watch(session)
+        self._item_watches.setdefault(item_id, {})[watch_id] = subscriber
+        self._watch_targets[watch_id] = (subscriber, "item", item_id)
+        return watch_id
+
+    def watch_search(self, session: Any, filters: SearchFilters) -> str:
+        """Watch a search for new matching listings, and new offers, price and status changes on matches."""
+        subscriber, watch_id = self._new_watch(session)
+        terms = query_terms(filters[0])
+        if terms:
+            # Any match contains every term, so filing under the rarest-looking one is enough
+            anchor = max(terms, key=lambda term: len(term[0]))
+            if anchor not in self._term_watches:
+                shape = (len(anchor[0]), anchor[1])
+                self._term_shapes[shape] = self._term_shapes.get(shape, 0) + 1
+            self._term_watches.setdefault(anchor, {})[watch_id] = (subscriber, filters)
+            self._watch_targets[watch_id] = (subscriber, "term", anchor)
+        else:
+            bucket = filters[1].lower()
+            self._search_watches.setdefault(bucket, {})[watch_id] = (subscriber, filters)
+            self._watch_targets[watch_id] = (subscriber, "search", bucket)
+        return watch_id
+
+    def unwatch(self, session: Any, watch_id: str) -> bool:
+        """Cancel a watch the session holds. Returns False if it holds no such watch."""
+        target = self._watch_targets.get(watch_id)
+        if target is None or target[0].session is not session:
+            return False
+        self._remove_watch(watch_id)
+        return True
+
+    def close_session(self, session: Any) -> None:
+        """Forget every watch of a session whose connection has closed."""
+        subscriber = self._subscribers.get(session)
+        if subscriber is None:
+            return
+        self._drop(subscriber, "session closed")
+        # Nobody is left to send the final notice to
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+
+    def _new_watch(self, session: Any) -> Tuple[Subscriber, str]:
+        subscriber = self._subscribers.get(session)
+        if subscriber is None:
+            self._loop = asyncio.get_running_loop()
+            subscriber = self._subscribers[session] = Subscriber(session)
+            subscriber.task = asyncio.create_task(self._deliver(subscriber))
+        if len(subscriber.watches) >= self.max_watches:
+            raise ValueError(f"A session may hold at most {self.max_watches} watches")
+        watch_id = f"w{next(self._ids)}"
+        subscriber.watches.add(watch_id)
+        return subscriber, watch_id
+
+    def _remove_watch(self, watch_id: str) -> None:
+        subscriber, kind, key = self._watch_targets.pop(watch_id)
+        subscriber.watches.discard(watch_id)
+        table: Dict[Any, Dict[str, Any]] = {
+            "item": self._item_watches, "search": self._search_watches, "term": self._term_watches,
+        }[kind]
+        del table[key][watch_id]
+        if table[key]:
+            return
+        del table[key]
+        if kind == "term":
+            shape = (len(key[0]), key[1])
+            self._term_shapes[shape] -= 1
+            if not self._term_shapes[shape]:
+                del self._term_shapes[shape]
+
+    def _on_change(self, change: Change) -> None:
+        # Runs on the writer's thread under the catalog lock, so only queue it
+        if not self._watch_targets:
+            return
+        with self._lock:
+            self._pending.append(change)
+            if len(self._pending) > 1:
+                return  # a drain is already scheduled
+        try:
+            self._loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # The loop has shut down and its sessions with it; drop the queue so
+            # that a later loop's first change schedules a drain again
+            with self._lock:
+                self._pending.clear()
+
+    def _drain(self) -> None:
+        with self._lock:
+            changes, self._pending = self._pending, []
+        searching = bool(self._search_watches or self._term_watches)
+        # Offers carry no listing; load the ones search watches need to match against
+        offer_ids = [change[1] for change in changes if change[0] == "offer"] if searching else []
+        listings = dict(zip(offer_ids, self.catalog.get_many(offer_ids))) if offer_ids else {}
+        # item_id -> (listing, its tokens, candidate search watches), so each listing is tokenized once
+        matched: Dict[str, Tuple[Dict[str, Any], List[str], List[Tuple[str, Tuple[Subscriber, SearchFilters]]]]] = {}
+
+        for change in changes:
+            if change[0] == "put":
+                item, previous = change[1], change[2]
+                item_id = item["id"]
+                if previous is None:
+                    event = {"event": "new_listing", "item_id": item_id, "title": item["title"],
+                             "asking_price": item["asking_price"]}
+                elif previous != item["asking_price"]:
+                    event = {"event": "price_change", "item_id": item_id, "title": item["title"],
+                             "old_price": previous, "asking_price": item["asking_price"]}
+                elif change[3] != item["status"]:
+                    event = {"event": "status_change", "item_id": item_id, "title": item["title"],
+                             "old_status": change[3], "status": item["status"]}
+                else:
+                    continue
+            elif change[0] == "offer":
+                item_id, offer = change[1], change[2]
+                item = listings.get(item_id)
+                event = {"event": "new_offer", "item_id": item_id, "offer": offer}
+            else:
+                item_id, item = change[1], None
+                event = {"event": "removed", "item_id": item_id}
+
+            for watch_id, subscriber in list(self._item_watches.get(item_id, {}).items()):
+                self._send(subscriber, watch_id, event)
+            if item is None or not searching:
+                continue
+            cached = matched.get(item_id)
+            if cached is None or cached[0] is not item:
+                tokens = tokenize(item["title"]) + tokenize(item["description"])
+                cached = matched[item_id] = (item, tokens, self._search_candidates(item, tokens))
+            for watch_id, (subscriber, filters) in cached[2]:
+                if watch_id in self._watch_targets and matches_filters(item, *filters, tokens=cached[1]):
+                    self._send(subscriber, watch_id, event)
+
+    def _search_candidates(
+        self, item: Dict[str, Any], tokens: List[str],
+    ) -> List[Tuple[str, Tuple[Subscriber, SearchFilters]]]:
+        """Search watches filed under the listing's category, no category, or a substring of one of its tokens."""
+        candidates: List[Tuple[str, Tuple[Subscriber, SearchFilters]]] = []
+        for bucket in (item["category"].lower(), ""):
+            candidates.extend(self._search_watches.get(bucket, {}).items())
+        if not self._term_watches:
+            return candidates
+        # Only substrings as long as some filed term can be one
+        anchors: Set[Tuple[str, bool]] = set()
+        for length, prefix in self._term_shapes:
+            for token in tokens:
+                if prefix:
+                    if len(token) >= length:
+                        anchors.add((token[:length], True))
+                else:
+                    anchors.update((token[start:start + length], False) for start in range(len(token) - length + 1))
+        for anchor in anchors:
+            watches = self._term_watches.get(anchor)
+            if watches:
+                candidates.extend(watches.items())
+        return candidates
+
+    def _send(self, subscriber: Subscriber, watch_id: str, event: Dict[str, Any]) -> None:
+        if subscriber.dropped is not None:
+            return
+        if len(subscriber.queue) >= self.max_queue:
+            self.dropped += 1
+            self._drop(subscriber, "slow consumer")
+            return
+        subscriber.queue.append((watch_id, event))
+        subscriber.ready.set()
+
+    def _drop(self, subscriber: Subscriber, reason: str) -> None:
+        """Cancel every watch of a subscriber and discard its backlog."""
+        if self._subscribers.get(subscriber.session) is not subscriber:
+            return
+        del self._subscribers[subscriber.session]
+        subscriber.dropped = {"event": "dropped", "reason": reason, "watch_ids": sorted(subscriber.watches)}
+        for watch_id in list(subscriber.watches):
+            self._remove_watch(watch_id)
+        subscriber.queue.clear()
+        subscriber.ready.set()
+
+    async def _deliver(self, subscriber: Subscriber) -> None:
+        session = subscriber.session
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.queue:
+                    watch_id, event = subscriber.queue.popleft()
+                    await session.send_log_message(level="info", data=dict(event, watch_id=watch_id),
+                                                   logger=WATCH_LOGGER)
+                    self.delivered += 1
+                if subscriber.dropped is not None:
+                    await session.send_log_message(level="warning", data=subscriber.dropped, logger=WATCH_LOGGER)
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client went away; forget its watches
+            logger.debug("Watch session closed", exc_info=True)
+            self._drop(subscriber, "session closed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._subscribers),
+            "watches": len(self._watch_targets),
+            "queued": sum(len(subscriber.queue) for subscriber in self._subscribers.values()),
+            "delivered": self.delivered,
+            "dropped_slow": self.dropped,
+        }
+
+    async def close(self) -> None:
+        """Stop every sender task; undelivered events are discarded."""
+        tasks = [subscriber.task for subscriber in self._subscribers.values() if subscriber.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._subscribers.clear()
+        self._watch_targets.clear()
+        self._item_watches.clear()
+        self._search_watches.clear()
+        self._term_watches.clear()
+        self._term_shapes.clear()
@@ -0,0 +1,189 @@
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_left
+from functools import lru_cache
+import csv
+import math
+import os
+import re
+
+# Bundled offline city table: city,region,country,lat,lon
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.csv")
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Bits of latitude and of longitude in a cell code; 26 each puts cells under a metre
+CODE_BITS = 26
+
+# Most cells a radius query scans; it picks the finest level that stays within this
+MAX_QUERY_CELLS = 16
+
+US_STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "district of columbia": "dc",
+    "florida": "fl", "georgia": "ga", "hawaii": "hi", "idaho": "id", "illinois": "il",
+    "indiana": "in", "iowa": "ia", "kansas": "ks", "kentucky": "ky", "louisiana": "la",
+    "maine": "me", "maryland": "md", "massachusetts": "ma", "michigan": "mi", "minnesota": "mn",
+    "mississippi": "ms", "missouri": "mo", "montana": "mt", "nebraska": "ne", "nevada": "nv",
+    "new hampshire": "nh", "new jersey": "nj", "new mexico": "nm", "new york": "ny",
+    "north carolina": "nc", "north dakota": "nd", "ohio": "oh", "oklahoma": "ok", "oregon": "or",
+    "pennsylvania": "pa", "rhode island": "ri", "south carolina": "sc", "south dakota": "sd",
+    "tennessee": "tn", "texas": "tx", "utah": "ut", "vermont": "vt", "virginia": "va",
+    "washington": "wa", "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy",
+}
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+Point = Tuple[float, float]
+
+
+def _normalize(location: str) -> str:
+    parts = [" ".join(part.split()).lower() for part in location.split(",")]
+    parts = [part for part in parts if part]
+    if len(parts) > 1:
+        parts[1] = US_STATES.get(parts[1], parts[1])
+    return ", ".join(parts)
+
+
+@lru_cache(maxsize=1)
+def city_table() -> Dict[str, Point]:
+    """Map normalized "city", "city, region" and "city, region, country" to coordinates.
+
+    A bare city name resolves to the first city of that name in the table,
+    which lists larger cities first.
+    """
+    table: Dict[str, Point] = {}
+    with open(CITIES_PATH, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            point = (float(row["lat"]), float(row["lon"]))
+            city, region, country = row["city"].lower(), row["region"].lower(), row["country"].lower()
+            for key in (city, f"{city}, {region}", f"{city}, {country}", f"{city}, {region}, {country}"):
+                table.setdefault(key, point)
+    return table
+
+
+def geocode(location: str) -> Optional[Point]:
+    """Resolve "City, ST" or a literal "lat,lon" to coordinates, or None if unknown."""
+    match = _COORDINATES.match(location)
+    if match:
+        lat, lon = float(match.group(1)), float(match.group(2))
+        return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+    return city_table().get(_normalize(location))
+
+
+def distance_km(a: Point, b: Point) -> float:
+    """Great-circle distance between two points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _spread(v: int) -> int:
+    # Move bit i of v to bit 2i
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def _cell(value: float, low: float, span: float, bits: int) -> int:
+    return min(int((value - low) / span * (1 << bits)), (1 << bits) - 1)
+
+
+def cell_code(lat: float, lon: float, bits: int = CODE_BITS) -> int:
+    """Geohash-style cell code: longitude and latitude cell bits interleaved.
+
+    Codes of the cells inside one coarser cell form a contiguous range, so a
+    cell at any level is a single range scan over sorted codes.
+    """
+    return (_spread(_cell(lon, -180.0, 360.0, bits)) << 1) | _spread(_cell(lat, -90.0, 180.0, bits))
+
+
+def covering_cells(center: Point, radius_km: float) -> Tuple[int, List[int]]:
+    """Pick a level and list the cell codes covering a circle's bounding box.
+
+    Returns (shift, cell prefixes): the codes inside cell p are those from
+    p << shift up to, not including, (p + 1) << shift.
+    """
+    lat, lon = center
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_low, lat_high = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(lat_low), abs(lat_high))))
+    dlon = math.degrees(radius_km / EARTH_RADIUS_KM) / cos_lat if cos_lat > 1e-9 else 360.0
+    if dlon >= 180.0:
+        lon_ranges = [(-180.0, 180.0)]
+    elif lon - dlon < -180.0:
+        lon_ranges = [(lon - dlon + 360.0, 180.0), (-180.0, lon + dlon)]
+    elif lon + dlon > 180.0:
+        lon_ranges = [(lon - dlon, 180.0), (-180.0, lon + dlon - 360.0)]
+    else:
+        lon_ranges = [(lon - dlon, lon + dlon)]
+
+    bits = CODE_BITS
+    while bits > 0:
+        ys = range(_cell(lat_low, -90.0, 180.0, bits), _cell(lat_high, -90.0, 180.0, bits) + 1)
+        xs = [range(_cell(low, -180.0, 360.0, bits), _cell(high, -180.0, 360.0, bits) + 1)
+              for low, high in lon_ranges]
+        if sum(len(r) for r in xs) * len(ys) <= MAX_QUERY_CELLS:
+            break
+        bits -= 1
+    else:
+        ys, xs = range(1), [range(1)]
+    cells = sorted({(_spread(x) << 1) | _spread(y) for r in xs for x in r for y in ys})
+    return 2 * (CODE_BITS - bits), cells
+
+
+class GeoIndex:
+    """Listing coordinates keyed by cell code, for bisectable radius queries."""
+
+    def __init__(self) -> None:
+        self._entries: List[Tuple[int, str]] = []  # (cell code, item_id), sorted lazily
+        self._points: Dict[str, Tuple[Point, int]] = {}  # item_id -> (point, cell code)
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def add(self, item_id: str, point: Point) -> None:
+        if item_id in self._points:
+            self.remove(item_id)
+        code = cell_code(*point)
+        self._points[item_id] = (point, code)
+        self._entries.append((code, item_id))
+        self._dirty = True
+
+    def remove(self, item_id: str) -> None:
+        """Drop a listing from the index. Unknown IDs are ignored."""
+        entry = self._points.pop(item_id, None)
+        if entry is None:
+            return
+        entries = self._sorted()
+        i = bisect_left(entries, (entry[1], item_id))
+        if i < len(entries) and entries[i] == (entry[1], item_id):
+            del entries[i]
+
+    def within(self, center: Point, radius_km: float) -> Dict[str, float]:
+        """Return {item_id: distance_km} for every listing within radius_km of center.
+
+        Scans at most MAX_QUERY_CELLS cell ranges, each found by bisection, and
+        checks exact distances only for listings inside those cells.
+        """
+        entries = self._sorted()
+        found: Dict[str, float] = {}
+        if not entries or radius_km <= 0:
+            return found
+        shift_bits, cells = covering_cells(center, radius_km)
+        for prefix in cells:
+            start = bisect_left(entries, (prefix << shift_bits,))
+            stop = bisect_left(entries, ((prefix + 1) << shift_bits,))
+            for _, item_id in entries[start:stop]:
+                distance = distance_km(center, self._points[item_id][0])
+                if distance <= radius_km:
+                    found[item_id] = distance
+        return found
+
+    def _sorted(self) -> List[Tuple[int, str]]:
+        if self._dirty:
+            self._entries.sort()
+            self._dirty = False
+        return self._entries
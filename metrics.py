@@ -0,0 +1,219 @@
+from typing import Any, Awaitable, Callable, Counter, Dict, Iterable, List, Optional, Tuple, TypeVar
+from bisect import bisect_left
+from contextvars import ContextVar
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Innermost frames of threads that are parked rather than working, left out of samples
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+_IDLE_FUNCTIONS = {("thread.py", "_worker")}  # thread pool worker waiting for a job
+
+# Set by mark_error() while a tool call runs; checked when the call returns
+_call_failed: ContextVar[bool] = ContextVar("call_failed", default=False)
+
+
+def mark_error() -> None:
+    """Count the tool call in progress as failed, even though it returns normally."""
+    _call_failed.set(True)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, as Prometheus exposes them."""
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le label, cumulative count) per bucket, ending with +Inf."""
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return buckets
+
+
+class ToolStats:
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.errors = 0
+        self.response_bytes = 0
+        self.in_flight = 0
+
+
+class SlowCallProfiler:
+    """Samples thread stacks while tool calls run and logs the hottest ones of slow calls.
+
+    A background thread wakes every ``interval`` seconds while any call is in
+    flight and adds the stack of every busy thread to each running call's
+    samples, so with concurrent calls a sample may be charged to several of
+    them. Calls slower than ``threshold`` seconds log their ``top`` stacks.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005, top: int = 5, depth: int = 40) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.depth = depth
+        self.slow_calls = 0
+        self._active: List[Counter[str]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self) -> Counter[str]:
+        samples: Counter[str] = collections.Counter()
+        with self._lock:
+            self._active.append(samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tool-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return samples
+
+    def end(self, samples: Counter[str], tool: str, seconds: float) -> None:
+        with self._lock:
+            self._active.remove(samples)
+        if seconds < self.threshold:
+            return
+        self.slow_calls += 1
+        total = sum(samples.values())
+        lines = [f"Slow call to {tool}: {seconds * 1000:.1f} ms, {total} stack samples"]
+        for stack, count in samples.most_common(self.top):
+            lines.append(f"  {count / total:6.1%}  {stack}")
+        logger.warning("\n".join(lines))
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wakeup.clear()
+            if idle:
+                self._wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            stacks = [self._collapse(frame) for ident, frame in sys._current_frames().items() if ident != me]
+            stacks = [stack for stack in stacks if stack]
+            with self._lock:
+                for samples in self._active:
+                    samples.update(stacks)
+
+    def _collapse(self, frame: Any) -> str:
+        """One line per stack, outermost frame first; empty for threads that are just waiting."""
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename in _IDLE_FILES or (filename, code.co_name) in _IDLE_FUNCTIONS:
+            return ""
+        frames = []
+        while frame is not None and len(frames) < self.depth:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+
+class ToolMetrics:
+    """Per-tool call latency, error and response size counters.
+
+    Wrap each tool with instrument(); render() produces the Prometheus text
+    exposition. Counters are only touched from the event loop, so they need
+    no locking.
+    """
+
+    def __init__(self, prefix: str = "marketplace", profiler: Optional[SlowCallProfiler] = None) -> None:
+        self.prefix = prefix
+        self.profiler = profiler
+        self.tools: Dict[str, ToolStats] = {}
+
+    def instrument(self, func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        """Wrap an async tool so every call is timed and counted. The signature is kept."""
+        stats = self.tools.setdefault(func.__name__, ToolStats())
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            failed = _call_failed.set(False)
+            samples = self.profiler.begin() if self.profiler is not None else None
+            stats.in_flight += 1
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException:
+                stats.errors += 1
+                raise
+            else:
+                if _call_failed.get():
+                    stats.errors += 1
+                if isinstance(result, str):
+                    stats.response_bytes += len(result.encode("utf-8"))
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                stats.in_flight -= 1
+                stats.latency.observe(elapsed)
+                if samples is not None:
+                    self.profiler.end(samples, func.__name__, elapsed)
+                _call_failed.reset(failed)
+
+        return wrapper
+
+    def render(self, extra: Iterable[Tuple[str, str, str, Dict[str, str], float]] = ()) -> str:
+        """Prometheus text exposition of the tool metrics.
+
+        ``extra`` adds other samples as (name, type, help, labels, value);
+        samples of one metric must be adjacent.
+        """
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_tool_duration_seconds Tool call latency.",
+            f"# TYPE {p}_tool_duration_seconds histogram",
+        ]
+        for tool, stats in sorted(self.tools.items()):
+            for le, count in stats.latency.cumulative():
+                lines.append(f'{p}_tool_duration_seconds_bucket{{tool="{tool}",le="{le}"}} {count}')
+            lines.append(f'{p}_tool_duration_seconds_sum{{tool="{tool}"}} {stats.latency.sum!r}')
+            lines.append(f'{p}_tool_duration_seconds_count{{tool="{tool}"}} {stats.latency.count}')
+        for name, kind, help_text, field in (
+            ("tool_errors_total", "counter", "Tool calls that failed or returned an error.", "errors"),
+            ("tool_response_bytes_total", "counter", "UTF-8 bytes returned by tool calls.", "response_bytes"),
+            ("tool_in_flight", "gauge", "Tool calls currently running.", "in_flight"),
+        ):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for tool, stats in sorted(self.tools.items()):
+                lines.append(f'{p}_{name}{{tool="{tool}"}} {getattr(stats, field)}')
+        if self.profiler is not None:
+            lines.append(f"# HELP {p}_tool_slow_calls_total Tool calls over the profiler threshold.")
+            lines.append(f"# TYPE {p}_tool_slow_calls_total counter")
+            lines.append(f"{p}_tool_slow_calls_total {self.profiler.slow_calls}")
+
+        seen = set()
+        for name, kind, help_text, labels, value in extra:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} {kind}")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{p}_{name}{{{label_text}}} {value!r}" if label_text else f"{p}_{name} {value!r}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,30 @@
+from typing import Any
+import json
+
+# orjson is several times faster than the standard library encoder; use it
+# when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to compact JSON text."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return _encoder.encode(obj)
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON text or UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def join_array(fragments: Any) -> str:
+    """Splice already-serialized JSON values into a JSON array without re-encoding them."""
+    return "[" + ",".join(fragments) + "]"
@@ -1,15 +1,41 @@
-from typing import Any, List, Dict
-import json
-from datetime import datetime, timedelta
-import random
-from mcp.server.fastmcp import FastMCP
+from typing import Any, AsyncIterator, List, Dict, Optional, Set, Tuple
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from string import Template
+from mcp.server.fastmcp import Context, FastMCP
 from starlette.applications import Starlette
 from mcp.server.sse import SseServerTransport
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
+from starlette.responses import JSONResponse, Response
+from starlette.middleware import Middleware
 from starlette.routing import Mount, Route
 from mcp.server import Server
-import uvicorn
+
+from catalog import Catalog, SearchFilters, WriteConflict, check_sort, decode_cursor, encode_cursor
+from geo import geocode
+from executor import ToolExecutor
+from serialization import dumps, join_array
+from cache import EncodedPage, FragmentCache, PageCache, QueryCache
+from storage import ColumnarStore, MemoryStore, SQLiteStore, Store
+from writer import KeyedLocks, WriteBatcher
+from transfer import export_file, import_file
+from metrics import SlowCallProfiler, ToolMetrics, mark_error
+from feed import WATCH_LOGGER, ChangeFeed
+from snapshot import SnapshotView, open_view, read_manifest, save_snapshot, write_manifest
+from startup import FirstResponseMiddleware, LazyCatalog, StartupReport
+from workers import (RUN_DIR_ENV, SNAPSHOT_DIR_ENV, WORKER_ENV, WRITER_KEY_ENV, MessageRouter, SharedCatalog,
+                     WriterClient, run_worker, serve_workers, writer_address)
+
+# Seconds from process start to each startup milestone, logged on the first
+# response and served at /stats/startup
+STARTUP = StartupReport()
+STARTUP.mark("imports")
 
 # Initialize FastMCP server
 mcp = FastMCP("used-goods-marketplace")
@@ -110,86 +136,379 @@ MARKETPLACE_ITEMS = [
     }
 ]
 
-@mcp.tool()
-async def search_items(query: str = "", category: str = "", max_price: int = 0) -> str:
-    """Search for items in the marketplace.
+def create_store() -> Store:
+    """Pick the listing store from MARKETPLACE_STORE: "columnar" (default), "memory" or "sqlite".
     
-    Args:
-        query: Search term for item title/description
-        category: Filter by category (Electronics, Furniture, Sports, etc.)
-        max_price: Maximum asking price filter
+    Setting MARKETPLACE_DB to a database file selects SQLite unless another
+    store is named explicitly.
     """
+    db_path = os.environ.get("MARKETPLACE_DB")
+    kind = os.environ.get("MARKETPLACE_STORE", "sqlite" if db_path else "columnar")
+    if kind == "sqlite":
+        return SQLiteStore(db_path or "marketplace.db", pool_size=int(os.environ.get("MARKETPLACE_DB_POOL_SIZE", "4")))
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "columnar":
+        return ColumnarStore()
+    raise ValueError(f"Unknown MARKETPLACE_STORE '{kind}' (expected 'columnar', 'memory' or 'sqlite')")
+
+def file_stamps(*paths: str) -> List[Any]:
+    """[path, size, mtime_ns] per file, with None for the figures of a missing one."""
+    stamps: List[Any] = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append([path, stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            stamps.append([path, None, None])
+    return stamps
+
+def catalog_source() -> Dict[str, Any]:
+    """Identify what the catalog is loaded from, to tell whether an index snapshot still matches it.
+    
+    A SQLite database is identified by the size and modification time of
+    its files; any other store starts empty and is seeded, so it is the seed
+    file that counts, or the bundled sample listings.
+    """
+    db_path = os.environ.get("MARKETPLACE_DB")
+    kind = os.environ.get("MARKETPLACE_STORE", "sqlite" if db_path else "columnar")
+    if kind == "sqlite":
+        path = os.path.abspath(db_path or "marketplace.db")
+        return {"db": file_stamps(path, path + "-wal")}
+    seed = os.environ.get("MARKETPLACE_SEED")
+    return {"seed": file_stamps(os.path.abspath(seed)) if seed else "sample"}
+
+def open_index_snapshot(directory: str) -> Optional[SnapshotView]:
+    """The index snapshot in directory, if it was written from the catalog source in use and is readable."""
     try:
-        filtered_items = MARKETPLACE_ITEMS.copy()
-        
-        # Filter by search query
-        if query:
-            filtered_items = [
-                item for item in filtered_items
-                if query.lower() in item["title"].lower() or query.lower() in item["description"].lower()
-            ]
-        
-        # Filter by category
-        if category:
-            filtered_items = [
-                item for item in filtered_items
-                if item["category"].lower() == category.lower()
-            ]
-        
-        # Filter by max price
-        if max_price > 0:
-            filtered_items = [
-                item for item in filtered_items
-                if item["asking_price"] <= max_price
-            ]
-        
-        if not filtered_items:
-            return "No items found matching your criteria."
-        
-        # Format results
-        results = []
-        for item in filtered_items:
-            highest_offer = max(item["offers"], key=lambda x: x["amount"]) if item["offers"] else None
-            highest_offer_text = f"Highest offer: ${highest_offer['amount']}" if highest_offer else "No offers yet"
-            
-            results.append(f"""
+        if read_manifest(directory).get("source") != catalog_source():
+            return None
+        # Segments of an older layout fail their format check
+        return open_view(directory, {})
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Index of this process when it is one of the workers started by --workers.
+# Workers read the catalog from the snapshot the parent process publishes and
+# send their writes to it; the parent holds the only real Catalog.
+WORKER = int(os.environ[WORKER_ENV]) if WORKER_ENV in os.environ else None
+
+# Seconds between a worker's checks for a newer catalog snapshot
+SNAPSHOT_POLL_INTERVAL = float(os.environ.get("MARKETPLACE_SNAPSHOT_POLL", "0.05"))
+
+# Index snapshot written by `server.py snapshot DIR`. While it matches the
+# store (see catalog_source()), startup serves reads from it right away and
+# restores the full catalog from it in the background instead of rebuilding
+# the indexes from every listing.
+INDEX_SNAPSHOT = os.environ.get("MARKETPLACE_INDEX_SNAPSHOT")
+
+# Indexed view over the listings, kept up to date as listings change. An
+# empty store is seeded from the JSONL file named by MARKETPLACE_SEED, or
+# with the sample listings above; a store that already holds listings is not.
+# The index snapshot is checked before the store opens, which may touch its files.
+_index_view = open_index_snapshot(INDEX_SNAPSHOT) if INDEX_SNAPSHOT and WORKER is None else None
+if WORKER is not None:
+    CATALOG = SharedCatalog(
+        os.environ[SNAPSHOT_DIR_ENV],
+        WriterClient(writer_address(os.environ[RUN_DIR_ENV]), bytes.fromhex(os.environ[WRITER_KEY_ENV])),
+    )
+    STARTUP.catalog_source = "shared snapshot"
+elif _index_view is not None:
+    CATALOG = LazyCatalog(_index_view, store=create_store(), on_ready=lambda catalog: STARTUP.mark("catalog_built"))
+    STARTUP.catalog_source = "index snapshot"
+else:
+    if INDEX_SNAPSHOT:
+        print(f"⚠️ Index snapshot {INDEX_SNAPSHOT} is missing or out of date; building the catalog", file=sys.stderr)
+    _store = create_store()
+    _seed = os.environ.get("MARKETPLACE_SEED")
+    _seed_store = len(_store) == 0
+    CATALOG = Catalog(MARKETPLACE_ITEMS if _seed_store and not _seed else (), store=_store)
+    if _seed_store and _seed:
+        import_file(CATALOG, _seed)
+    STARTUP.mark("catalog_built")
+STARTUP.mark("catalog_ready")
+
+# Directory the import_catalog/export_catalog tools may read and write
+DATA_DIR = os.environ.get("MARKETPLACE_DATA_DIR", "data")
+
+# Tool calls whose estimated cost (listings touched) reaches the threshold run
+# on a thread pool, with a cap on how many may run or queue at once
+EXECUTOR = ToolExecutor(
+    max_workers=int(os.environ.get("TOOL_EXECUTOR_WORKERS", "4")),
+    cost_threshold=int(os.environ.get("TOOL_COST_THRESHOLD", "1000")),
+    max_concurrent=int(os.environ.get("TOOL_MAX_CONCURRENT", "4")),
+    max_pending=int(os.environ.get("TOOL_MAX_PENDING", "64")),
+)
+
+# search_items results per page unless the caller asks for fewer, and the
+# most one page may hold; streaming mode emits results in smaller chunks
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 500
+SEARCH_STREAM_CHUNK = 10
+
+# search_items radius around `near` when the caller gives none
+SEARCH_DEFAULT_RADIUS_KM = 50
+
+# Times accept_offer re-reads a listing that changed under it before giving up
+ACCEPT_OFFER_ATTEMPTS = 3
+
+# Seconds between full recomputes that check the running stats for drift
+STATS_AUDIT_INTERVAL = 300
+
+# Rendered text and serialized JSON per listing, reused until the listing
+# changes. Changed or removed listings are dropped from it right away.
+FRAGMENTS = FragmentCache(
+    max_bytes=int(os.environ.get("FRAGMENT_CACHE_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.environ["FRAGMENT_CACHE_TTL"]) if os.environ.get("FRAGMENT_CACHE_TTL") else None,
+)
+CATALOG.add_listener(FRAGMENTS.invalidate)
+
+# Rendered search_items pages keyed on normalized parameters; every entry is
+# invalidated as soon as the catalog generation moves on
+SEARCH_RESULTS = QueryCache(max_entries=int(os.environ.get("SEARCH_CACHE_ENTRIES", "1024")))
+
+# Write tools serialize per listing, then hand their writes to the batcher,
+# which commits everything queued meanwhile to the store in one go
+ITEM_LOCKS = KeyedLocks()
+WRITES = WriteBatcher(
+    CATALOG,
+    max_batch=int(os.environ.get("WRITE_BATCH_SIZE", "256")),
+    max_delay=float(os.environ.get("WRITE_BATCH_DELAY", "0.002")),
+)
+
+# Sessions watching listings or searches are pushed new offers and price
+# changes; a session with WATCH_QUEUE_SIZE events still unsent is dropped
+FEED = ChangeFeed(
+    CATALOG,
+    max_queue=int(os.environ.get("WATCH_QUEUE_SIZE", "256")),
+    max_watches=int(os.environ.get("WATCH_MAX_PER_SESSION", "100")),
+)
+
+# Sessions that placed watches over the SSE connection being served; their
+# watches are dropped when it closes
+CONNECTION_SESSIONS: ContextVar[Optional[Set[Any]]] = ContextVar("connection_sessions", default=None)
+
+# Latency, error and response size counters per tool, served at /metrics. With
+# TOOL_PROFILE_SLOW_MS set, stacks are sampled while tools run and calls over
+# that many milliseconds log their hottest stacks.
+_slow_ms = os.environ.get("TOOL_PROFILE_SLOW_MS")
+METRICS = ToolMetrics(
+    profiler=SlowCallProfiler(
+        threshold=float(_slow_ms) / 1000,
+        interval=float(os.environ.get("TOOL_PROFILE_INTERVAL_MS", "5")) / 1000,
+    ) if _slow_ms else None,
+)
+
+OUTPUT_FORMATS = ("text", "json")
+
+def data_path(name: str) -> str:
+    """Resolve a file name inside DATA_DIR, refusing paths that escape it."""
+    root = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if not name or os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"'{name}' is not a file name inside the data directory")
+    return path
+
+def check_format(format: str) -> None:
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format '{format}' (expected 'text' or 'json')")
+
+def error_response(format: str, message: str) -> str:
+    mark_error()
+    return dumps({"error": message}) if format == "json" else message
+
+def summary_record(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact search-result record for a listing."""
+    highest_offer = CATALOG.best_offer(item)
+    return {
+        "id": item["id"],
+        "title": item["title"],
+        "category": item["category"],
+        "asking_price": item["asking_price"],
+        "highest_offer": highest_offer["amount"] if highest_offer else None,
+        "offer_count": len(item["offers"]),
+        "location": item["location"],
+        "condition": item["condition"],
+        "seller": item["seller"],
+        "seller_rating": item["seller_rating"],
+        "snippet": item["description"][:100],
+    }
+
+def detail_record(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Full record for a listing, offers ordered best-first."""
+    return item
+
+RECORD_BUILDERS = {"summary": summary_record, "detail": detail_record}
+
+def json_fragment(kind: str, version: int, item: Dict[str, Any]) -> str:
+    """Serialized record for a listing, reused while the listing is unchanged.
+    
+    version must have been read before the item was loaded.
+    """
+    return FRAGMENTS.render(f"{kind}_json", item["id"], version, lambda: dumps(RECORD_BUILDERS[kind](item)))
+
+def format_search_result(item: Dict[str, Any]) -> str:
+    """Render the short summary of a listing shown in search results."""
+    highest_offer = CATALOG.best_offer(item)
+    highest_offer_text = f"Highest offer: ${highest_offer['amount']}" if highest_offer else "No offers yet"
+    
+    return f"""
 📦 {item['title']} (ID: {item['id']})
 💰 Asking: ${item['asking_price']} | {highest_offer_text}
 📍 {item['location']} | Condition: {item['condition']}
 👤 Seller: {item['seller']} (⭐ {item['seller_rating']})
 📝 {item['description'][:100]}{'...' if len(item['description']) > 100 else ''}
-""")
-        
-        return f"Found {len(filtered_items)} items:\n" + "\n".join(results)
-        
-    except Exception as e:
-        return f"Error searching items: {str(e)}"
+"""
+
+def format_search_batch(batch: List[Tuple[int, Dict[str, Any]]], format: str) -> List[str]:
+    if format == "json":
+        return [json_fragment("summary", version, item) for version, item in batch]
+    return [FRAGMENTS.render("summary_text", item["id"], version, lambda: format_search_result(item))
+            for version, item in batch]
+
+def search_page_header(total: int, start: int, shown: int) -> str:
+    if start == 0 and shown == total:
+        return f"Found {total} items:\n"
+    return f"Found {total} items (showing {start + 1}-{start + shown}):\n"
+
+def next_cursor(page: List[Any], start: int, total: int) -> Any:
+    return encode_cursor(page[-1][0]) if start + len(page) < total else None
+
+def search_page_footer(page: List[Any], start: int, total: int) -> str:
+    cursor = next_cursor(page, start, total)
+    if cursor is None:
+        return ""
+    return f"\n➡️ More results available - pass cursor=\"{cursor}\" for the next page\n"
+
+def search_page_json(page: List[Any], start: int, total: int, items_json: str) -> str:
+    return (
+        f'{{"total":{total},"start":{start},"count":{len(page)},'
+        f'"next_cursor":{dumps(next_cursor(page, start, total))},"items":{items_json}}}'
+    )
+
+def normalize_search(query: str, category: str, max_price: int, near: str, radius_km: float) -> SearchFilters:
+    """Canonical form of search filters, so equivalent searches share cache entries.
+    
+    near is geocoded here; an unknown location raises ValueError.
+    """
+    point = None
+    if near.strip():
+        point = geocode(near)
+        if point is None:
+            raise ValueError(f"Unknown location '{near}' (expected \"City, ST\" or \"lat,lon\")")
+        radius_km = radius_km if radius_km > 0 else SEARCH_DEFAULT_RADIUS_KM
+    return " ".join(query.lower().split()), category.strip().lower(), max(max_price, 0), point, radius_km if point else 0
+
+def plan_search_page(filters: SearchFilters, sort: str, limit: int, cursor: str) -> Tuple[List[Any], int, int]:
+    """Resolve a search page to (page keys, matches before the page, total matches). No records are loaded."""
+    # Text, category, price and distance filters are answered from the catalog
+    # indexes; only the page's keys are sorted, so records are loaded and
+    # formatted for the page alone
+    return CATALOG.search_page(*filters, sort=sort, after=decode_cursor(cursor) if cursor else None, limit=limit)
+
+def render_search_results(filters: SearchFilters, sort: str, limit: int, cursor: str, format: str) -> str:
+    """Run a search and format one page of matches. Safe to call from a worker thread."""
+    page, start, total = plan_search_page(filters, sort, limit, cursor)
+    
+    # Format results
+    results = []
+    for batch in CATALOG.iter_results(page):
+        results.extend(format_search_batch(batch, format))
+    
+    if format == "json":
+        return search_page_json(page, start, total, join_array(results))
+    if not page:
+        return "No items found matching your criteria." if not total else "No more results."
+    return search_page_header(total, start, len(page)) + "\n".join(results) + search_page_footer(page, start, total)
 
 @mcp.tool()
-async def get_item_details(item_id: str) -> str:
-    """Get detailed information about a specific item including all offers.
+@METRICS.instrument
+async def search_items(
+    query: str = "",
+    category: str = "",
+    max_price: int = 0,
+    near: str = "",
+    radius_km: float = 0,
+    sort: str = "relevance",
+    limit: int = SEARCH_PAGE_SIZE,
+    cursor: str = "",
+    stream: bool = False,
+    format: str = "text",
+    ctx: Context = None,
+) -> str:
+    """Search for items in the marketplace.
     
     Args:
-        item_id: The ID of the item to retrieve
+        query: Search terms for item title/description. Every term must appear inside a word;
+            with several terms, "term*" must start one instead. A single term is always
+            matched as written, so "c++*" finds "c++*". A blank query matches every item.
+        category: Filter by category (Electronics, Furniture, Sports, etc.)
+        max_price: Maximum asking price filter
+        near: Only items near this location, as "City, ST" or "lat,lon"; without
+            a text query the nearest items come first
+        radius_km: Distance from near to search within (default: 50 km)
+        sort: "relevance" (default) ranks text matches by how well they match,
+            then by seller rating, how recently they were posted and how close
+            offers are to the asking price; "listed" keeps listing order
+        limit: Maximum number of results to return in this page
+        cursor: Cursor from a previous page's results, to continue after it
+            (pass the same search parameters)
+        stream: Send results as progress notifications while they are produced
+            (requires a progress token on the request); the reply then only
+            summarizes the page
+        format: "text" for readable output, "json" for compact JSON records
     """
     try:
-        item = next((item for item in MARKETPLACE_ITEMS if item["id"] == item_id), None)
+        check_format(format)
+        check_sort(sort)
+        limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+        # Broad searches are planned and formatted on a worker thread so they don't stall other sessions
+        cost = CATALOG.estimate_matches(category=category, max_price=max_price)
         
-        if not item:
-            return f"Item with ID '{item_id}' not found."
-        
-        # Format offers
-        offers_text = ""
-        if item["offers"]:
-            sorted_offers = sorted(item["offers"], key=lambda x: x["amount"], reverse=True)
-            offers_text = "\n💰 Current Offers:\n"
-            for i, offer in enumerate(sorted_offers):
-                offers_text += f"  {i+1}. ${offer['amount']} from {offer['buyer']} ({offer['date']})\n"
-                offers_text += f"     Message: \"{offer['message']}\"\n"
-        else:
-            offers_text = "\n💰 No offers yet - be the first!"
+        filters = normalize_search(query, category, max_price, near, radius_km)
+        
+        if not (stream and ctx is not None and ctx.request_context.meta and ctx.request_context.meta.progressToken is not None):
+            # Identical searches are answered from the cache, and concurrent
+            # identical misses share a single evaluation
+            return await SEARCH_RESULTS.get_or_compute(
+                filters + (sort, limit, cursor, format),
+                CATALOG.generation,
+                lambda: EXECUTOR.run(render_search_results, filters, sort, limit, cursor, format, cost=cost),
+            )
+        
+        page, start, total = await EXECUTOR.run(plan_search_page, filters, sort, limit, cursor, cost=cost)
+        
+        # Emit each chunk as soon as it is formatted, so the first results
+        # arrive before the rest of the page has been loaded
+        sent = 0
+        for batch in CATALOG.iter_results(page, batch_size=SEARCH_STREAM_CHUNK):
+            sent += len(batch)
+            chunk = format_search_batch(batch, format)
+            await ctx.report_progress(sent, len(page), message=join_array(chunk) if format == "json" else "\n".join(chunk))
+        
+        if format == "json":
+            return search_page_json(page, start, total, "[]")
+        if not page:
+            return "No items found matching your criteria." if not total else "No more results."
+        return search_page_header(total, start, len(page)) + f"Streamed {sent} items.\n" + search_page_footer(page, start, total)
         
-        return f"""
+    except Exception as e:
+        return error_response(format, f"Error searching items: {str(e)}")
+
+def format_item_details(item: Dict[str, Any]) -> str:
+    """Render the full detail view of a listing, including all offers."""
+    # Format offers
+    offers_text = ""
+    if item["offers"]:
+        # Offer books are already ordered best-first
+        offers_text = "\n💰 Current Offers:\n"
+        for i, offer in enumerate(item["offers"]):
+            offers_text += f"  {i+1}. ${offer['amount']} from {offer['buyer']} ({offer['date']})\n"
+            offers_text += f"     Message: \"{offer['message']}\"\n"
+    else:
+        offers_text = "\n💰 No offers yet - be the first!"
+    
+    return f"""
 📦 {item['title']} (ID: {item['id']})
 💰 Asking Price: ${item['asking_price']}
 📂 Category: {item['category']} | Condition: {item['condition']}
@@ -203,27 +522,104 @@ async def get_item_details(item_id: str) -> str:
 {offers_text}
 🏷️ Status: {item['status'].upper()}
 """
+
+def load_item(item_id: str) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+    """A listing and the version read just before it. Safe to call from a worker thread."""
+    return CATALOG.version(item_id), CATALOG.get(item_id)
+
+@mcp.tool()
+@METRICS.instrument
+async def get_item_details(item_id: str, format: str = "text") -> str:
+    """Get detailed information about a specific item including all offers.
+    
+    Args:
+        item_id: The ID of the item to retrieve
+        format: "text" for readable output, "json" for a compact JSON record
+    """
+    try:
+        check_format(format)
+        # Store reads may query SQLite or wait for the catalog lock; keep the event loop free
+        version, item = await asyncio.to_thread(load_item, item_id)
+        
+        if not item:
+            return error_response(format, f"Item with ID '{item_id}' not found.")
+        
+        if format == "json":
+            return json_fragment("detail", version, item)
+        return FRAGMENTS.render("detail_text", item_id, version, lambda: format_item_details(item))
+        
+    except Exception as e:
+        return error_response(format, f"Error retrieving item details: {str(e)}")
+
+def render_items(item_ids: List[str], format: str) -> str:
+    """Fetch and format several listings. Safe to call from a worker thread."""
+    versions = CATALOG.versions(item_ids)
+    items = CATALOG.get_many(item_ids)
+    
+    if format == "json":
+        # Missing IDs come back as null in their position
+        fragments = [json_fragment("detail", version, item) if item else "null" for version, item in zip(versions, items)]
+        return '{"items":' + join_array(fragments) + "}"
+    
+    results = []
+    for item_id, version, item in zip(item_ids, versions, items):
+        if item:
+            results.append(FRAGMENTS.render("detail_text", item_id, version, lambda: format_item_details(item)))
+        else:
+            results.append(f"\nItem with ID '{item_id}' not found.\n")
+    
+    return "\n".join(results)
+
+@mcp.tool()
+@METRICS.instrument
+async def get_items(item_ids: List[str], format: str = "text") -> str:
+    """Get detailed information about several items in a single call.
+    
+    Args:
+        item_ids: The IDs of the items to retrieve
+        format: "text" for readable output, "json" for compact JSON records
+    """
+    try:
+        check_format(format)
+        if not item_ids:
+            return error_response(format, "No item IDs given.")
+        
+        return await EXECUTOR.run(render_items, item_ids, format, cost=len(item_ids))
         
     except Exception as e:
-        return f"Error retrieving item details: {str(e)}"
+        return error_response(format, f"Error retrieving items: {str(e)}")
 
 @mcp.tool()
-async def get_offers_for_item(item_id: str) -> str:
+@METRICS.instrument
+async def get_offers_for_item(item_id: str, format: str = "text") -> str:
     """Get all offers for a specific item, sorted by amount.
     
     Args:
         item_id: The ID of the item
+        format: "text" for readable output, "json" for compact JSON records
     """
     try:
-        item = next((item for item in MARKETPLACE_ITEMS if item["id"] == item_id), None)
+        check_format(format)
+        item = await asyncio.to_thread(CATALOG.get, item_id)
         
         if not item:
-            return f"Item with ID '{item_id}' not found."
+            return error_response(format, f"Item with ID '{item_id}' not found.")
         
-        if not item["offers"]:
-            return f"No offers yet for '{item['title']}'. Asking price: ${item['asking_price']}"
+        # Offer books are already ordered best-first
+        sorted_offers = item["offers"]
         
-        sorted_offers = sorted(item["offers"], key=lambda x: x["amount"], reverse=True)
+        if format == "json":
+            highest_offer_pct = sorted_offers[0]["amount"] / item["asking_price"] * 100 if sorted_offers else None
+            return dumps({
+                "id": item["id"],
+                "title": item["title"],
+                "asking_price": item["asking_price"],
+                "highest_offer_pct": highest_offer_pct,
+                "offers": sorted_offers,
+            })
+        
+        if not sorted_offers:
+            return f"No offers yet for '{item['title']}'. Asking price: ${item['asking_price']}"
         
         result = f"📦 Offers for: {item['title']} (Asking: ${item['asking_price']})\n\n"
         
@@ -239,73 +635,523 @@ async def get_offers_for_item(item_id: str) -> str:
         return result
         
     except Exception as e:
-        return f"Error retrieving offers: {str(e)}"
+        return error_response(format, f"Error retrieving offers: {str(e)}")
 
 @mcp.tool()
-async def list_categories() -> str:
-    """Get all available categories in the marketplace."""
+@METRICS.instrument
+async def list_categories(format: str = "text") -> str:
+    """Get all available categories in the marketplace.
+    
+    Args:
+        format: "text" for readable output, "json" for a compact JSON object
+    """
     try:
-        categories = list(set(item["category"] for item in MARKETPLACE_ITEMS))
-        categories.sort()
+        check_format(format)
+        # Per-category counts are maintained by the catalog as listings change;
+        # read a copy, as writer threads keep updating them
+        category_counts = CATALOG.stats_snapshot().category_items
         
-        category_counts = {}
-        for category in categories:
-            count = len([item for item in MARKETPLACE_ITEMS if item["category"] == category])
-            category_counts[category] = count
+        if format == "json":
+            return dumps({"categories": {category: category_counts[category] for category in sorted(category_counts)}})
         
         result = "📂 Available Categories:\n\n"
-        for category in categories:
+        for category in sorted(category_counts):
             result += f"• {category} ({category_counts[category]} items)\n"
         
         return result
         
     except Exception as e:
-        return f"Error listing categories: {str(e)}"
+        return error_response(format, f"Error listing categories: {str(e)}")
 
 @mcp.tool()
-async def get_marketplace_stats() -> str:
-    """Get overall marketplace statistics."""
+@METRICS.instrument
+async def get_marketplace_stats(format: str = "text") -> str:
+    """Get overall marketplace statistics.
+    
+    Args:
+        format: "text" for readable output, "json" for a compact JSON object
+    """
     try:
-        total_items = len(MARKETPLACE_ITEMS)
-        total_offers = sum(len(item["offers"]) for item in MARKETPLACE_ITEMS)
-        
-        # Calculate average asking price
-        avg_asking = sum(item["asking_price"] for item in MARKETPLACE_ITEMS) / total_items
+        check_format(format)
+        # Totals are running counters, so this does not depend on catalog size
+        stats = CATALOG.stats_snapshot()
         
-        # Calculate average offer amount
-        all_offers = [offer["amount"] for item in MARKETPLACE_ITEMS for offer in item["offers"]]
-        avg_offer = sum(all_offers) / len(all_offers) if all_offers else 0
-        
-        # Get category breakdown
-        categories = {}
-        for item in MARKETPLACE_ITEMS:
-            cat = item["category"]
-            if cat not in categories:
-                categories[cat] = 0
-            categories[cat] += 1
+        if format == "json":
+            return dumps({
+                "total_items": stats.total_items,
+                "total_offers": stats.total_offers,
+                "avg_asking_price": round(stats.avg_asking, 2),
+                "avg_offer_amount": round(stats.avg_offer, 2),
+                "categories": dict(sorted(stats.category_items.items())),
+            })
         
         result = f"""
 📊 Marketplace Statistics
 
-📦 Total Items: {total_items}
-💰 Total Offers: {total_offers}
-💵 Average Asking Price: ${avg_asking:.2f}
-💸 Average Offer Amount: ${avg_offer:.2f}
+📦 Total Items: {stats.total_items}
+💰 Total Offers: {stats.total_offers}
+💵 Average Asking Price: ${stats.avg_asking:.2f}
+💸 Average Offer Amount: ${stats.avg_offer:.2f}
 
 📂 Category Breakdown:
 """
         
-        for cat, count in sorted(categories.items()):
+        for cat, count in sorted(stats.category_items.items()):
             result += f"• {cat}: {count} items\n"
         
         return result
         
     except Exception as e:
-        return f"Error generating stats: {str(e)}"
+        return error_response(format, f"Error generating stats: {str(e)}")
+
+# Most days of offer volume listed in a text offer report; JSON has them all
+OFFER_REPORT_TEXT_DAYS = 14
+
+def parse_day(value: str, name: str) -> Optional[int]:
+    """Date ordinal of a YYYY-MM-DD argument, or None if it is empty."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").toordinal()
+    except ValueError:
+        raise ValueError(f"{name} must be a date like 2024-01-31, not '{value}'") from None
+
+def format_money(value: Optional[float]) -> str:
+    return f"${value:.2f}" if value is not None else "n/a"
+
+def format_ratio(value: Optional[float]) -> str:
+    return f"{value:.0%}" if value is not None else "n/a"
+
+@mcp.tool()
+@METRICS.instrument
+async def get_offer_analytics(
+    category: str = "", days: int = 30, since: str = "", until: str = "", format: str = "text",
+) -> str:
+    """Get offer price discovery per category: offer percentiles, offer-to-asking ratios and daily offer volume.
+    
+    Figures come from running rollups by offer date, so any window is
+    answered without scanning listings. Percentiles are nearest-rank and within 1%,
+    and a lone offer reads back exactly.
+    
+    Args:
+        category: Only report this category (empty for all)
+        days: Window length in days, ending at until (default 30)
+        since: First offer date to include, YYYY-MM-DD (overrides days)
+        until: Last offer date to include, YYYY-MM-DD (default: the latest offer)
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        first, last = parse_day(since, "since"), parse_day(until, "until")
+        if first is None and days < 1:
+            return error_response(format, "days must be at least 1.")
+        if first is not None and last is not None and first > last:
+            return error_response(format, "since must not be after until.")
+        # The catalog may be behind a lock or another process; keep the event loop free
+        report = await asyncio.to_thread(CATALOG.offer_report, category, days, first, last)
+        
+        if format == "json":
+            return dumps(report)
+        
+        scope = f" in {category}" if category else ""
+        if not report["offers"]:
+            return f"No offers{scope} dated {report['since']} to {report['until']}."
+        
+        result = f"""
+📈 Offer Analytics{scope}: {report['since']} to {report['until']}
+
+💰 Offers: {report['offers']}
+💸 Offer p50 / p90: {format_money(report['offer_p50'])} / {format_money(report['offer_p90'])} (avg {format_money(report['avg_offer'])})
+🏷️ Offer-to-asking p50 / p90: {format_ratio(report['ratio_p50'])} / {format_ratio(report['ratio_p90'])} (avg {format_ratio(report['avg_ratio'])})
+
+📂 By Category:
+"""
+        
+        for row in report["categories"]:
+            result += (f"• {row['category']}: {row['offers']} offers, p50 {format_money(row['offer_p50'])}, "
+                       f"p90 {format_money(row['offer_p90'])}, {format_ratio(row['ratio_p50'])} of asking\n")
+        
+        daily = report["daily"]
+        result += "\n📅 Daily Offers"
+        if len(daily) > OFFER_REPORT_TEXT_DAYS:
+            result += f" (latest {OFFER_REPORT_TEXT_DAYS} of {len(daily)} days with offers)"
+        result += ":\n"
+        for day, offers in daily[-OFFER_REPORT_TEXT_DAYS:]:
+            result += f"• {day}: {offers}\n"
+        
+        return result
+        
+    except Exception as e:
+        return error_response(format, f"Error generating offer analytics: {str(e)}")
+
+def today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
 
-# HTML for the homepage
-async def homepage(request: Request) -> HTMLResponse:
-    html_content = """
+def offer_problem(item: Optional[Dict[str, Any]], item_id: str, buyer: str, amount: Any) -> Optional[str]:
+    """Why an offer cannot be placed on a listing, or None if it can."""
+    if not item:
+        return f"Item with ID '{item_id}' not found."
+    if item["status"] != "active":
+        return f"Item '{item['title']}' is not accepting offers (status: {item['status']})."
+    if not buyer:
+        return "A buyer name is required."
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+        return "Offer amount must be a positive number."
+    return None
+
+async def queue_offer(item_id: str, buyer: str, amount: int, message: str) -> Tuple[Optional[str], Any]:
+    """Validate an offer and queue it for the next group commit.
+    
+    Returns (error, None) if the offer is rejected, else (None, future) for
+    its commit. The listing lock is held only while validating and queueing,
+    so a burst of bids on one listing still commits in shared batches.
+    """
+    async with ITEM_LOCKS.hold(item_id):
+        problem = offer_problem(await asyncio.to_thread(CATALOG.get, item_id), item_id, buyer, amount)
+        if problem:
+            return problem, None
+        offer = {"buyer": buyer, "amount": amount, "message": message, "date": today()}
+        return None, WRITES.submit(("offer", item_id, offer))
+
+@mcp.tool()
+@METRICS.instrument
+async def create_listing(
+    title: str,
+    description: str,
+    category: str,
+    condition: str,
+    asking_price: int,
+    seller: str,
+    location: str,
+    images: Optional[List[str]] = None,
+    format: str = "text",
+) -> str:
+    """Create a new listing in the marketplace.
+    
+    Args:
+        title: Short title of the item
+        description: Full description of the item
+        category: Category name (e.g., "Electronics", "Furniture")
+        condition: Condition of the item (e.g., "Like New", "Good", "Fair")
+        asking_price: Asking price in dollars
+        seller: Name of the seller
+        location: Where the item can be picked up
+        images: Optional image file names
+        format: "text" for readable output, "json" for the new record
+    """
+    try:
+        check_format(format)
+        if not title or not seller:
+            return error_response(format, "A title and a seller are required.")
+        if asking_price <= 0:
+            return error_response(format, "Asking price must be positive.")
+        
+        item = {
+            # Waits for the catalog when it is still being restored at startup
+            "id": await asyncio.to_thread(CATALOG.next_id),
+            "title": title,
+            "description": description,
+            "category": category,
+            "condition": condition,
+            "seller": seller,
+            "seller_rating": 0.0,
+            "location": location,
+            "posted_date": today(),
+            "images": list(images or []),
+            "offers": [],
+            "asking_price": asking_price,
+            "status": "active",
+        }
+        async with ITEM_LOCKS.hold(item["id"]):
+            await WRITES.write(("put", item))
+        
+        if format == "json":
+            return dumps(detail_record(item))
+        return f"✅ Listing created: {title}\n🆔 ID: {item['id']}\n💰 Asking: ${asking_price}\n📂 {category}"
+    
+    except Exception as e:
+        return error_response(format, f"Error creating listing: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def place_offer(item_id: str, buyer: str, amount: int, message: str = "", format: str = "text") -> str:
+    """Make an offer on an active listing.
+    
+    Args:
+        item_id: The ID of the item
+        buyer: Name of the buyer making the offer
+        amount: Offer amount in dollars
+        message: Optional message to the seller
+        format: "text" for readable output, "json" for the new offer
+    """
+    try:
+        check_format(format)
+        problem, committed = await queue_offer(item_id, buyer, amount, message)
+        if problem:
+            return error_response(format, problem)
+        await committed
+        
+        if format == "json":
+            return dumps({"item_id": item_id, "buyer": buyer, "amount": amount, "message": message, "date": today()})
+        return f"✅ Offer placed on item {item_id}\n💰 ${amount} from {buyer}"
+    
+    except Exception as e:
+        return error_response(format, f"Error placing offer: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def accept_offer(item_id: str, buyer: str, amount: int = 0, format: str = "text") -> str:
+    """Accept a buyer's offer and mark the listing as sold.
+    
+    Args:
+        item_id: The ID of the item
+        buyer: The buyer whose offer to accept
+        amount: Which of the buyer's offers to accept (default: their highest)
+        format: "text" for readable output, "json" for the updated record
+    """
+    try:
+        check_format(format)
+        async with ITEM_LOCKS.hold(item_id):
+            # Offers queued before this call must land before the listing is rewritten
+            await WRITES.settle(item_id)
+            for _ in range(ACCEPT_OFFER_ATTEMPTS):
+                version, item = await asyncio.to_thread(load_item, item_id)
+                
+                if not item:
+                    return error_response(format, f"Item with ID '{item_id}' not found.")
+                if item["status"] != "active":
+                    return error_response(format, f"Item '{item['title']}' is not accepting offers (status: {item['status']}).")
+                
+                # Offer books are ordered best-first, so the first match is the buyer's highest
+                offer = next((offer for offer in item["offers"]
+                              if offer["buyer"] == buyer and (not amount or offer["amount"] == amount)), None)
+                if offer is None:
+                    return error_response(format, f"No matching offer from '{buyer}' on '{item['title']}'.")
+                
+                sold = dict(item, offers=list(item["offers"]), status="sold", sold_to=buyer, sold_price=offer["amount"])
+                try:
+                    # Only written if the listing is still as read: with --workers,
+                    # other processes may write it despite the listing lock
+                    await WRITES.write(("put", sold, version))
+                    break
+                except WriteConflict:
+                    continue
+            else:
+                return error_response(format, f"Item '{item_id}' kept changing; try accepting again.")
+        
+        if format == "json":
+            return dumps(detail_record(sold))
+        return f"🤝 Sold: {item['title']}\n💰 ${offer['amount']} to {buyer} (asked ${item['asking_price']})"
+    
+    except Exception as e:
+        return error_response(format, f"Error accepting offer: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def bulk_place_offers(offers: List[Dict[str, Any]], format: str = "text") -> str:
+    """Place several offers in one call. Each offer succeeds or fails on its own.
+    
+    Args:
+        offers: Offers as objects with "item_id", "buyer", "amount" and optional "message"
+        format: "text" for readable output, "json" for per-offer results
+    """
+    try:
+        check_format(format)
+        if not offers:
+            return error_response(format, "No offers given.")
+        
+        queued = []
+        for entry in offers:
+            queued.append(await queue_offer(str(entry.get("item_id", "")), entry.get("buyer", ""),
+                                            entry.get("amount"), entry.get("message", "")))
+        # Every offer is queued before any is awaited, so they share commits
+        outcomes = await asyncio.gather(*(committed for _, committed in queued if committed is not None),
+                                        return_exceptions=True)
+        
+        results = []
+        outcome = iter(outcomes)
+        for entry, (problem, committed) in zip(offers, queued):
+            if committed is not None:
+                error = next(outcome)
+                problem = f"Error placing offer: {error}" if error is not None else None
+            results.append({"item_id": str(entry.get("item_id", "")), "placed": problem is None, "error": problem})
+        placed = sum(result["placed"] for result in results)
+        
+        if format == "json":
+            return dumps({"placed": placed, "results": results})
+        
+        result = f"📨 Placed {placed} of {len(results)} offers\n\n"
+        for i, (entry, outcome) in enumerate(zip(offers, results)):
+            if outcome["placed"]:
+                result += f"{i+1}. ✅ Item {outcome['item_id']}: ${entry['amount']} from {entry['buyer']}\n"
+            else:
+                result += f"{i+1}. ❌ Item {outcome['item_id']}: {outcome['error']}\n"
+        
+        return result
+    
+    except Exception as e:
+        return error_response(format, f"Error placing offers: {str(e)}")
+
+def watch_session(ctx: Optional[Context]) -> Any:
+    """The client session a watch belongs to; watch events are sent to it."""
+    if ctx is None:
+        raise ValueError("Watching needs a client session")
+    sessions = CONNECTION_SESSIONS.get()
+    if sessions is not None:
+        sessions.add(ctx.session)
+    return ctx.session
+
+def watch_reply(watch_id: str, watching: str, format: str) -> str:
+    if format == "json":
+        return dumps({"watch_id": watch_id, "watching": watching, "logger": WATCH_LOGGER})
+    return (
+        f"👀 Watching {watching}\n"
+        f"🔔 Watch ID: {watch_id}\n"
+        f"Events arrive as log notifications from '{WATCH_LOGGER}' until you call unwatch."
+    )
+
+@mcp.tool()
+@METRICS.instrument
+async def watch_item(item_id: str, format: str = "text", ctx: Context = None) -> str:
+    """Get notified of new offers, price changes and status changes (e.g. sold) on a listing, instead of polling it.
+    
+    Events are sent on this session as log message notifications carrying the
+    watch ID. A session that does not keep up with its events is dropped.
+    
+    Args:
+        item_id: The ID of the item to watch
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        session = watch_session(ctx)
+        item = await asyncio.to_thread(CATALOG.get, item_id)
+        if not item:
+            return error_response(format, f"Item with ID '{item_id}' not found.")
+        
+        watch_id = FEED.watch_item(session, item_id)
+        return watch_reply(watch_id, f"'{item['title']}' (ID: {item_id})", format)
+        
+    except Exception as e:
+        return error_response(format, f"Error watching item: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def watch_search(
+    query: str = "",
+    category: str = "",
+    max_price: int = 0,
+    near: str = "",
+    radius_km: float = 0,
+    format: str = "text",
+    ctx: Context = None,
+) -> str:
+    """Get notified of new listings matching a search, and of new offers, price and status changes on matches.
+    
+    Takes the same filters as search_items. Events are sent on this session
+    as log message notifications carrying the watch ID.
+    
+    Args:
+        query: Search terms for item title/description. Every term must appear inside a word;
+            with several terms, "term*" must start one instead. A single term is always
+            matched as written, so "c++*" finds "c++*". A blank query matches every item.
+        category: Filter by category (Electronics, Furniture, Sports, etc.)
+        max_price: Maximum asking price filter
+        near: Only items near this location, as "City, ST" or "lat,lon"
+        radius_km: Distance from near to watch within (default: 50 km)
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        session = watch_session(ctx)
+        filters = normalize_search(query, category, max_price, near, radius_km)
+        
+        watch_id = FEED.watch_search(session, filters)
+        described = ", ".join(part for part in (
+            f"'{query}'" if query.strip() else "",
+            f"in {category}" if category.strip() else "",
+            f"up to ${max_price}" if max_price > 0 else "",
+            f"within {filters[4]:g} km of {near}" if filters[3] else "",
+        ) if part)
+        return watch_reply(watch_id, f"search {described}" if described else "all listings", format)
+        
+    except Exception as e:
+        return error_response(format, f"Error watching search: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def unwatch(watch_id: str, format: str = "text", ctx: Context = None) -> str:
+    """Stop a watch started with watch_item or watch_search.
+    
+    Args:
+        watch_id: The watch ID returned when the watch was started
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        if not FEED.unwatch(watch_session(ctx), watch_id):
+            return error_response(format, f"No watch '{watch_id}' on this session.")
+        
+        if format == "json":
+            return dumps({"unwatched": watch_id})
+        return f"🔕 Stopped watch {watch_id}"
+        
+    except Exception as e:
+        return error_response(format, f"Error stopping watch: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def import_catalog(file: str, format: str = "text") -> str:
+    """Load listings from a JSONL file (one listing per line) in the server's data directory.
+    
+    Listings replace existing listings with the same ID. Indexes are rebuilt
+    once the whole file has been read.
+    
+    Args:
+        file: Name of the file inside the data directory
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        path = data_path(file)
+        # Always heavy enough for the worker pool, whatever the catalog size
+        count = await EXECUTOR.run(import_file, CATALOG, path, cost=EXECUTOR.cost_threshold)
+        total = CATALOG.stats_snapshot().total_items
+        
+        if format == "json":
+            return dumps({"imported": count, "total_items": total})
+        return f"📥 Imported {count} listings from {file}\n📦 Total Items: {total}"
+        
+    except Exception as e:
+        return error_response(format, f"Error importing catalog: {str(e)}")
+
+@mcp.tool()
+@METRICS.instrument
+async def export_catalog(file: str, format: str = "text") -> str:
+    """Write every listing to a JSONL file in the server's data directory.
+    
+    The export is a consistent snapshot of the catalog; reads and writes
+    carry on while it runs.
+    
+    Args:
+        file: Name of the file inside the data directory
+        format: "text" for readable output, "json" for a compact JSON object
+    """
+    try:
+        check_format(format)
+        path = data_path(file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = await EXECUTOR.run(export_file, CATALOG, path, cost=EXECUTOR.cost_threshold)
+        
+        if format == "json":
+            return dumps({"exported": count, "file": file})
+        return f"📤 Exported {count} listings to {file}"
+        
+    except Exception as e:
+        return error_response(format, f"Error exporting catalog: {str(e)}")
+
+# HTML for the homepage; the stat cards are filled in by render_homepage()
+HOMEPAGE_TEMPLATE = Template("""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -423,19 +1269,19 @@ async def homepage(request: Request) -> HTMLResponse:
             
             <div class="stats">
                 <div class="stat-card">
-                    <div class="stat-number">5</div>
-                    <div class="stat-label">Active Listings</div>
+                    <div class="stat-number">${listings}</div>
+                    <div class="stat-label">Listings</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">12</div>
+                    <div class="stat-number">${offers}</div>
                     <div class="stat-label">Total Offers</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">4</div>
+                    <div class="stat-number">${categories}</div>
                     <div class="stat-label">Categories</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">$513</div>
+                    <div class="stat-number">$$${avg_asking}</div>
                     <div class="stat-label">Avg. Asking Price</div>
                 </div>
             </div>
@@ -444,12 +1290,16 @@ async def homepage(request: Request) -> HTMLResponse:
                 <h3>🔧 Available Tools:</h3>
                 <div class="tool">
                     <div class="tool-name">search_items</div>
-                    <div class="tool-desc">Search for items by keyword, category, or price range</div>
+                    <div class="tool-desc">Search for items by keyword, category, price range, or distance</div>
                 </div>
                 <div class="tool">
                     <div class="tool-name">get_item_details</div>
                     <div class="tool-desc">Get detailed information about a specific item including all offers</div>
                 </div>
+                <div class="tool">
+                    <div class="tool-name">get_items</div>
+                    <div class="tool-desc">Fetch details for several items in one call</div>
+                </div>
                 <div class="tool">
                     <div class="tool-name">get_offers_for_item</div>
                     <div class="tool-desc">View all offers for a specific item, sorted by amount</div>
@@ -462,6 +1312,46 @@ async def homepage(request: Request) -> HTMLResponse:
                     <div class="tool-name">get_marketplace_stats</div>
                     <div class="tool-desc">View overall marketplace statistics and trends</div>
                 </div>
+                <div class="tool">
+                    <div class="tool-name">get_offer_analytics</div>
+                    <div class="tool-desc">Offer percentiles, offer-to-asking ratios and daily volume per category</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">create_listing</div>
+                    <div class="tool-desc">Post a new item for sale</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">place_offer</div>
+                    <div class="tool-desc">Make an offer on an active listing</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">accept_offer</div>
+                    <div class="tool-desc">Accept a buyer's offer and mark the item as sold</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">bulk_place_offers</div>
+                    <div class="tool-desc">Place many offers in a single call</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">watch_item</div>
+                    <div class="tool-desc">Get pushed new offers and price changes on a listing</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">watch_search</div>
+                    <div class="tool-desc">Get pushed new listings and changes matching a search</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">unwatch</div>
+                    <div class="tool-desc">Stop a watch</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">import_catalog</div>
+                    <div class="tool-desc">Load listings from a JSONL file</div>
+                </div>
+                <div class="tool">
+                    <div class="tool-name">export_catalog</div>
+                    <div class="tool-desc">Snapshot all listings to a JSONL file</div>
+                </div>
             </div>
             
             <div style="text-align: center; margin-top: 30px;">
@@ -533,36 +1423,217 @@ async def homepage(request: Request) -> HTMLResponse:
         </script>
     </body>
     </html>
-    """
-    return HTMLResponse(html_content)
+    """)
+
+def render_homepage() -> str:
+    stats = CATALOG.stats_snapshot()
+    return HOMEPAGE_TEMPLATE.substitute(
+        listings=f"{stats.total_items:,}",
+        offers=f"{stats.total_offers:,}",
+        categories=f"{len(stats.category_items):,}",
+        avg_asking=f"{stats.avg_asking:,.0f}",
+    )
+
+# The homepage re-renders only when the catalog generation moves on; between
+# changes every request is served the same pre-encoded bytes
+HOMEPAGE = PageCache(render_homepage)
+
+def accepted_encodings(request: Request) -> Set[str]:
+    """Content codings the client accepts, ignoring any it gives q=0."""
+    accepted = {"identity"}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        try:
+            q = float(value) if name.strip().lower() == "q" else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def not_modified(request: Request, page: EncodedPage) -> bool:
+    """Whether the client's cached copy, per If-None-Match or If-Modified-Since, is current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" and "x" name the same content
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or page.etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(page.rendered_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def homepage(request: Request) -> Response:
+    page = HOMEPAGE.get(CATALOG.generation)
+    headers = {
+        "ETag": page.etag,
+        "Last-Modified": page.last_modified,
+        # Cacheable, but revalidated on every use since listings change at any time
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if not_modified(request, page):
+        return Response(status_code=304, headers=headers)
+    accepted = accepted_encodings(request)
+    encoding = next(encoding for encoding in page.bodies if encoding in accepted)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(page.bodies[encoding], media_type="text/html; charset=utf-8", headers=headers)
+
+async def cache_stats(request: Request) -> JSONResponse:
+    """Hit/miss counters and sizes of the fragment and search-result caches."""
+    return JSONResponse({"fragments": FRAGMENTS.stats(), "search_results": SEARCH_RESULTS.stats()})
+
+async def startup_stats(request: Request) -> JSONResponse:
+    """Seconds from process start to each startup milestone, and where the catalog came from."""
+    return JSONResponse(STARTUP.stats())
+
+async def metrics(request: Request) -> Response:
+    """Tool metrics plus catalog, cache and write queue figures, in Prometheus text format."""
+    extra = [
+        ("catalog_items", "gauge", "Listings in the catalog.", {}, len(CATALOG)),
+        ("catalog_generation", "gauge", "Catalog generation, bumped on every change.", {}, CATALOG.generation),
+        ("executor_pending", "gauge", "Heavy tool calls waiting for or holding a worker.", {}, EXECUTOR.pending),
+        ("write_queue_pending", "gauge", "Writes queued for the next batch.", {}, WRITES.stats()["pending"]),
+        ("write_batches_total", "counter", "Write batches committed.", {}, WRITES.batches),
+        ("writes_total", "counter", "Writes committed.", {}, WRITES.writes),
+    ]
+    extra += [
+        ("startup_seconds", "gauge", "Seconds from process start to a startup milestone.", {"phase": phase}, seconds)
+        for phase, seconds in STARTUP.phases.items()
+    ]
+    feed = FEED.stats()
+    extra += [
+        ("watch_sessions", "gauge", "Sessions holding watches.", {}, feed["sessions"]),
+        ("watches", "gauge", "Active watch_item and watch_search watches.", {}, feed["watches"]),
+        ("watch_events_total", "counter", "Watch events delivered.", {}, feed["delivered"]),
+        ("watch_dropped_total", "counter", "Sessions dropped for falling behind on watch events.", {}, feed["dropped_slow"]),
+    ]
+    for field, kind, help_text in (
+        ("entries", "gauge", "Cache entries."),
+        ("hits", "counter", "Cache hits."),
+        ("misses", "counter", "Cache misses."),
+    ):
+        for cache, stats in (("fragments", FRAGMENTS.stats()), ("search_results", SEARCH_RESULTS.stats())):
+            extra.append((f"cache_{field}" + ("_total" if kind == "counter" else ""), kind, help_text,
+                          {"cache": cache}, stats[field]))
+    return Response(METRICS.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Create Starlette application with SSE transport
 def create_starlette_app(mcp_server: Server, *, debug: bool = False) -> Starlette:
     """Create a Starlette application that can serve the provided mcp server with SSE."""
-    sse = SseServerTransport("/messages/")
-
-    async def handle_sse(request: Request) -> None:
-        async with sse.connect_sse(
-                request.scope,
-                request.receive,
-                request._send,
-        ) as (read_stream, write_stream):
-            await mcp_server.run(
-                read_stream,
-                write_stream,
-                mcp_server.create_initialization_options(),
-            )
+    # Each worker hands out its own message path, so any worker can tell
+    # which one owns a session and pass the POST on to it
+    sse = SseServerTransport("/messages/" if WORKER is None else f"/messages/{WORKER}/")
+    router = MessageRouter(WORKER, os.environ[RUN_DIR_ENV], sse.handle_post_message) if WORKER is not None else None
+
+    async def handle_sse(request: Request) -> Response:
+        # Tool calls on this connection run in tasks that inherit this context
+        sessions: Set[Any] = set()
+        token = CONNECTION_SESSIONS.set(sessions)
+        try:
+            async with sse.connect_sse(
+                    request.scope,
+                    request.receive,
+                    request._send,
+            ) as (read_stream, write_stream):
+                await mcp_server.run(
+                    read_stream,
+                    write_stream,
+                    mcp_server.create_initialization_options(),
+                )
+        finally:
+            CONNECTION_SESSIONS.reset(token)
+            for session in sessions:
+                FEED.close_session(session)
+        # The stream has already been answered; Starlette still needs a response object
+        return Response()
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        async def audit_stats() -> None:
+            while True:
+                await asyncio.sleep(STATS_AUDIT_INTERVAL)
+                await EXECUTOR.run(CATALOG.verify_stats, cost=len(CATALOG))
+
+        async def follow_snapshot() -> None:
+            while True:
+                await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+                if CATALOG.changed():
+                    await asyncio.to_thread(CATALOG.refresh)
+
+        # Workers share one catalog, so only the first one asks for audits
+        tasks = [asyncio.create_task(audit_stats())] if not WORKER else []
+        if WORKER is not None:
+            tasks.append(asyncio.create_task(follow_snapshot()))
+        STARTUP.mark("app_started")
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+            if router is not None:
+                await router.close()
+            await FEED.close()
+            await WRITES.close()
+            EXECUTOR.shutdown()
 
     return Starlette(
         debug=debug,
+        lifespan=lifespan,
+        middleware=[Middleware(FirstResponseMiddleware, report=STARTUP)],
         routes=[
             Route("/", endpoint=homepage),
+            Route("/stats/cache", endpoint=cache_stats),
+            Route("/stats/startup", endpoint=startup_stats),
+            Route("/metrics", endpoint=metrics),
             Route("/sse", endpoint=handle_sse),
-            Mount("/messages/", app=sse.handle_post_message),
+            Route("/messages/{worker:int}/", endpoint=router) if router is not None
+            else Mount("/messages/", app=sse.handle_post_message),
         ],
     )
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Used Goods Marketplace MCP Server")
+    parser.add_argument("command", nargs="?", default="serve", choices=("serve", "import", "export", "snapshot"),
+                        help="run the server (default), import/export the catalog as JSONL, "
+                             "or write an index snapshot for MARKETPLACE_INDEX_SNAPSHOT")
+    parser.add_argument("path", nargs="?",
+                        help='JSONL file to import or export, "-" for stdin/stdout; snapshot directory')
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MARKETPLACE_WORKERS", "1")),
+                        help="server processes sharing one catalog snapshot (default: 1)")
+    
+    if WORKER is not None:
+        # Started by serve_workers() below, with the listening socket inherited
+        run_worker(create_starlette_app(mcp._mcp_server, debug=True), WORKER)
+        sys.exit(0)
+    
+    args = parser.parse_args()
+    
+    if args.command != "serve":
+        if not args.path:
+            parser.error(f"{args.command} needs a " + ("directory" if args.command == "snapshot" else "JSONL file path"))
+        if args.command == "import":
+            count = import_file(CATALOG, args.path)
+            print(f"📥 Imported {count} listings ({CATALOG.stats_snapshot().total_items} total)", file=sys.stderr)
+        elif args.command == "snapshot":
+            count = save_snapshot(CATALOG, args.path)
+        else:
+            count = export_file(CATALOG, args.path)
+            print(f"📤 Exported {count} listings", file=sys.stderr)
+        CATALOG.store.close()
+        if args.command == "snapshot":
+            # Stamped only now: seeding and closing the store both touch its files
+            write_manifest(args.path, dict(read_manifest(args.path), source=catalog_source()))
+            print(f"🗂️ Wrote an index snapshot of {count} listings to {args.path}", file=sys.stderr)
+        sys.exit(0)
+    
     # Get the MCP server from FastMCP
     mcp_server = mcp._mcp_server
     
@@ -570,14 +1641,35 @@ if __name__ == "__main__":
     starlette_app = create_starlette_app(mcp_server, debug=True)
     
     print("🛒 Starting Used Goods Marketplace MCP Server...")
-    print("📍 Homepage: http://localhost:8080")
-    print("🔗 SSE Endpoint: http://localhost:8080/sse")
-    print("📡 Messages: http://localhost:8080/messages/")
+    print(f"📍 Homepage: http://localhost:{args.port}")
+    print(f"🔗 SSE Endpoint: http://localhost:{args.port}/sse")
+    print(f"📡 Messages: http://localhost:{args.port}/messages/")
+    print(f"📈 Metrics: http://localhost:{args.port}/metrics")
+    print(f"⏱️ Startup report: http://localhost:{args.port}/stats/startup")
+    if args.workers > 1:
+        print(f"🧵 Workers: {args.workers} processes sharing one catalog snapshot")
     print("\n🏪 Available marketplace tools:")
-    print("  • search_items - Search by keyword, category, or price")
+    print("  • search_items - Search by keyword, category, price, or distance")
     print("  • get_item_details - Get full item details with offers")
+    print("  • get_items - Get details for several items at once")
     print("  • get_offers_for_item - View all offers for an item")
     print("  • list_categories - Show all categories")
     print("  • get_marketplace_stats - Marketplace overview")
+    print("  • get_offer_analytics - Offer percentiles and volume over time")
+    print("  • create_listing - Post a new item for sale")
+    print("  • place_offer - Make an offer on a listing")
+    print("  • accept_offer - Accept an offer and mark the item sold")
+    print("  • bulk_place_offers - Place many offers at once")
+    print("  • watch_item - Get pushed offers and price changes on a listing")
+    print("  • watch_search - Get pushed listings and changes matching a search")
+    print("  • unwatch - Stop a watch")
+    print("  • import_catalog - Load listings from a JSONL file")
+    print("  • export_catalog - Snapshot listings to a JSONL file")
     
-    uvicorn.run(starlette_app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    if args.workers > 1:
+        serve_workers(CATALOG, [sys.executable, os.path.abspath(__file__)], args.workers, args.host, args.port,
+                      snapshot_dir=os.environ.get(SNAPSHOT_DIR_ENV))
+    else:
+        # Only the serve command needs it; workers import their own in run_worker()
+        import uvicorn
+        uvicorn.run(starlette_app, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,913 @@
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+import heapq
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from catalog import (SCORE_SCALE, TITLE_WEIGHT, Catalog, CatalogStats, Signals, SortKey, bm25_scores, check_sort,
+                     copy_listing, listing_signals, page_keys, query_terms, relevance_key, static_score,
+                     tokenize)
+from geo import Point, cell_code, covering_cells, distance_km, geocode
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# First and last bytes of every segment file; bump the digits when the layout changes
+SEGMENT_MAGIC = b"MKTSEG02"
+
+# Names the live segments, oldest first, with the generation and totals they add up to
+MANIFEST_NAME = "manifest.json"
+
+# Marks a directory as a SnapshotPublisher's own, so a later publisher may clear it
+PUBLISHER_MARKER = "publisher.owner"
+
+# Segments with at most this many listings are looked up through a dict
+# built on first use; larger ones bisect their sorted ID table
+SMALL_SEGMENT = 50_000
+
+# A listing as a segment stores it: (record, catalog sequence number, version)
+Entry = Tuple[Dict[str, Any], int, int]
+
+
+class _Strings:
+    """Sequence view of strings packed into one UTF-8 blob, so bisect works on it."""
+
+    def __init__(self, data: memoryview, offsets: memoryview) -> None:
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._data[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+    def raw(self, i: int) -> bytes:
+        return self._data[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+
+class _Permuted:
+    """Sequence view of another sequence read through a permutation."""
+
+    def __init__(self, values: Any, order: memoryview) -> None:
+        self._values = values
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i: int) -> Any:
+        return self._values[self._order[i]]
+
+
+class _SegmentWriter:
+    """Appends 8-byte aligned arrays to a segment file and records where each one went."""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+        self.arrays: Dict[str, List[Any]] = {}  # name -> [offset, typecode, length]
+        f.write(SEGMENT_MAGIC)
+        self.offset = len(SEGMENT_MAGIC)
+
+    def begin(self, name: str, typecode: str) -> None:
+        self.f.write(b"\0" * (-self.offset % 8))
+        self.offset += -self.offset % 8
+        self.arrays[name] = [self.offset, typecode, 0]
+
+    def extend(self, name: str, data: Any) -> None:
+        view = memoryview(data)
+        self.f.write(view)
+        self.offset += view.nbytes
+        self.arrays[name][2] += len(view)
+
+    def add(self, name: str, typecode: str, data: Any) -> None:
+        self.begin(name, typecode)
+        self.extend(name, data)
+
+    def add_strings(self, name: str, values: Iterable[str]) -> None:
+        offsets = array("Q", [0])
+        self.begin(f"{name}_data", "B")
+        for value in values:
+            encoded = value.encode("utf-8")
+            self.extend(f"{name}_data", encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        self.add(f"{name}_offsets", "Q", offsets)
+
+    def finish(self, meta: Dict[str, Any]) -> None:
+        meta["arrays"] = self.arrays
+        encoded = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        self.f.write(encoded)
+        self.f.write(struct.pack("<Q", len(encoded)))
+        self.f.write(SEGMENT_MAGIC)
+
+
+def write_segment(
+    path: str, entries: Iterable[Entry], generation: int,
+    tombstones: Iterable[str] = (), changes: Iterable[List[Any]] = (),
+) -> int:
+    """Write listings, in ascending sequence order, and their indexes as a segment file.
+
+    Records are streamed to the file as they arrive; the index arrays are
+    built alongside and written at the end. The file is written under a
+    temporary name and moved into place. Returns the number of listings.
+    """
+    ids: List[str] = []
+    seqs, versions, prices = array("Q"), array("Q"), array("d")
+    category_codes = array("I")
+    categories: Dict[str, int] = {}  # lowercased category -> code
+    lats, lons = array("d"), array("d")
+    ratings, posted_dates, heats = array("d"), array("q"), array("d")
+    lengths = array("I")
+    postings: Dict[str, Tuple[array, array]] = {}  # token -> (positions, weights)
+
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        out = _SegmentWriter(f)
+        record_offsets = array("Q", [0])
+        out.begin("record_data", "B")
+        for position, (item, seq, version) in enumerate(entries):
+            encoded = dumps(item).encode("utf-8")
+            out.extend("record_data", encoded)
+            record_offsets.append(record_offsets[-1] + len(encoded))
+            ids.append(item["id"])
+            seqs.append(seq)
+            versions.append(version)
+            prices.append(item["asking_price"])
+            category_codes.append(categories.setdefault(item["category"].lower(), len(categories)))
+            point = geocode(item["location"])
+            lats.append(point[0] if point is not None else math.nan)
+            lons.append(point[1] if point is not None else math.nan)
+            rating, posted, heat = listing_signals(item)
+            ratings.append(rating)
+            posted_dates.append(posted)
+            heats.append(heat)
+            # Same weighting as TextIndex.add()
+            weights: Dict[str, int] = {}
+            for token in tokenize(item["title"]):
+                weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+            for token in tokenize(item["description"]):
+                weights[token] = weights.get(token, 0) + 1
+            lengths.append(sum(weights.values()))
+            for token, weight in weights.items():
+                token_postings = postings.get(token)
+                if token_postings is None:
+                    token_postings = postings[token] = (array("I"), array("I"))
+                token_postings[0].append(position)
+                token_postings[1].append(weight)
+        out.add("record_offsets", "Q", record_offsets)
+        del record_offsets
+        count = len(ids)
+
+        out.add_strings("id", ids)
+        out.add("id_order", "I", array("I", sorted(range(count), key=ids.__getitem__)))
+        del ids
+        out.add("seq", "Q", seqs)
+        out.add("version", "Q", versions)
+        out.add("price", "d", prices)
+        price_order = array("I", sorted(range(count), key=prices.__getitem__))
+        out.add("price_order", "I", price_order)
+        out.add("price_sorted", "d", array("d", (prices[position] for position in price_order)))
+        del price_order
+        out.add("rating", "d", ratings)
+        out.add("posted", "q", posted_dates)
+        out.add("heat", "d", heats)
+
+        # Category postings, each in position (so catalog) order
+        category_names = sorted(categories, key=categories.__getitem__)
+        by_category: List[array] = [array("I") for _ in category_names]
+        for position, code in enumerate(category_codes):
+            by_category[code].append(position)
+        out.add("category", "I", category_codes)
+        category_offsets = array("Q", [0])
+        out.begin("category_positions", "I")
+        for positions in by_category:
+            out.extend("category_positions", positions)
+            category_offsets.append(category_offsets[-1] + len(positions))
+        out.add("category_offsets", "Q", category_offsets)
+        del by_category
+
+        # Text: sorted tokens with their postings, and every distinct token
+        # suffix with the tokens it ends, as TextIndex keeps them
+        tokens = sorted(postings)
+        out.add_strings("token", tokens)
+        posting_offsets = array("Q", [0])
+        out.begin("posting_positions", "I")
+        for token in tokens:
+            out.extend("posting_positions", postings[token][0])
+            posting_offsets.append(posting_offsets[-1] + len(postings[token][0]))
+        out.begin("posting_weights", "I")
+        for token in tokens:
+            out.extend("posting_weights", postings.pop(token)[1])
+        out.add("posting_offsets", "Q", posting_offsets)
+        out.add("text_length", "I", lengths)
+        suffix_owners: Dict[str, array] = {}
+        for token_id, token in enumerate(tokens):
+            for i in range(len(token)):
+                suffix_owners.setdefault(token[i:], array("I")).append(token_id)
+        suffixes = sorted(suffix_owners)
+        out.add_strings("suffix", suffixes)
+        owner_offsets = array("Q", [0])
+        out.begin("suffix_owners", "I")
+        for suffix in suffixes:
+            out.extend("suffix_owners", suffix_owners[suffix])
+            owner_offsets.append(owner_offsets[-1] + len(suffix_owners[suffix]))
+        out.add("suffix_owner_offsets", "Q", owner_offsets)
+        del suffix_owners, suffixes
+
+        # Geo: cell codes of geocoded listings, sorted for range scans
+        cells = sorted((cell_code(lat, lon), position)
+                       for position, (lat, lon) in enumerate(zip(lats, lons)) if not math.isnan(lat))
+        out.add("lat", "d", lats)
+        out.add("lon", "d", lons)
+        out.add("geo_codes", "Q", array("Q", (code for code, _ in cells)))
+        out.add("geo_positions", "I", array("I", (position for _, position in cells)))
+
+        out.finish({
+            "generation": generation,
+            "count": count,
+            "categories": category_names,
+            "tombstones": sorted(set(tombstones)),
+            "changes": list(changes),
+        })
+    os.replace(partial, path)
+    return count
+
+
+class Segment:
+    """A memory-mapped segment file: listings, their indexes and tombstones.
+
+    Every array is a view into the mapping, so processes that map the same
+    file share one copy of it in the page cache.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        size = len(buffer)
+        if buffer[:8] != SEGMENT_MAGIC or buffer[size - 8:] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a catalog segment")
+        meta_length = struct.unpack_from("<Q", buffer, size - 16)[0]
+        meta = json.loads(bytes(buffer[size - 16 - meta_length:size - 16]))
+        self.generation: int = meta["generation"]
+        self.count: int = meta["count"]
+        self.categories: List[str] = meta["categories"]
+        self.tombstones: Set[str] = set(meta["tombstones"])
+        # [generation, kind, item_id, ...] for every change the segment publishes
+        self.changes: List[List[Any]] = meta["changes"]
+        arrays = {}
+        for name, (offset, typecode, length) in meta["arrays"].items():
+            nbytes = length * array(typecode).itemsize
+            arrays[name] = buffer[offset:offset + nbytes].cast(typecode)
+        self._records = _Strings(arrays["record_data"], arrays["record_offsets"])
+        self._ids = _Strings(arrays["id_data"], arrays["id_offsets"])
+        self._id_order = arrays["id_order"]
+        self._ids_sorted = _Permuted(self._ids, self._id_order)
+        self.seq = arrays["seq"]
+        self.version = arrays["version"]
+        self._price = arrays["price"]
+        self._price_order = arrays["price_order"]
+        self._price_sorted = arrays["price_sorted"]
+        self._rating = arrays["rating"]
+        self._posted = arrays["posted"]
+        self._heat = arrays["heat"]
+        self._category = arrays["category"]
+        self._category_positions = arrays["category_positions"]
+        self._category_offsets = arrays["category_offsets"]
+        self._tokens = _Strings(arrays["token_data"], arrays["token_offsets"])
+        self._posting_positions = arrays["posting_positions"]
+        self._posting_weights = arrays["posting_weights"]
+        self._posting_offsets = arrays["posting_offsets"]
+        self.text_length = arrays["text_length"]
+        self._suffixes = _Strings(arrays["suffix_data"], arrays["suffix_offsets"])
+        self._suffix_owners = arrays["suffix_owners"]
+        self._suffix_owner_offsets = arrays["suffix_owner_offsets"]
+        self._lat = arrays["lat"]
+        self._lon = arrays["lon"]
+        self._geo_codes = arrays["geo_codes"]
+        self._geo_positions = arrays["geo_positions"]
+        self._positions: Optional[Dict[str, int]] = None
+        self._static: Tuple[int, List[float]] = (0, [])  # (day ordinal, static_score() per position)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, item_id: str) -> bool:
+        """Whether this segment has a say about the listing: a record or a tombstone."""
+        return item_id in self.tombstones or self.find(item_id) >= 0
+
+    def find(self, item_id: str) -> int:
+        """Position of a listing's record, or -1."""
+        if self.count <= SMALL_SEGMENT:
+            if self._positions is None:
+                self._positions = {self._ids[position]: position for position in range(self.count)}
+            return self._positions.get(item_id, -1)
+        i = bisect_left(self._ids_sorted, item_id)
+        if i < self.count and self._ids_sorted[i] == item_id:
+            return self._id_order[i]
+        return -1
+
+    def item_id(self, position: int) -> str:
+        return self._ids[position]
+
+    def item(self, position: int) -> Dict[str, Any]:
+        return loads(self._records.raw(position))
+
+    def estimate_matches(self, category: str = "", max_price: float = 0) -> int:
+        estimate = self.count
+        if category:
+            estimate = min(estimate, len(self._category_postings(category)))
+        if max_price > 0:
+            estimate = min(estimate, bisect_right(self._price_sorted, max_price))
+        return estimate
+
+    def signals(self, position: int) -> Signals:
+        return self._rating[position], self._posted[position], self._heat[position]
+
+    def static_scores(self, today: int) -> List[float]:
+        """static_score() per position as of today, computed once a day."""
+        day, scores = self._static
+        if day != today:
+            scores = [static_score(self.signals(position), today) for position in range(self.count)]
+            self._static = (today, scores)
+        return scores
+
+    def match_keys(
+        self, scores: Optional[Dict[int, float]], category: str, max_price: float,
+        near: Optional[Point], radius_km: float, sort: str, today: int, hidden: Set[int],
+    ) -> List[Tuple[SortKey, str]]:
+        """Catalog.search_keys() over this segment's listings alone, unsorted.
+
+        Text scores come from the view, which alone knows the BM25 totals;
+        positions in hidden are superseded by newer segments and skipped.
+        """
+        plans: List[Tuple[int, Callable[[], Iterable[int]]]] = []
+        if category:
+            category_positions = self._category_postings(category)
+            plans.append((len(category_positions), lambda: category_positions))
+        if max_price > 0:
+            price_count = bisect_right(self._price_sorted, max_price)
+            plans.append((price_count, lambda: self._price_order[:price_count]))
+        if scores is not None:
+            plans.append((len(scores), lambda: scores))
+        distances = self._within(near, radius_km) if near is not None else None
+        if distances is not None:
+            plans.append((len(distances), lambda: distances))
+
+        seq, ids = self.seq, self._ids
+        static = self.static_scores(today) if sort == "relevance" else []
+        if not plans:
+            if sort == "listed":
+                return [((seq[position],), ids[position]) for position in range(self.count) if position not in hidden]
+            return [((-round(static[position] * SCORE_SCALE), seq[position]), ids[position])
+                    for position in range(self.count) if position not in hidden]
+        size, fetch = min(plans, key=lambda plan: plan[0])
+        if size == 0:
+            return []
+
+        category_code = self.categories.index(category.lower()) if category else -1
+        matches = []
+        for position in fetch():
+            if position in hidden:
+                continue
+            if category and self._category[position] != category_code:
+                continue
+            if max_price > 0 and self._price[position] > max_price:
+                continue
+            if distances is not None and position not in distances:
+                continue
+            if scores is not None and position not in scores:
+                continue
+            if sort == "listed":
+                matches.append(((seq[position],), ids[position]))
+            elif scores is not None:
+                matches.append((relevance_key(scores[position] + static[position], seq[position]), ids[position]))
+            elif distances is not None:
+                matches.append(((round(distances[position] * 1000), seq[position]), ids[position]))
+            else:
+                matches.append((relevance_key(static[position], seq[position]), ids[position]))
+        return matches
+
+    def _category_postings(self, category: str) -> memoryview:
+        try:
+            code = self.categories.index(category.lower())
+        except ValueError:
+            return self._category_positions[:0]
+        return self._category_positions[self._category_offsets[code]:self._category_offsets[code + 1]]
+
+    def term_frequencies(self, term: str, prefix: bool = False) -> Dict[int, int]:
+        """{position: weighted frequency} of one query term, matched as TextIndex.search() matches it."""
+        if prefix:
+            token_ids = self._tokens_with_prefix(term)
+        else:
+            token_ids = self._tokens_containing(term)
+        frequencies: Dict[int, int] = {}
+        for token_id in token_ids:
+            start, stop = self._posting_offsets[token_id], self._posting_offsets[token_id + 1]
+            for position, weight in zip(self._posting_positions[start:stop], self._posting_weights[start:stop]):
+                frequencies[position] = frequencies.get(position, 0) + weight
+        return frequencies
+
+    def _tokens_containing(self, term: str) -> Set[int]:
+        token_ids: Set[int] = set()
+        i = bisect_left(self._suffixes, term)
+        while i < len(self._suffixes) and self._suffixes[i].startswith(term):
+            token_ids.update(self._suffix_owners[self._suffix_owner_offsets[i]:self._suffix_owner_offsets[i + 1]])
+            i += 1
+        return token_ids
+
+    def _tokens_with_prefix(self, prefix: str) -> Set[int]:
+        token_ids: Set[int] = set()
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            token_ids.add(i)
+            i += 1
+        return token_ids
+
+    def _within(self, center: Point, radius_km: float) -> Dict[int, float]:
+        """{position: distance_km} within radius_km of center, as GeoIndex.within() finds them."""
+        found: Dict[int, float] = {}
+        if not len(self._geo_codes) or radius_km <= 0:
+            return found
+        shift_bits, cells = covering_cells(center, radius_km)
+        for prefix in cells:
+            start = bisect_left(self._geo_codes, prefix << shift_bits)
+            stop = bisect_left(self._geo_codes, (prefix + 1) << shift_bits)
+            for position in self._geo_positions[start:stop]:
+                distance = distance_km(center, (self._lat[position], self._lon[position]))
+                if distance <= radius_km:
+                    found[position] = distance
+        return found
+
+
+def visible_entries(segments: List[Segment]) -> Iterator[Tuple[int, int, int]]:
+    """(seq, segment index, position) of every listing not superseded by a newer segment, in catalog order."""
+    def visible(index: int) -> Iterator[Tuple[int, int, int]]:
+        segment, newer = segments[index], segments[index + 1:]
+        for position in range(segment.count):
+            if not newer or not any(segment.item_id(position) in other for other in newer):
+                yield segment.seq[position], index, position
+    return heapq.merge(*(visible(index) for index in range(len(segments))))
+
+
+def merge_segments(paths: List[str], out_path: str, into_base: bool) -> int:
+    """Merge segments, oldest first, into one; the newest record of each listing wins.
+
+    A merge into a base has nothing older beneath it, so tombstones and
+    change entries are dropped; otherwise both are carried over. Returns
+    the number of listings written.
+    """
+    segments = [Segment(path) for path in paths]
+    tombstones: List[str] = []
+    changes: List[List[Any]] = []
+    if not into_base:
+        for index, segment in enumerate(segments):
+            newer = segments[index + 1:]
+            tombstones.extend(item_id for item_id in segment.tombstones
+                              if not any(item_id in other for other in newer))
+            changes.extend(segment.changes)
+    entries = ((segments[index].item(position), seq, segments[index].version[position])
+               for seq, index, position in visible_entries(segments))
+    return write_segment(out_path, entries, max(segment.generation for segment in segments), tombstones, changes)
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    """Replace the manifest atomically, so readers see the old one or the new one."""
+    partial = os.path.join(directory, MANIFEST_NAME + ".partial")
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(partial, os.path.join(directory, MANIFEST_NAME))
+
+
+def stats_totals(stats: CatalogStats) -> Dict[str, Any]:
+    """The running totals as the manifest stores them; CatalogStats.from_totals() reads them back."""
+    return {name: dict(value) if isinstance(value, dict) else value for name, value in vars(stats).items()}
+
+
+def catalog_entries(catalog: Catalog, item_ids: List[str], batch_size: int = 1000) -> Iterator[Entry]:
+    """(record, seq, version) for each listing, loaded from the store a batch at a time."""
+    for start in range(0, len(item_ids), batch_size):
+        batch = item_ids[start:start + batch_size]
+        yield from zip(catalog.get_many(batch), catalog.seqs(batch), catalog.versions(batch))
+
+
+def save_snapshot(catalog: Catalog, directory: str) -> int:
+    """Write the whole catalog as a one-segment snapshot that SnapshotCatalog and Catalog.restore() open.
+
+    Segments of an earlier snapshot in the directory are removed once the new
+    manifest is in place. Returns the number of listings written. Do not
+    write to the catalog meanwhile.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generation = catalog.generation
+    name = f"snapshot-{generation:010d}.seg"
+    count = write_segment(os.path.join(directory, name), catalog_entries(catalog, catalog.listing_ids()), generation)
+    write_manifest(directory, {"generation": generation, "segments": [name], "stats": stats_totals(catalog.stats),
+                               "text": list(catalog.text_totals())})
+    for old in os.listdir(directory):
+        if old.endswith(".seg") and old != name:
+            os.remove(os.path.join(directory, old))
+    return count
+
+
+class SnapshotView:
+    """One published catalog state: its segments, oldest first, and its totals.
+
+    A listing's newest record or tombstone across the segments is the one
+    that counts. Views never change; a newer generation is a new view.
+    """
+
+    def __init__(
+        self, generation: int, segments: List[Segment], stats: CatalogStats, text: Tuple[int, int] = (0, 0),
+    ) -> None:
+        self.generation = generation
+        self.segments = segments
+        self.stats = stats
+        # Catalog.text_totals() at this generation, for BM25
+        self.text = text
+        self._hidden: Optional[List[Set[int]]] = None
+
+    def locate(self, item_id: str) -> Tuple[Optional[Segment], int]:
+        """The segment and position holding a listing's current record, or (None, -1)."""
+        for segment in reversed(self.segments):
+            if item_id in segment.tombstones:
+                return None, -1
+            position = segment.find(item_id)
+            if position >= 0:
+                return segment, position
+        return None, -1
+
+    def get_versioned(self, item_ids: Iterable[str]) -> List[Tuple[Optional[int], Optional[Dict[str, Any]]]]:
+        located = [self.locate(item_id) for item_id in item_ids]
+        return [(segment.version[position], segment.item(position)) if segment is not None else (None, None)
+                for segment, position in located]
+
+    def hidden(self) -> List[Set[int]]:
+        """Per segment, the positions whose listing a newer segment supersedes. Computed on first use."""
+        if self._hidden is None:
+            hidden: List[Set[int]] = [set() for _ in self.segments]
+            for index, segment in enumerate(self.segments[1:], 1):
+                superseding = itertools.chain(segment.tombstones, map(segment.item_id, range(segment.count)))
+                for item_id in superseding:
+                    for older, positions in zip(self.segments[:index], hidden):
+                        position = older.find(item_id)
+                        if position >= 0:
+                            positions.add(position)
+            self._hidden = hidden
+        return self._hidden
+
+    def text_scores(self, query: str) -> List[Dict[int, float]]:
+        """Per segment, {position: BM25 score} of visible listings matching every term.
+
+        Scored as TextIndex.search() scores them: a term's matching count is
+        taken across all segments, so it is the same as in the catalog.
+        """
+        documents, length = self.text
+        average_length = length / documents if documents else 0
+        hidden = self.hidden()
+        scores: List[Optional[Dict[int, float]]] = [None] * len(self.segments)
+        for term, prefix in query_terms(query):
+            frequencies = [
+                {position: frequency for position, frequency in segment.term_frequencies(term, prefix).items()
+                 if position not in segment_hidden}
+                for segment, segment_hidden in zip(self.segments, hidden)
+            ]
+            matching = sum(len(segment_frequencies) for segment_frequencies in frequencies)
+            for index, (segment, segment_frequencies) in enumerate(zip(self.segments, frequencies)):
+                term_scores = bm25_scores(segment_frequencies, segment.text_length, matching, documents, average_length)
+                previous = scores[index]
+                scores[index] = term_scores if previous is None else {
+                    position: score + term_scores[position]
+                    for position, score in previous.items()
+                    if position in term_scores
+                }
+        return [segment_scores or {} for segment_scores in scores]
+
+    def _match_keys(
+        self, query: str, category: str, max_price: float, near: Optional[Point], radius_km: float, sort: str,
+    ) -> List[Tuple[SortKey, str]]:
+        check_sort(sort)
+        scores = self.text_scores(query) if query.strip() else [None] * len(self.segments)
+        today = date.today().toordinal()
+        matches: List[Tuple[SortKey, str]] = []
+        for segment, segment_scores, segment_hidden in zip(self.segments, scores, self.hidden()):
+            matches.extend(segment.match_keys(segment_scores, category, max_price, near, radius_km, sort, today,
+                                              segment_hidden))
+        return matches
+
+    def search_keys(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+    ) -> List[Tuple[SortKey, str]]:
+        matches = self._match_keys(query, category, max_price, near, radius_km, sort)
+        matches.sort()
+        return matches
+
+    def search_page(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+        after: Optional[SortKey] = None, limit: int = 50,
+    ) -> Tuple[List[Tuple[SortKey, str]], int, int]:
+        matches = self._match_keys(query, category, max_price, near, radius_km, sort)
+        page, start = page_keys(matches, after, limit)
+        return page, start, len(matches)
+
+    def estimate_matches(self, category: str = "", max_price: float = 0) -> int:
+        return sum(segment.estimate_matches(category, max_price) for segment in self.segments)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for _, index, position in visible_entries(self.segments):
+            yield self.segments[index].item(position)
+
+    def entries(self) -> Iterator[Entry]:
+        """(record, seq, version) of every listing, in catalog order."""
+        for seq, index, position in visible_entries(self.segments):
+            segment = self.segments[index]
+            yield segment.item(position), seq, segment.version[position]
+
+
+def open_view(directory: str, cached: Dict[str, Segment]) -> SnapshotView:
+    """Open the manifest's current view, reusing already mapped segments from cached."""
+    while True:
+        manifest = read_manifest(directory)
+        try:
+            segments = [cached.get(name) or Segment(os.path.join(directory, name)) for name in manifest["segments"]]
+        except FileNotFoundError:
+            # A compaction retired a segment between reading the manifest and opening it
+            continue
+        return SnapshotView(manifest["generation"], segments, CatalogStats.from_totals(manifest["stats"]),
+                            tuple(manifest["text"]))
+
+
+class SnapshotCatalog:
+    """Read-only Catalog API over one SnapshotView.
+
+    Answers the same reads a Catalog does, with the same result order, sort
+    keys and listing versions, straight from the memory-mapped segments.
+    """
+
+    best_offer = staticmethod(Catalog.best_offer)
+    cursor_position = staticmethod(Catalog.cursor_position)
+
+    def __init__(self, view: SnapshotView) -> None:
+        self._view = view
+
+    @property
+    def generation(self) -> int:
+        return self._view.generation
+
+    @property
+    def stats(self) -> CatalogStats:
+        return self._view.stats
+
+    def stats_snapshot(self) -> CatalogStats:
+        # A view's totals never change once it is opened
+        return self._view.stats
+
+    def __len__(self) -> int:
+        return self._view.stats.total_items
+
+    def __contains__(self, item_id: str) -> bool:
+        return self._view.locate(item_id)[0] is not None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._view)
+
+    def version(self, item_id: str) -> Optional[int]:
+        segment, position = self._view.locate(item_id)
+        return segment.version[position] if segment is not None else None
+
+    def versions(self, item_ids: Iterable[str]) -> List[Optional[int]]:
+        return [version for version, _ in self._view.get_versioned(item_ids)]
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        segment, position = self._view.locate(item_id)
+        return segment.item(position) if segment is not None else None
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        return [item for _, item in self._view.get_versioned(item_ids)]
+
+    def estimate_matches(self, category: str = "", max_price: float = 0) -> int:
+        return self._view.estimate_matches(category, max_price)
+
+    def text_totals(self) -> Tuple[int, int]:
+        return self._view.text
+
+    def search_keys(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+    ) -> List[Tuple[SortKey, str]]:
+        return self._view.search_keys(query, category, max_price, near, radius_km, sort)
+
+    def search_page(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+        after: Optional[SortKey] = None, limit: int = 50,
+    ) -> Tuple[List[Tuple[SortKey, str]], int, int]:
+        return self._view.search_page(query, category, max_price, near, radius_km, sort, after, limit)
+
+    def iter_results(
+        self, keys: List[Tuple[SortKey, str]], start: int = 0, stop: Optional[int] = None, batch_size: int = 100
+    ) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        stop = len(keys) if stop is None else min(stop, len(keys))
+        for batch_start in range(start, stop, batch_size):
+            batch = keys[batch_start:min(batch_start + batch_size, stop)]
+            loaded = self._view.get_versioned([item_id for _, item_id in batch])
+            yield [(version, item) for version, item in loaded if item is not None]
+
+    def search(
+        self, query: str = "", category: str = "", max_price: float = 0,
+        near: Optional[Point] = None, radius_km: float = 0, sort: str = "relevance",
+    ) -> List[Dict[str, Any]]:
+        keys = self.search_keys(query, category=category, max_price=max_price, near=near, radius_km=radius_km,
+                                sort=sort)
+        return [item for batch in self.iter_results(keys) for _, item in batch]
+
+    def snapshot(self, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Iterate over every listing of the view; it never changes."""
+        return iter(self._view)
+
+
+class SnapshotPublisher:
+    """Publishes a catalog as memory-mapped segment files for worker processes.
+
+    publish_all() writes the whole catalog as a base segment. publish()
+    writes only the listings changed since the last publish as a small delta
+    segment, then a manifest naming the live segments oldest first. Once
+    the deltas hold more than ``compact_ratio`` times as many listings as
+    the base they are merged into a new base, and otherwise once there are
+    more than ``max_deltas`` deltas they are merged into one; both merges
+    run on a background thread, one at a time, so publishing never waits
+    for them.
+
+    ``directory`` must be empty, missing, or left by an earlier publisher;
+    the publisher clears out that publisher's segments and refuses any
+    other directory rather than delete files it does not own.
+
+    ``write_lock`` must be held around every catalog write; the publisher
+    takes it briefly to read a consistent set of changes. Retired segment
+    files are deleted ``retain_seconds`` after the manifest stops naming
+    them, so slow readers can still open the manifest they just read.
+    """
+
+    def __init__(
+        self, catalog: Catalog, directory: str, write_lock: threading.Lock,
+        max_deltas: int = 8, compact_ratio: float = 0.25, retain_seconds: float = 30,
+    ) -> None:
+        self.catalog = catalog
+        self.directory = directory
+        self.write_lock = write_lock
+        self.max_deltas = max_deltas
+        self.compact_ratio = compact_ratio
+        self.retain_seconds = retain_seconds
+        self.generation = -1
+        self._totals: Dict[str, Any] = {}
+        self._text: List[int] = [0, 0]
+        # (generation, kind, item_id, ...) per change since the last publish
+        self._changes: List[List[Any]] = []
+        self._segments: List[Tuple[str, int]] = []  # (file name, entries), oldest first
+        self._merging: List[str] = []  # segments the background merge is combining
+        self._retired: List[Tuple[float, str]] = []
+        self._names = itertools.count(1)
+        self._publish_lock = threading.Lock()
+        self._lock = threading.Lock()  # guards _segments and the manifest
+        os.makedirs(directory, exist_ok=True)
+        names = os.listdir(directory)
+        if names and PUBLISHER_MARKER not in names:
+            raise ValueError(f"Snapshot directory {directory} is not empty and was not written by a publisher")
+        for name in names:
+            if name.endswith((".seg", ".seg.partial")) or name == MANIFEST_NAME:
+                os.remove(os.path.join(directory, name))
+        with open(os.path.join(directory, PUBLISHER_MARKER), "w", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+        catalog.add_change_listener(self._on_change)
+
+    def _on_change(self, change: Tuple[Any, ...]) -> None:
+        # Called under the catalog lock; keep only what the segment needs
+        generation = self.catalog.generation
+        if change[0] == "put":
+            self._changes.append([generation, "put", change[1]["id"], change[2], change[3]])
+        elif change[0] == "offer":
+            self._changes.append([generation, "offer", change[1], change[2]])
+        else:
+            self._changes.append([generation, "remove", change[1]])
+
+    def _new_path(self) -> str:
+        return os.path.join(self.directory, f"{next(self._names):08d}.seg")
+
+    def publish_all(self) -> int:
+        """Publish the whole catalog as a single base segment. Hold write_lock while calling."""
+        with self._publish_lock:
+            self._changes = []
+            path = self._new_path()
+            count = write_segment(path, catalog_entries(self.catalog, self.catalog.listing_ids()),
+                                  self.catalog.generation)
+            with self._lock:
+                self._retire([name for name, _ in self._segments])
+                self._segments = [(os.path.basename(path), count)]
+                self._merging = []
+                self._write_manifest(self.catalog.generation, stats_totals(self.catalog.stats),
+                                     list(self.catalog.text_totals()))
+            return self.generation
+
+    def publish(self) -> int:
+        """Publish every change committed so far; returns the generation readers now see.
+
+        Concurrent callers share one publish: whoever finds its changes
+        already published returns at once.
+        """
+        with self._publish_lock:
+            with self.write_lock:
+                generation = self.catalog.generation
+                totals = stats_totals(self.catalog.stats)
+                text = list(self.catalog.text_totals())
+                if generation <= self.generation and totals == self._totals:
+                    return self.generation
+                changes, self._changes = self._changes, []
+                item_ids = list(dict.fromkeys(change[2] for change in changes))
+                items = [copy_listing(item) for item in self.catalog.get_many(item_ids)]
+                entries = sorted(
+                    ((item, seq, version) for item, seq, version
+                     in zip(items, self.catalog.seqs(item_ids), self.catalog.versions(item_ids)) if item is not None),
+                    key=lambda entry: entry[1],
+                )
+                tombstones = [item_id for item_id, item in zip(item_ids, items) if item is None]
+
+            path = self._new_path()
+            write_segment(path, entries, generation, tombstones, changes)
+            with self._lock:
+                self._segments.append((os.path.basename(path), len(entries) + len(tombstones)))
+                self._write_manifest(generation, totals, text)
+                self._maybe_merge()
+            return self.generation
+
+    def _maybe_merge(self) -> None:
+        """Start a background merge if one is due and none is running. Hold _lock."""
+        if self._merging or len(self._segments) < 2:
+            return
+        delta_entries = sum(count for _, count in self._segments[1:])
+        if delta_entries > self.compact_ratio * max(self._segments[0][1], 1000):
+            first, into_base = 0, True
+        elif len(self._segments) - 1 > self.max_deltas:
+            first, into_base = 1, False
+        else:
+            return
+        names = self._merging = [name for name, _ in self._segments[first:]]
+        threading.Thread(target=self._merge, args=(names, into_base), name="snapshot-merger", daemon=True).start()
+
+    def _merge(self, names: List[str], into_base: bool) -> None:
+        path = self._new_path()
+        try:
+            count = merge_segments([os.path.join(self.directory, name) for name in names], path, into_base)
+        except Exception:
+            logger.exception("Snapshot merge failed")
+            with self._lock:
+                if self._merging is names:
+                    self._merging = []
+            return
+        with self._lock:
+            first = 0 if into_base else 1
+            if self._merging is not names or [name for name, _ in self._segments[first:first + len(names)]] != names:
+                # publish_all() replaced everything meanwhile
+                os.remove(path)
+                return
+            self._retire(names)
+            # Deltas published during the merge stay after it, so newer records still win
+            self._segments[first:first + len(names)] = [(os.path.basename(path), count)]
+            self._merging = []
+            self._write_manifest(self.generation, self._totals, self._text)
+            self._maybe_merge()
+        logger.info("Merged %d snapshot segments into %d listings", len(names), count)
+
+    def _retire(self, names: List[str]) -> None:
+        now = time.monotonic()
+        self._retired.extend((now, name) for name in names)
+
+    def _write_manifest(self, generation: int, totals: Dict[str, Any], text: List[int]) -> None:
+        write_manifest(self.directory, {"generation": generation, "segments": [name for name, _ in self._segments],
+                                        "stats": totals, "text": text})
+        self.generation, self._totals, self._text = generation, totals, text
+
+        now = time.monotonic()
+        while self._retired and now - self._retired[0][0] >= self.retain_seconds:
+            _, name = self._retired.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,173 @@
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional
+import logging
+import os
+import threading
+import time
+
+from catalog import Catalog, Change
+from snapshot import SnapshotCatalog, SnapshotView
+from storage import Store
+
+logger = logging.getLogger(__name__)
+
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process was started, from /proc; None where that is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the ")" closing the command name start at field 3; starttime is field 22
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """Seconds from process start to each startup milestone.
+
+    Where /proc is available the clock starts when the process did, so
+    interpreter start-up and imports are included; elsewhere it starts when
+    the report is created. Each milestone is recorded once, the first time it
+    is marked.
+    """
+
+    def __init__(self) -> None:
+        uptime = process_uptime()
+        self._origin = time.perf_counter() - (uptime or 0.0)
+        self.phases: Dict[str, float] = {}
+        self.catalog_source = "store"
+
+    def mark(self, phase: str) -> None:
+        if phase not in self.phases:
+            self.phases[phase] = round(time.perf_counter() - self._origin, 4)
+
+    def summary(self) -> str:
+        return ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.phases.items())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"catalog_source": self.catalog_source, "seconds": dict(self.phases)}
+
+
+class FirstResponseMiddleware:
+    """ASGI middleware marking "first_response" when the first HTTP response starts, then logging the report."""
+
+    def __init__(self, app: Any, report: StartupReport) -> None:
+        self.app = app
+        self.report = report
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        if scope["type"] != "http" or "first_response" in self.report.phases:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_mark(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start" and "first_response" not in self.report.phases:
+                self.report.mark("first_response")
+                logger.info("Startup: %s (catalog from %s)", self.report.summary(), self.report.catalog_source)
+            await send(message)
+
+        await self.app(scope, receive, send_and_mark)
+
+
+class LazyCatalog:
+    """Catalog that answers reads from an index snapshot while the real one is restored.
+
+    The Catalog is rebuilt from the snapshot with Catalog.restore() on a
+    background thread. Until it is ready, the reads a SnapshotCatalog can
+    answer go to the snapshot; anything else, writes included, waits for
+    the restore. The restored catalog keeps the snapshot's listing order and
+    versions, so cursors and cached fragments carry over the switch.
+    Listeners are attached to the catalog once it exists; nothing can be
+    written before then, so they miss nothing.
+    """
+
+    # Catalog methods and properties the snapshot answers exactly as the catalog would
+    _SNAPSHOT_READS: FrozenSet[str] = frozenset((
+        "generation", "stats", "version", "versions", "get", "get_many", "estimate_matches", "search_keys",
+        "search_page", "iter_results", "search", "best_offer", "cursor_position", "snapshot", "text_totals",
+        "stats_snapshot",
+    ))
+
+    def __init__(
+        self, view: SnapshotView, store: Optional[Store] = None,
+        on_ready: Optional[Callable[[Catalog], None]] = None,
+    ) -> None:
+        self._reader: Optional[SnapshotCatalog] = SnapshotCatalog(view)
+        self._catalog: Optional[Catalog] = None
+        self._error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        self._change_listeners: List[Callable[[Change], None]] = []
+        threading.Thread(target=self._restore, args=(view, store, on_ready), name="catalog-restore",
+                         daemon=True).start()
+
+    def _restore(self, view: SnapshotView, store: Optional[Store], on_ready: Optional[Callable[[Catalog], None]]) -> None:
+        try:
+            catalog = Catalog.restore(view.entries(), view.generation, store)
+            with self._lock:
+                for callback in self._listeners:
+                    catalog.add_listener(callback)
+                for change_callback in self._change_listeners:
+                    catalog.add_change_listener(change_callback)
+                self._catalog = catalog
+            # In-flight reads keep the view alive; new ones go to the catalog
+            self._reader = None
+        except BaseException as e:
+            self._error = e
+            logger.exception("Restoring the catalog from its index snapshot failed")
+            return
+        finally:
+            self._ready.set()
+        if on_ready is not None:
+            on_ready(catalog)
+
+    @property
+    def ready(self) -> bool:
+        return self._catalog is not None
+
+    def wait(self) -> Catalog:
+        """Block until the catalog is restored and return it."""
+        self._ready.wait()
+        if self._catalog is None:
+            raise RuntimeError("The catalog could not be restored from its index snapshot") from self._error
+        return self._catalog
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        with self._lock:
+            if self._catalog is not None:
+                self._catalog.add_listener(callback)
+            else:
+                self._listeners.append(callback)
+
+    def add_change_listener(self, callback: Callable[[Change], None]) -> None:
+        with self._lock:
+            if self._catalog is not None:
+                self._catalog.add_change_listener(callback)
+            else:
+                self._change_listeners.append(callback)
+
+    def _read_target(self) -> Any:
+        catalog = self._catalog
+        if catalog is not None:
+            return catalog
+        reader = self._reader
+        return reader if reader is not None else self.wait()
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for names not set on the instance, i.e. the Catalog API
+        if name in self._SNAPSHOT_READS:
+            return getattr(self._read_target(), name)
+        catalog = self._catalog
+        return getattr(catalog if catalog is not None else self.wait(), name)
+
+    def __len__(self) -> int:
+        return len(self._read_target())
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._read_target()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._read_target())
@@ -0,0 +1,773 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import date
+import json
+import queue
+import sqlite3
+import threading
+
+# numpy is optional; ColumnarStore aggregates with it when available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Listing fields kept in their own SQLite columns; everything else is stored
+# as a JSON document
+_ITEM_COLUMNS = ("id", "category", "asking_price", "seller")
+_OFFER_COLUMNS = ("buyer", "amount", "message", "date")
+
+# Listings fetched per query when streaming or batch-loading from SQLite.
+# Stays below SQLite's default limit on bound parameters.
+SQLITE_BATCH_SIZE = 500
+
+
+def offer_rank(offer: Dict[str, Any]) -> float:
+    """Sort key that puts the highest offer first."""
+    return -offer["amount"]
+
+
+def insert_offer(offers: List[Dict[str, Any]], offer: Dict[str, Any]) -> None:
+    """Insert an offer into a best-first offer book in O(log n) comparisons.
+
+    Equal amounts keep arrival order, matching a stable sort of the book.
+    """
+    offers.insert(bisect_right(offers, offer_rank(offer), key=offer_rank), offer)
+
+
+# A pending store mutation: ("put", item) or ("offer", item_id, offer). A put
+# may carry a third element, the listing version it was derived from, which
+# Catalog.apply_writes() checks; stores ignore it.
+WriteOp = Tuple[Any, ...]
+
+
+class Store:
+    """Where listing records live. The catalog keeps only its indexes in memory.
+
+    Stores return listings as plain dicts with their ``offers`` list ordered
+    best-first, the same shape as the records in ``server.MARKETPLACE_ITEMS``.
+    """
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        """Fetch several listings, in the order given; missing IDs map to None."""
+        return [self.get(item_id) for item_id in item_ids]
+
+    def put(self, item: Dict[str, Any]) -> None:
+        """Insert a listing, or replace an existing one and all of its offers."""
+        raise NotImplementedError
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        """Append an offer to a listing's offer book."""
+        raise NotImplementedError
+
+    def delete(self, item_id: str) -> None:
+        raise NotImplementedError
+
+    def write_batch(self, ops: Iterable[WriteOp]) -> None:
+        """Apply puts and new offers in order, as one commit where the store supports it."""
+        for op in ops:
+            if op[0] == "put":
+                self.put(op[1])
+            else:
+                self.add_offer(op[1], op[2])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over every listing in insertion order."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def aggregate(self) -> Optional[Dict[str, Any]]:
+        """Catalog totals computed by the store itself, or None if it can't.
+
+        Returns a dict with total_items, total_offers, asking_sum, offer_sum,
+        category_items and category_offers.
+        """
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStore(Store):
+    """Keeps listing dicts in process memory. Nothing survives a restart."""
+
+    def __init__(self) -> None:
+        self._items: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        return self._items.get(item_id)
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        return [self._items.get(item_id) for item_id in item_ids]
+
+    def put(self, item: Dict[str, Any]) -> None:
+        self._items[item["id"]] = item
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        insert_offer(self._items[item_id]["offers"], offer)
+
+    def delete(self, item_id: str) -> None:
+        self._items.pop(item_id, None)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self._items.values()))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SQLiteStore(Store):
+    """Persists listings and offers in an SQLite database.
+
+    The database runs in WAL mode so readers never block behind a writer.
+    Connections are handed out from a fixed-size pool, so the store can be
+    used from the event loop and from executor threads at the same time; each
+    connection is only ever used by one thread at once. Checking one out never
+    waits: when every pooled connection is busy, the caller gets a fresh one
+    that is closed after use, so the event loop cannot stall behind executor
+    or writer threads. All SQL text is constant, so sqlite3's per-connection
+    statement cache reuses the prepared statements.
+
+    Only the records live here: the catalog's search indexes stay in memory
+    and are rebuilt from a full pass over the table at startup, unless the
+    server starts from an index snapshot. Searches never filter in SQL; the
+    category column index serves aggregate().
+    """
+
+    def __init__(self, path: str, pool_size: int = 4) -> None:
+        self.path = path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._connections: List[sqlite3.Connection] = []
+        for _ in range(pool_size):
+            conn = self._connect()
+            self._connections.append(conn)
+            self._pool.put(conn)
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    category TEXT NOT NULL,
+                    asking_price NUMERIC NOT NULL,
+                    seller TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS items_category ON items (category);
+                CREATE INDEX IF NOT EXISTS items_asking_price ON items (asking_price);
+                CREATE INDEX IF NOT EXISTS items_seller ON items (seller);
+                CREATE TABLE IF NOT EXISTS offers (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    item_id TEXT NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+                    buyer TEXT NOT NULL,
+                    amount NUMERIC NOT NULL,
+                    message TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                -- Serves each listing's offer book already ordered best-first
+                CREATE INDEX IF NOT EXISTS offers_book ON offers (item_id, amount DESC, seq);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            # Pool exhausted: use a connection of our own rather than wait
+            conn = self._connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_item(row: tuple) -> Dict[str, Any]:
+        item_id, category, asking_price, seller, data = row
+        item = json.loads(data)
+        item.update(id=item_id, category=category, asking_price=asking_price, seller=seller, offers=[])
+        return item
+
+    @staticmethod
+    def _row_to_offer(row: tuple) -> Dict[str, Any]:
+        buyer, amount, message, date, data = row
+        offer = json.loads(data)
+        offer.update(buyer=buyer, amount=amount, message=message, date=date)
+        return offer
+
+    @staticmethod
+    def _split(record: Dict[str, Any], columns: Iterable[str]) -> tuple:
+        extra = {key: value for key, value in record.items() if key not in columns and key != "offers"}
+        return tuple(record[column] for column in columns) + (json.dumps(extra),)
+
+    def _load(self, conn: sqlite3.Connection, item_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(item_ids))
+        items = {}
+        for row in conn.execute(
+            f"SELECT id, category, asking_price, seller, data FROM items WHERE id IN ({placeholders})", item_ids
+        ):
+            items[row[0]] = self._row_to_item(row)
+        for row in conn.execute(
+            f"SELECT item_id, buyer, amount, message, date, data FROM offers"
+            f" WHERE item_id IN ({placeholders}) ORDER BY item_id, amount DESC, seq",
+            item_ids,
+        ):
+            items[row[0]]["offers"].append(self._row_to_offer(row[1:]))
+        return items
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            return self._load(conn, [item_id]).get(item_id)
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        item_ids = list(item_ids)
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._connection() as conn:
+            for start in range(0, len(item_ids), SQLITE_BATCH_SIZE):
+                found.update(self._load(conn, item_ids[start:start + SQLITE_BATCH_SIZE]))
+        return [found.get(item_id) for item_id in item_ids]
+
+    def put(self, item: Dict[str, Any]) -> None:
+        self.put_many([item])
+
+    def put_many(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Insert or replace several listings in a single transaction."""
+        self.write_batch(("put", item) for item in items)
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        self.write_batch([("offer", item_id, offer)])
+
+    def write_batch(self, ops: Iterable[WriteOp]) -> None:
+        with self._transaction() as conn:
+            for op in ops:
+                if op[0] == "put":
+                    self._put(conn, op[1])
+                else:
+                    self._insert_offer(conn, op[1], op[2])
+
+    def _put(self, conn: sqlite3.Connection, item: Dict[str, Any]) -> None:
+        conn.execute("DELETE FROM offers WHERE item_id = ?", (item["id"],))
+        conn.execute(
+            "INSERT INTO items (id, category, asking_price, seller, data) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET category = excluded.category,"
+            " asking_price = excluded.asking_price, seller = excluded.seller, data = excluded.data",
+            self._split(item, _ITEM_COLUMNS),
+        )
+        for offer in item["offers"]:
+            self._insert_offer(conn, item["id"], offer)
+
+    def _insert_offer(self, conn: sqlite3.Connection, item_id: str, offer: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT INTO offers (item_id, buyer, amount, message, date, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (item_id,) + self._split(offer, _OFFER_COLUMNS),
+        )
+
+    def delete(self, item_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Keyset pagination, so a pooled connection is only held per batch
+        last_seq = 0
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT seq, id FROM items WHERE seq > ? ORDER BY seq LIMIT ?", (last_seq, SQLITE_BATCH_SIZE)
+                ).fetchall()
+                if not rows:
+                    return
+                batch = self._load(conn, [item_id for _, item_id in rows])
+            for _, item_id in rows:
+                if item_id in batch:
+                    yield batch[item_id]
+            last_seq = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def aggregate(self) -> Dict[str, Any]:
+        with self._connection() as conn:
+            # One read transaction, so both queries see the same commit
+            conn.execute("BEGIN")
+            try:
+                items = conn.execute(
+                    "SELECT category, COUNT(*), TOTAL(asking_price) FROM items GROUP BY category"
+                ).fetchall()
+                offers = {category: (count, amount) for category, count, amount in conn.execute(
+                    "SELECT items.category, COUNT(*), TOTAL(offers.amount) FROM offers"
+                    " JOIN items ON items.id = offers.item_id GROUP BY items.category"
+                )}
+            finally:
+                conn.execute("COMMIT")
+        totals: Dict[str, Any] = {
+            "total_items": 0, "total_offers": 0, "asking_sum": 0, "offer_sum": 0,
+            "category_items": {}, "category_offers": {},
+        }
+        for category, count, asking_sum in items:
+            offer_count, offer_sum = offers.get(category, (0, 0))
+            totals["total_items"] += count
+            totals["asking_sum"] += asking_sum
+            totals["total_offers"] += offer_count
+            totals["offer_sum"] += offer_sum
+            totals["category_items"][category] = count
+            totals["category_offers"][category] = offer_count
+        return totals
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+
+
+def _to_cents(amount: float) -> int:
+    return round(amount * 100)
+
+
+# An offer converted for ColumnarStore's columns: (cents, day, buyer, message, extra fields)
+_OfferRow = Tuple[int, int, str, str, Optional[Dict[str, Any]]]
+
+
+def _checked_text(record: Dict[str, Any], field: str) -> str:
+    value = record[field]
+    if not isinstance(value, str):
+        raise TypeError(f"{field} must be a string, not {type(value).__name__}")
+    return value
+
+
+def _checked_number(record: Dict[str, Any], field: str) -> float:
+    value = record[field]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"{field} must be a number, not {type(value).__name__}")
+    return value
+
+
+def _from_cents(cents: int) -> float:
+    # Whole amounts come back as ints, the way listings are normally written
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def _to_day(value: Any) -> int:
+    """Day ordinal of a YYYY-MM-DD date, or 0 for anything else, which must then be kept verbatim."""
+    try:
+        day = date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return 0
+    # Other ISO spellings parse too, but would not read back unchanged
+    return day if date.fromordinal(day).isoformat() == value else 0
+
+
+class _StringColumn:
+    """UTF-8 strings packed into one shared buffer, addressed by per-row offsets.
+
+    Overwriting a row appends the new value and leaves the old bytes as
+    garbage; the buffer is compacted once garbage outweighs live data.
+    """
+
+    def __init__(self) -> None:
+        self._data = bytearray()
+        self._start = array("q")
+        self._end = array("q")
+        self._garbage = 0
+
+    def append(self, value: str) -> None:
+        encoded = value.encode()
+        self._start.append(len(self._data))
+        self._data += encoded
+        self._end.append(len(self._data))
+
+    def __setitem__(self, row: int, value: str) -> None:
+        self._garbage += self._end[row] - self._start[row]
+        encoded = value.encode()
+        self._start[row] = len(self._data)
+        self._data += encoded
+        self._end[row] = len(self._data)
+        if self._garbage > len(self._data) // 2:
+            self._compact()
+
+    def __getitem__(self, row: int) -> str:
+        return self._data[self._start[row]:self._end[row]].decode()
+
+    def nbytes(self) -> int:
+        return len(self._data) + self._start.itemsize * (len(self._start) + len(self._end))
+
+    def _compact(self) -> None:
+        data = bytearray()
+        for row in range(len(self._start)):
+            start = len(data)
+            data += self._data[self._start[row]:self._end[row]]
+            self._start[row] = start
+            self._end[row] = len(data)
+        self._data = data
+        self._garbage = 0
+
+
+class _CodeColumn:
+    """Low-cardinality strings (categories, sellers, cities) stored as integer codes."""
+
+    def __init__(self) -> None:
+        self.codes = array("i")
+        self.values: List[str] = []
+        self._lookup: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value: str) -> None:
+        self.codes.append(self.encode(value))
+
+    def __setitem__(self, row: int, value: str) -> None:
+        self.codes[row] = self.encode(value)
+
+    def __getitem__(self, row: int) -> str:
+        return self.values[self.codes[row]]
+
+    def nbytes(self) -> int:
+        return self.codes.itemsize * len(self.codes)
+
+
+class ColumnarStore(Store):
+    """Keeps listings and offers in typed, column-per-field arrays.
+
+    Prices are integer cents, dates are day ordinals, repeated strings are
+    dictionary-encoded and free text is packed into shared UTF-8 buffers, so a
+    listing costs a few dozen bytes of array slots plus its text instead of a
+    dict of boxed objects. Offers live in flat arrays of their own; each
+    listing keeps only an array of offer indices ordered best-first.
+
+    Records are materialized as plain dicts on read. Aggregates over whole
+    columns run vectorized with numpy when it is installed. Dates that are
+    missing or not YYYY-MM-DD are stored as day 0, with the original value,
+    if any, kept among the row's extra fields.
+
+    Writes check and convert every field before changing any column, so a
+    record with a mistyped field raises TypeError and leaves the store as
+    it was.
+
+    Deleted listings and replaced offer books leave dead slots behind; once
+    dead rows or offers outnumber live ones, the columns are rebuilt from
+    the live rows.
+    """
+
+    # Fields with a dedicated column; anything else a listing carries is kept
+    # in a per-row dict
+    _ITEM_FIELDS = ("id", "title", "description", "category", "condition", "seller", "seller_rating",
+                    "location", "posted_date", "images", "offers", "asking_price", "status")
+    _OFFER_FIELDS = ("buyer", "amount", "message", "date")
+
+    # Dead rows or offers tolerated before a rebuild, whatever the live count
+    _COMPACT_MIN_DEAD = 1024
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._rows: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._ids: List[str] = []
+        self._title = _StringColumn()
+        self._description = _StringColumn()
+        self._category = _CodeColumn()
+        self._condition = _CodeColumn()
+        self._seller = _CodeColumn()
+        self._location = _CodeColumn()
+        self._status = _CodeColumn()
+        self._seller_rating = array("d")
+        self._posted_date = array("l")
+        self._asking_cents = array("q")
+        self._images = _StringColumn()  # file names joined by newlines
+        self._item_extra: List[Optional[Dict[str, Any]]] = []
+        # Offer books: per row, offer indices ordered best-first
+        self._books: List[array] = []
+
+        self._offer_item = array("q")
+        self._offer_live = bytearray()
+        self._offer_cents = array("q")
+        self._offer_date = array("l")
+        self._offer_buyer = _CodeColumn()
+        self._offer_message = _StringColumn()
+        self._offer_extra: List[Optional[Dict[str, Any]]] = []
+        self._dead_rows = 0
+        self._dead_offers = 0
+
+    @staticmethod
+    def _extra(record: Dict[str, Any], fields: Tuple[str, ...], date_field: str, day: int) -> Optional[Dict[str, Any]]:
+        extra = {key: value for key, value in record.items() if key not in fields}
+        if not day and date_field in record:
+            extra[date_field] = record[date_field]
+        return extra or None
+
+    def _offer_row(self, offer: Dict[str, Any]) -> _OfferRow:
+        """An offer converted for its columns: (cents, day, buyer, message, extra)."""
+        day = _to_day(offer.get("date"))
+        return (_to_cents(_checked_number(offer, "amount")), day, _checked_text(offer, "buyer"),
+                _checked_text(offer, "message"), self._extra(offer, self._OFFER_FIELDS, "date", day))
+
+    def _append_offer(self, row: int, converted: _OfferRow) -> int:
+        cents, day, buyer, message, extra = converted
+        index = len(self._offer_item)
+        self._offer_item.append(row)
+        self._offer_live.append(1)
+        self._offer_cents.append(cents)
+        self._offer_date.append(day)
+        self._offer_buyer.append(buyer)
+        self._offer_message.append(message)
+        self._offer_extra.append(extra)
+        return index
+
+    def _offer(self, index: int) -> Dict[str, Any]:
+        offer = {
+            "buyer": self._offer_buyer[index],
+            "amount": _from_cents(self._offer_cents[index]),
+            "message": self._offer_message[index],
+        }
+        if self._offer_date[index]:
+            offer["date"] = date.fromordinal(self._offer_date[index]).isoformat()
+        extra = self._offer_extra[index]
+        if extra:
+            offer.update(extra)
+        return offer
+
+    def _item(self, row: int) -> Dict[str, Any]:
+        item = {
+            "id": self._ids[row],
+            "title": self._title[row],
+            "description": self._description[row],
+            "category": self._category[row],
+            "condition": self._condition[row],
+            "seller": self._seller[row],
+            "seller_rating": self._seller_rating[row],
+            "location": self._location[row],
+            "images": self._images[row].split("\n") if self._images[row] else [],
+            "offers": [self._offer(index) for index in self._books[row]],
+            "asking_price": _from_cents(self._asking_cents[row]),
+            "status": self._status[row],
+        }
+        if self._posted_date[row]:
+            item["posted_date"] = date.fromordinal(self._posted_date[row]).isoformat()
+        extra = self._item_extra[row]
+        if extra:
+            item.update(extra)
+        return item
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(item_id)
+            return self._item(row) if row is not None else None
+
+    def get_many(self, item_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        with self._lock:
+            rows = [self._rows.get(item_id) for item_id in item_ids]
+            return [self._item(row) if row is not None else None for row in rows]
+
+    def _item_row(self, item: Dict[str, Any]) -> Tuple[Tuple[Any, ...], List[_OfferRow]]:
+        """A listing converted for its columns: (column values, converted offers)."""
+        posted = _to_day(item.get("posted_date"))
+        images = item["images"]
+        if not isinstance(images, list) or not all(isinstance(name, str) for name in images):
+            raise TypeError("images must be a list of strings")
+        if not isinstance(item["offers"], list):
+            raise TypeError("offers must be a list")
+        values = (
+            _checked_text(item, "title"), _checked_text(item, "description"), _checked_text(item, "category"),
+            _checked_text(item, "condition"), _checked_text(item, "seller"), _checked_text(item, "location"),
+            _checked_text(item, "status"), _checked_number(item, "seller_rating"), posted,
+            _to_cents(_checked_number(item, "asking_price")), "\n".join(images),
+            self._extra(item, self._ITEM_FIELDS, "posted_date", posted),
+        )
+        return values, [self._offer_row(offer) for offer in item["offers"]]
+
+    def put(self, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._put_row(item["id"], *self._item_row(item))
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        with self._lock:
+            self._add_offer_row(item_id, self._offer_row(offer))
+
+    def write_batch(self, ops: Iterable[WriteOp]) -> None:
+        ops = list(ops)
+        with self._lock:
+            # Convert and check every record before touching any column, so a
+            # rejected batch leaves the store as it was
+            rows = []
+            put_ids = set()
+            for op in ops:
+                if op[0] == "put":
+                    put_ids.add(op[1]["id"])
+                    rows.append((op[1]["id"], self._item_row(op[1])))
+                else:
+                    if op[1] not in self._rows and op[1] not in put_ids:
+                        raise KeyError(op[1])
+                    rows.append((op[1], self._offer_row(op[2])))
+            for op, (item_id, row) in zip(ops, rows):
+                if op[0] == "put":
+                    self._put_row(item_id, *row)
+                else:
+                    self._add_offer_row(item_id, row)
+
+    def _put_row(self, item_id: str, values: Tuple[Any, ...], offers: List[_OfferRow]) -> None:
+        columns = (self._title, self._description, self._category, self._condition, self._seller, self._location,
+                   self._status, self._seller_rating, self._posted_date, self._asking_cents, self._images,
+                   self._item_extra)
+        row = self._rows.get(item_id)
+        if row is None:
+            row = self._rows[item_id] = len(self._ids)
+            self._alive.append(1)
+            self._ids.append(item_id)
+            for column, value in zip(columns, values):
+                column.append(value)
+            self._books.append(array("q"))
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+            for index in self._books[row]:
+                self._offer_live[index] = 0
+            self._dead_offers += len(self._books[row])
+        # Callers hand offers over best-first already
+        self._books[row] = array("q", [self._append_offer(row, offer) for offer in offers])
+        self._compact_if_sparse()
+
+    def _add_offer_row(self, item_id: str, offer: _OfferRow) -> None:
+        row = self._rows[item_id]
+        index = self._append_offer(row, offer)
+        book = self._books[row]
+        # Ties keep arrival order, as in insert_offer
+        rank = lambda i: -self._offer_cents[i]
+        book.insert(bisect_right(book, rank(index), key=rank), index)
+
+    def delete(self, item_id: str) -> None:
+        with self._lock:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                return
+            self._alive[row] = 0
+            for index in self._books[row]:
+                self._offer_live[index] = 0
+            self._dead_rows += 1
+            self._dead_offers += len(self._books[row])
+            self._books[row] = array("q")
+            self._item_extra[row] = None
+            self._title[row] = self._description[row] = self._images[row] = ""
+            self._compact_if_sparse()
+
+    def _compact_if_sparse(self) -> None:
+        live_offers = len(self._offer_item) - self._dead_offers
+        if (self._dead_rows > max(len(self._rows), self._COMPACT_MIN_DEAD)
+                or self._dead_offers > max(live_offers, self._COMPACT_MIN_DEAD)):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rebuild every column from the live rows, in order, dropping dead rows and offers."""
+        fresh = ColumnarStore()
+        for row in range(len(self._ids)):
+            if self._alive[row]:
+                fresh.put(self._item(row))
+        lock = self._lock
+        self.__dict__.update(fresh.__dict__)
+        self._lock = lock
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # IDs rather than rows, as a compaction renumbers the rows
+        with self._lock:
+            item_ids = [self._ids[row] for row in range(len(self._ids)) if self._alive[row]]
+        for item_id in item_ids:
+            item = self.get(item_id)
+            if item is not None:
+                yield item
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the column buffers (excluding the id map)."""
+        with self._lock:
+            arrays = (self._seller_rating, self._posted_date, self._asking_cents, self._offer_item,
+                      self._offer_cents, self._offer_date)
+            total = sum(column.itemsize * len(column) for column in arrays)
+            total += len(self._alive) + len(self._offer_live)
+            for column in (self._title, self._description, self._images, self._category, self._condition, self._seller,
+                           self._location, self._status, self._offer_buyer, self._offer_message):
+                total += column.nbytes()
+            total += sum(book.itemsize * len(book) for book in self._books)
+            return total
+
+    def aggregate(self) -> Dict[str, Any]:
+        with self._lock:
+            if numpy is not None:
+                return self._aggregate_numpy()
+            totals: Dict[str, Any] = {
+                "total_items": 0, "total_offers": 0, "asking_sum": 0, "offer_sum": 0,
+                "category_items": {}, "category_offers": {},
+            }
+            for row in range(len(self._ids)):
+                if not self._alive[row]:
+                    continue
+                category = self._category[row]
+                book = self._books[row]
+                totals["total_items"] += 1
+                totals["asking_sum"] += self._asking_cents[row]
+                totals["total_offers"] += len(book)
+                totals["offer_sum"] += sum(self._offer_cents[index] for index in book)
+                totals["category_items"][category] = totals["category_items"].get(category, 0) + 1
+                totals["category_offers"][category] = totals["category_offers"].get(category, 0) + len(book)
+            totals["asking_sum"] = _from_cents(totals["asking_sum"])
+            totals["offer_sum"] = _from_cents(totals["offer_sum"])
+            return totals
+
+    def _aggregate_numpy(self) -> Dict[str, Any]:
+        alive = numpy.frombuffer(bytes(self._alive), dtype=numpy.uint8).astype(bool)
+        categories = numpy.array(self._category.codes, dtype=numpy.int64)
+        asking = numpy.array(self._asking_cents, dtype=numpy.int64)
+        offer_live = numpy.frombuffer(bytes(self._offer_live), dtype=numpy.uint8).astype(bool)
+        offer_items = numpy.array(self._offer_item, dtype=numpy.int64)[offer_live]
+        offer_cents = numpy.array(self._offer_cents, dtype=numpy.int64)[offer_live]
+
+        n_codes = len(self._category.values)
+        item_counts = numpy.bincount(categories[alive], minlength=n_codes)
+        offer_counts = numpy.bincount(categories[offer_items], minlength=n_codes)
+        return {
+            "total_items": int(alive.sum()),
+            "total_offers": int(offer_live.sum()),
+            "asking_sum": _from_cents(int(asking[alive].sum())),
+            "offer_sum": _from_cents(int(offer_cents.sum())),
+            "category_items": {
+                self._category.values[code]: int(count) for code, count in enumerate(item_counts) if count
+            },
+            "category_offers": {
+                self._category.values[code]: int(offer_counts[code])
+                for code, count in enumerate(item_counts) if count
+            },
+        }
@@ -0,0 +1,34 @@
+from typing import Any, Callable, Dict
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, next to server.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_listing() -> Callable[..., Dict[str, Any]]:
+    """Factory for complete listing records; keyword arguments override fields."""
+
+    def make(item_id: str, **fields: Any) -> Dict[str, Any]:
+        listing = {
+            "id": item_id,
+            "title": f"Listing {item_id}",
+            "description": "Used, in good condition",
+            "category": "Electronics",
+            "condition": "Good",
+            "seller": "seller",
+            "seller_rating": 4.5,
+            "location": "Portland, OR",
+            "posted_date": "2024-01-10",
+            "images": [],
+            "offers": [],
+            "asking_price": 100,
+            "status": "active",
+        }
+        listing.update(fields)
+        return listing
+
+    return make
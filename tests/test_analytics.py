@@ -0,0 +1,115 @@
+import math
+import random
+from datetime import date
+
+import pytest
+
+from analytics import RELATIVE_ACCURACY, OfferAnalytics, QuantileSketch
+from catalog import Catalog
+
+
+def nearest_rank(values, q):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(round(q * len(ordered), 9))) - 1]
+
+
+@pytest.mark.parametrize("q", [0, 0.1, 0.5, 0.9, 0.99, 1])
+def test_quantiles_are_within_the_relative_accuracy(q):
+    rnd = random.Random(3)
+    values = [rnd.lognormvariate(4, 1.5) for _ in range(5000)] + [0] * 50
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    assert sketch.quantile(q) == pytest.approx(nearest_rank(values, q), rel=RELATIVE_ACCURACY, abs=1e-9)
+
+
+def test_small_samples_use_the_nearest_rank():
+    sketch = QuantileSketch()
+    for value in (750, 800, 825):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == pytest.approx(800, rel=RELATIVE_ACCURACY)
+    assert sketch.quantile(0.9) == pytest.approx(825, rel=RELATIVE_ACCURACY)
+    assert sketch.quantile(0) == pytest.approx(750, rel=RELATIVE_ACCURACY)
+
+    ten = QuantileSketch()
+    for value in range(1, 11):
+        ten.add(value * 100)
+    assert ten.quantile(0.9) == pytest.approx(900, rel=RELATIVE_ACCURACY)
+
+
+@pytest.mark.parametrize("amount", [340, 50, 0.5])
+def test_a_single_value_reads_back_exactly(amount):
+    sketch = QuantileSketch()
+    sketch.add(amount)
+    assert [sketch.quantile(q) for q in (0, 0.5, 0.9, 1)] == [amount] * 4
+
+
+def test_quantiles_stay_within_the_values_added():
+    sketch, other = QuantileSketch(), QuantileSketch()
+    for value in (200, 340, 340):
+        sketch.add(value)
+    other.add(50)
+    sketch.merge(other)
+    # Both read back as their buckets' middles, $49.90 and $340.41, without the clamp
+    assert (sketch.quantile(0), sketch.quantile(1)) == (50, 340)
+    for value in (200, 340, 340, 50):
+        sketch.add(value, -1)
+    # An emptied sketch forgets its bounds
+    sketch.add(60)
+    assert sketch.quantile(0.5) == 60
+
+def test_removed_values_leave_no_trace():
+    sketch, other = QuantileSketch(), QuantileSketch()
+    for value in (5, 10, 20):
+        sketch.add(value)
+    other.add(1000)
+    sketch.merge(other)
+    sketch.add(1000, -1)
+    sketch.add(5, -1)
+    assert (sketch.count, sketch.quantile(0.5)) == (2, pytest.approx(10, rel=RELATIVE_ACCURACY))
+    for value in (10, 20):
+        sketch.add(value, -1)
+    assert sketch.buckets == {} and sketch.quantile(0.5) is None
+
+
+def offer(amount: float, day: str) -> dict:
+    return {"buyer": "b", "amount": amount, "message": "", "date": day}
+
+
+def test_reports_match_a_scan_of_the_window(make_listing):
+    rnd = random.Random(5)
+    start = date(2024, 1, 20).toordinal()
+    days = [date.fromordinal(start + n).isoformat() for n in range(90)]
+    catalog = Catalog([
+        make_listing(str(n), category=rnd.choice(("Books", "Toys")), asking_price=rnd.randint(50, 500),
+                     offers=[offer(rnd.randint(1, 500), rnd.choice(days)) for _ in range(rnd.randint(0, 6))])
+        for n in range(200)
+    ])
+    for n in rnd.sample(range(200), 30):
+        catalog.add_offer(str(n), offer(rnd.randint(1, 500), rnd.choice(days)))
+    # Replaced and removed listings take their old offers with them
+    catalog.add_item(make_listing("0", category="Toys", asking_price=80, offers=[offer(40, days[-1])]))
+    catalog.remove_item("1")
+
+    first, last = start + 10, start + 70  # spans whole and partial months
+    report = catalog.offer_report("toys", first=first, last=last)
+    amounts = sorted(
+        o["amount"] for item in catalog if item["category"] == "Toys" for o in item["offers"]
+        if first <= date.fromisoformat(o["date"]).toordinal() <= last
+    )
+    assert report["offers"] == len(amounts)
+    assert [row["category"] for row in report["categories"]] == ["Toys"]
+    assert report["avg_offer"] == pytest.approx(sum(amounts) / len(amounts), abs=0.01)
+    assert report["offer_p90"] == pytest.approx(nearest_rank(amounts, 0.9), rel=RELATIVE_ACCURACY)
+    assert sum(count for _, count in report["daily"]) == len(amounts)
+    assert (report["since"], report["until"]) == (date.fromordinal(first).isoformat(), date.fromordinal(last).isoformat())
+
+
+def test_default_window_ends_at_the_latest_offer():
+    analytics = OfferAnalytics()
+    analytics.add_listing("1", "Books", 100, [offer(50, "2024-03-01"), offer(70, "2024-03-31"), offer(9, "bad")])
+    report = analytics.report(days=30)
+    assert (report["since"], report["until"], report["offers"]) == ("2024-03-02", "2024-03-31", 1)
+    assert report["ratio_p50"] == pytest.approx(0.7, rel=RELATIVE_ACCURACY)
+    analytics.remove_listing("1", "Books", 100)
+    assert analytics.latest_day() is None and analytics.report()["offers"] == 0
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench.py")
+
+
+def run_bench(tmp_path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, BENCH, "--data-dir", str(tmp_path), *args],
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_inprocess_run_reports_every_tool(tmp_path):
+    output = tmp_path / "report.json"
+    child = run_bench(tmp_path, "--sizes", "40", "--modes", "inprocess", "--clients", "2", "--duration", "0.2",
+                      "--warmup", "0.05", "--output", str(output))
+    assert child.returncode == 0, child.stderr
+    report = json.loads(output.read_text())
+    assert set(report) == {"revision", "python", "timestamp", "config", "runs"}
+    assert report["config"]["clients"] == 2 and report["config"]["duration"] == 0.2
+    [run] = report["runs"]
+    assert (run["size"], run["mode"], run["catalog_items"]) == (40, "inprocess", 40)
+    assert set(run["tools"]) == set(bench.WORKLOAD)
+    assert run["overall"]["requests"] > 0
+    assert run["overall"]["errors"] == 0
+    assert set(run["overall"]) >= {"throughput_rps", "p50_ms", "p99_ms", "max_ms", "response_bytes"}
+
+
+def test_unknown_modes_are_rejected(tmp_path):
+    child = run_bench(tmp_path, "--sizes", "10", "--modes", "fast", "--duration", "0.1", "--warmup", "0")
+    assert child.returncode != 0
+    assert "Unknown mode 'fast'" in child.stderr
+
+
+def test_percentiles_use_the_nearest_rank():
+    ordered = [float(n) for n in range(1, 11)]
+    assert bench.percentile(ordered, 0.5) == 5
+    assert bench.percentile(ordered, 0.99) == 10
+    assert bench.percentile([], 0.5) is None
+    assert bench.summarize([], 0, 1.0)["p50_ms"] is None
+
+
+@pytest.mark.parametrize("seed", [0, 3])
+def test_synthetic_catalogs_are_reproducible(seed):
+    first = list(bench.synthetic_listings(20, seed))
+    assert first == list(bench.synthetic_listings(20, seed))
+    assert [item["id"] for item in first] == [str(n) for n in range(1, 21)]
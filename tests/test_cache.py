@@ -0,0 +1,159 @@
+import asyncio
+import gzip
+import sys
+
+import pytest
+
+from cache import EncodedPage, FragmentCache, PageCache, QueryCache
+
+
+def test_fragments_are_tagged_with_their_listing_version():
+    cache = FragmentCache()
+    cache.put("summary", "1", 3, "<li>v3</li>")
+    assert cache.get("summary", "1", 3) == "<li>v3</li>"
+    assert cache.get("summary", "1", 4) is None
+    assert cache.get("detail", "1", 3) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_render_caches_and_skips_unversioned_listings():
+    cache = FragmentCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return "fragment"
+
+    assert cache.render("summary", "1", 1, render) == "fragment"
+    assert cache.render("summary", "1", 1, render) == "fragment"
+    assert cache.render("summary", "2", None, render) == "fragment"
+    assert len(calls) == 2
+    assert len(cache) == 1
+
+
+def test_invalidate_drops_every_kind_for_a_listing():
+    cache = FragmentCache()
+    cache.put("summary", "1", 1, "a")
+    cache.put("detail", "1", 1, "b")
+    cache.put("summary", "2", 1, "c")
+    cache.invalidate("1")
+    assert len(cache) == 1
+    assert cache.size_bytes == sys.getsizeof("c")
+
+
+def test_evicts_least_recently_used_beyond_max_bytes():
+    fragment = "x" * 100
+    size = sys.getsizeof(fragment)
+    cache = FragmentCache(max_bytes=size * 2)
+    cache.put("summary", "1", 1, fragment)
+    cache.put("summary", "2", 1, fragment)
+    cache.get("summary", "1", 1)
+    cache.put("summary", "3", 1, fragment)
+    assert cache.get("summary", "2", 1) is None
+    assert cache.get("summary", "1", 1) == fragment
+    assert cache.evictions == 1
+    assert cache.size_bytes == size * 2
+    # Fragments larger than the whole budget are never cached
+    cache.put("summary", "4", 1, "y" * 1000)
+    assert cache.get("summary", "4", 1) is None
+
+
+def test_expired_fragments_miss(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    cache = FragmentCache(ttl=10)
+    cache.put("summary", "1", 1, "a")
+    now[0] = 109.0
+    assert cache.get("summary", "1", 1) == "a"
+    now[0] = 111.0
+    assert cache.get("summary", "1", 1) is None
+
+
+def test_query_results_are_served_until_the_generation_moves():
+    cache = QueryCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        assert await cache.get_or_compute("k", 1, compute) == 1
+        assert await cache.get_or_compute("k", 1, compute) == 1
+        assert await cache.get_or_compute("k", 2, compute) == 2
+
+    asyncio.run(main())
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = QueryCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", 1, compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert cache.coalesced == 4
+
+
+def test_failures_reach_every_caller_and_are_not_cached():
+    cache = QueryCache()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(cache.get_or_compute("k", 1, fail) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(cache) == 0
+        with pytest.raises(ValueError):
+            await cache.get_or_compute("k", 1, fail)
+
+    asyncio.run(main())
+
+
+def test_query_cache_is_bounded_lru():
+    cache = QueryCache(max_entries=2)
+
+    async def main():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_compute(key, 1, lambda key=key: asyncio.sleep(0, key))
+
+    asyncio.run(main())
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_pages_render_once_per_generation():
+    content = ["<html>a</html>"]
+    page_cache = PageCache(lambda: content[0])
+    first = page_cache.get(1)
+    assert page_cache.get(1) is first
+    assert page_cache.renders == 1
+    assert gzip.decompress(first.bodies["gzip"]) == first.bodies["identity"] == b"<html>a</html>"
+    assert first.etag.startswith('W/"')
+
+
+def test_unchanged_content_keeps_its_validators():
+    content = ["<html>a</html>"]
+    page_cache = PageCache(lambda: content[0])
+    first = page_cache.get(1)
+    second = page_cache.get(2)
+    assert second is not first
+    assert (second.etag, second.last_modified) == (first.etag, first.last_modified)
+    content[0] = "<html>b</html>"
+    third = page_cache.get(3)
+    assert third.etag != first.etag
+    assert page_cache.renders == 3
+
+
+def test_etag_does_not_depend_on_generation():
+    assert EncodedPage(1, "same").etag == EncodedPage(9, "same").etag
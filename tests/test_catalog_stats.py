@@ -0,0 +1,55 @@
+from catalog import Catalog, CatalogStats
+
+
+def offer(amount: int) -> dict:
+    return {"buyer": "buyer", "amount": amount, "message": "", "date": "2024-01-12"}
+
+
+def test_totals_follow_listing_and_offer_changes(make_listing):
+    catalog = Catalog([
+        make_listing("1", category="Books", asking_price=10, offers=[offer(8)]),
+        make_listing("2", category="Toys", asking_price=30),
+    ])
+    catalog.add_offer("2", offer(20))
+    catalog.add_item(make_listing("1", category="Toys", asking_price=50, offers=[offer(8)]))
+
+    stats = catalog.stats_snapshot()
+    assert (stats.total_items, stats.total_offers) == (2, 2)
+    assert stats.asking_sum == 80
+    assert stats.avg_offer == 14
+    assert stats.category_items == {"Toys": 2}
+    assert stats.category_offers == {"Toys": 2}
+
+    catalog.remove_item("2")
+    stats = catalog.stats_snapshot()
+    assert (stats.total_items, stats.total_offers, stats.asking_sum) == (1, 1, 50)
+    assert catalog.verify_stats()
+
+
+def test_snapshot_is_not_affected_by_later_writes(make_listing):
+    catalog = Catalog([make_listing("1", category="Books")])
+    stats = catalog.stats_snapshot()
+    catalog.remove_item("1")
+    catalog.add_item(make_listing("2", category="Toys"))
+    assert stats.category_items == {"Books": 1}
+    assert stats.total_items == 1
+    assert catalog.stats_snapshot().category_items == {"Toys": 1}
+
+
+def test_verify_stats_repairs_drift(make_listing):
+    catalog = Catalog([make_listing("1", offers=[offer(5)])])
+    catalog.stats.total_offers = 7
+    assert not catalog.verify_stats()
+    assert catalog.stats_snapshot().total_offers == 1
+    assert catalog.verify_stats()
+
+
+def test_recompute_matches_running_totals(make_listing):
+    items = [make_listing(str(n), category=("A", "B")[n % 2], asking_price=n, offers=[offer(n)] * (n % 3))
+             for n in range(1, 20)]
+    running = CatalogStats()
+    for item in items:
+        running.add_item(item["category"], item["asking_price"], len(item["offers"]),
+                         sum(o["amount"] for o in item["offers"]))
+    assert running.drift(CatalogStats.recompute(items)) == []
+    assert running.copy().drift(running) == []
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+import storage
+from catalog import Catalog, CatalogStats
+from storage import ColumnarStore
+
+
+def offer(buyer: str, amount: float, day: str = "2024-01-12") -> dict:
+    return {"buyer": buyer, "amount": amount, "message": f"from {buyer}", "date": day}
+
+
+def test_round_trips_listings(make_listing):
+    store = ColumnarStore()
+    item = make_listing("1", asking_price=19.99, images=["a.jpg", "b.jpg"], shipping="free",
+                        offers=[offer("b", 15.5), offer("a", 12, "2024-02-01") | {"counter": True}])
+    store.put(item)
+    assert store.get("1") == item
+    assert store.get_many(["missing", "1"]) == [None, item]
+
+
+@pytest.mark.parametrize("value", ["", None, "yesterday", "20240115", "2024-13-01"])
+def test_keeps_dates_it_cannot_store_as_days(make_listing, value):
+    store = ColumnarStore()
+    item = make_listing("1", posted_date=value, offers=[offer("a", 5, value)])
+    store.put(item)
+    assert store.get("1") == item
+    store.add_offer("1", offer("b", 9, value))
+    assert store.get("1")["offers"][0]["date"] == value
+
+
+def test_missing_dates_stay_missing(make_listing):
+    store = ColumnarStore()
+    item = make_listing("1", offers=[{"buyer": "a", "amount": 5, "message": ""}])
+    del item["posted_date"]
+    store.put(item)
+    assert store.get("1") == item
+
+
+def test_offer_books_stay_best_first(make_listing):
+    store = ColumnarStore()
+    store.put(make_listing("1", offers=[offer("a", 30), offer("b", 10)]))
+    store.add_offer("1", offer("c", 20))
+    store.add_offer("1", offer("d", 30))
+    assert [o["buyer"] for o in store.get("1")["offers"]] == ["a", "d", "c", "b"]
+
+
+def test_deleted_rows_are_reclaimed(make_listing):
+    store = ColumnarStore()
+    for n in range(200):
+        store.put(make_listing("keep" + str(n), offers=[offer("a", n)]))
+    baseline = store.nbytes()
+    for n in range(20_000):
+        store.put(make_listing(str(n), description="x" * 200, offers=[offer("a", 1)] * 3))
+        store.delete(str(n))
+    assert len(store) == 200
+    assert len(store._ids) < 200 + 2 * ColumnarStore._COMPACT_MIN_DEAD
+    assert store.nbytes() < baseline + 2 * ColumnarStore._COMPACT_MIN_DEAD * 300
+    assert [item["id"] for item in store] == ["keep" + str(n) for n in range(200)]
+    assert store.get("keep7")["offers"] == [offer("a", 7)]
+
+
+def test_replaced_offer_books_are_reclaimed(make_listing):
+    store = ColumnarStore()
+    store.put(make_listing("1"))
+    for n in range(5000):
+        store.put(make_listing("1", offers=[offer("a", n), offer("b", n)]))
+    assert len(store._offer_item) < 2 + 2 * ColumnarStore._COMPACT_MIN_DEAD
+    assert [o["amount"] for o in store.get("1")["offers"]] == [4999, 4999]
+
+
+def test_iteration_survives_a_compaction(make_listing):
+    store = ColumnarStore()
+    for n in range(3000):
+        store.put(make_listing(str(n)))
+    seen = []
+    for item in store:
+        seen.append(item["id"])
+        if item["id"] == "10":
+            for n in range(11, 1500):
+                store.delete(str(n))
+    assert seen == [str(n) for n in range(11)] + [str(n) for n in range(1500, 3000)]
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_aggregate_matches_a_full_pass(monkeypatch, make_listing, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(storage, "numpy", None)
+    elif storage.numpy is None:
+        pytest.skip("numpy is not installed")
+    rnd = random.Random(3)
+    store = ColumnarStore()
+    for n in range(300):
+        store.put(make_listing(str(n), category=rnd.choice("ABC"), asking_price=rnd.randint(100, 9999) / 100,
+                               offers=[offer("a", rnd.randint(1, 50)) for _ in range(rnd.randint(0, 3))]))
+    for n in range(0, 300, 7):
+        store.delete(str(n))
+    store.add_offer("1", offer("z", 3.25))
+    fresh = CatalogStats.from_totals(store.aggregate())
+    assert fresh.drift(CatalogStats.recompute(store)) == []
+
+
+def test_catalog_on_a_columnar_store_verifies(make_listing):
+    catalog = Catalog([make_listing(str(n), offers=[offer("a", n)]) for n in range(50)], store=ColumnarStore())
+    catalog.remove_item("3")
+    catalog.add_offer("4", offer("b", 2.5))
+    assert catalog.verify_stats()
+
+
+@pytest.mark.parametrize("fields", [
+    {"seller_rating": "high"},
+    {"asking_price": "10"},
+    {"condition": 3},
+    {"images": "photo.jpg"},
+    {"offers": [offer("a", 5), offer("b", "lots")]},
+])
+def test_rejected_records_leave_the_store_writable(make_listing, fields):
+    store = ColumnarStore()
+    store.put(make_listing("1", offers=[offer("a", 5)]))
+    before = list(store)
+    with pytest.raises(TypeError):
+        store.put(make_listing("2", **fields))
+    with pytest.raises(TypeError):
+        store.put(make_listing("1", **fields))
+    with pytest.raises(TypeError):
+        store.write_batch([("put", make_listing("3")), ("put", make_listing("4", **fields))])
+    with pytest.raises(TypeError):
+        store.add_offer("1", offer("c", "lots"))
+    assert list(store) == before
+
+    store.put(make_listing("5"))
+    store.add_offer("1", offer("d", 7))
+    assert [item["id"] for item in store] == ["1", "5"]
+    assert [o["amount"] for o in store.get("1")["offers"]] == [7, 5]
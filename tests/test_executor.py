@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+from executor import ServerBusyError, ToolExecutor
+
+
+def test_cheap_calls_run_inline():
+    executor = ToolExecutor(cost_threshold=10)
+
+    async def main():
+        return await executor.run(threading.get_ident, cost=9)
+
+    assert asyncio.run(main()) == threading.get_ident()
+    assert executor._pool is None
+
+
+def test_heavy_calls_run_in_the_pool():
+    executor = ToolExecutor(cost_threshold=10)
+
+    async def main():
+        return await executor.run(lambda a, b=0: (threading.get_ident(), a + b), 1, b=2, cost=10)
+
+    try:
+        ident, total = asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert ident != threading.get_ident()
+    assert total == 3
+    assert executor.pending == 0
+
+
+def test_rejects_heavy_calls_beyond_max_pending():
+    executor = ToolExecutor(cost_threshold=1, max_workers=1, max_concurrent=1, max_pending=2)
+    release = threading.Event()
+
+    async def main():
+        running = [asyncio.ensure_future(executor.run(release.wait, cost=1)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert executor.pending == 2
+        with pytest.raises(ServerBusyError):
+            await executor.run(release.wait, cost=1)
+        # Cheap calls still go through while the pool is saturated
+        assert await executor.run(len, "abc") == 3
+        release.set()
+        await asyncio.gather(*running)
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_errors_propagate_and_release_the_slot():
+    executor = ToolExecutor(cost_threshold=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    async def main():
+        with pytest.raises(ValueError, match="boom"):
+            await executor.run(fail, cost=5)
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert executor.pending == 0
@@ -0,0 +1,183 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from catalog import Catalog, matches_filters
+from feed import ChangeFeed
+
+
+class FakeSession:
+    def __init__(self, fail: bool = False) -> None:
+        self.events: List[Dict[str, Any]] = []
+        self.fail = fail
+
+    async def send_log_message(self, level: str, data: Dict[str, Any], logger: str) -> None:
+        if self.fail:
+            raise ConnectionError("gone")
+        self.events.append(data)
+
+
+def offer(amount: int) -> dict:
+    return {"buyer": "buyer", "amount": amount, "message": "", "date": "2024-01-12"}
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def run(catalog: Catalog, scenario, **options: Any) -> ChangeFeed:
+    feed = ChangeFeed(catalog, **options)
+
+    async def main():
+        try:
+            await scenario(feed)
+        finally:
+            await feed.close()
+
+    asyncio.run(main())
+    return feed
+
+
+def test_item_watches_get_offers_price_and_status_changes(make_listing):
+    catalog = Catalog([make_listing("1", asking_price=100), make_listing("2")])
+    session = FakeSession()
+
+    async def scenario(feed):
+        watch_id = feed.watch_item(session, "1")
+        catalog.add_offer("1", offer(80))
+        catalog.add_offer("2", offer(80))
+        catalog.add_item(make_listing("1", asking_price=90))
+        catalog.add_item(make_listing("1", asking_price=90, title="Retitled"))
+        catalog.add_item(make_listing("1", asking_price=90, status="sold"))
+        catalog.remove_item("1")
+        await settle()
+        assert {event["watch_id"] for event in session.events} == {watch_id}
+
+    run(catalog, scenario)
+    assert [event["event"] for event in session.events] == ["new_offer", "price_change", "status_change", "removed"]
+    assert session.events[1]["old_price"] == 100
+    assert (session.events[2]["old_status"], session.events[2]["status"]) == ("active", "sold")
+
+
+def test_closed_sessions_lose_their_watches(make_listing):
+    catalog = Catalog([make_listing("1")])
+    session = FakeSession()
+
+    async def scenario(feed):
+        feed.watch_item(session, "1")
+        feed.watch_search(session, ("", "Electronics", 0, None, 0))
+        task = feed._subscribers[session].task
+        feed.close_session(session)
+        feed.close_session(session)
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+        catalog.add_offer("1", offer(5))
+        await settle()
+        assert feed.stats()["sessions"] == feed.stats()["watches"] == 0
+
+    run(catalog, scenario)
+    assert session.events == []
+
+
+SEARCHES = [
+    ("", "", 0, None, 0),
+    ("", "furniture", 0, None, 0),
+    ("phone", "", 0, None, 0),
+    ("PHONE", "electronics", 150, None, 0),
+    ("iph*", "", 0, None, 0),
+    ("iph* case", "", 0, None, 0),
+    ("c++*", "", 0, None, 0),
+    ("oak table", "Furniture", 0, None, 0),
+    ("ak tab*", "", 0, None, 0),
+    ("condition", "", 0, None, 0),
+    ("nowhere", "", 0, None, 0),
+]
+
+
+@pytest.mark.parametrize("listing", [
+    {"title": "iPhone 12 case"},
+    {"title": "Smartphone", "asking_price": 200},
+    {"title": "C++* primer", "category": "Books"},
+    {"title": "Solid oak table", "category": "Furniture"},
+    {"title": "Oak", "description": "tablet stand", "category": "Furniture"},
+])
+def test_search_watches_match_as_search_does(make_listing, listing):
+    catalog = Catalog()
+    session = FakeSession()
+    item = make_listing("1", **listing)
+
+    async def scenario(feed):
+        watch_ids = [feed.watch_search(session, filters) for filters in SEARCHES]
+        catalog.add_item(item)
+        await settle()
+        expected = {watch_id for watch_id, filters in zip(watch_ids, SEARCHES) if matches_filters(item, *filters)}
+        assert {event["watch_id"] for event in session.events} == expected
+        assert len(session.events) == len(expected)
+
+    run(catalog, scenario)
+
+
+def test_unwatch_stops_events_and_only_for_the_owner(make_listing):
+    catalog = Catalog([make_listing("1")])
+    owner, other = FakeSession(), FakeSession()
+
+    async def scenario(feed):
+        item_watch = feed.watch_item(owner, "1")
+        search_watch = feed.watch_search(owner, ("listing", "", 0, None, 0))
+        assert not feed.unwatch(other, item_watch)
+        assert feed.unwatch(owner, item_watch) and feed.unwatch(owner, search_watch)
+        assert not feed.unwatch(owner, search_watch)
+        feed.watch_item(other, "1")
+        catalog.add_offer("1", offer(5))
+        await settle()
+        assert feed._term_watches == {} and feed._term_shapes == {}
+
+    run(catalog, scenario)
+    assert owner.events == []
+    assert [event["event"] for event in other.events] == ["new_offer"]
+
+
+def test_changes_after_the_loop_closes_do_not_stall_the_feed(make_listing):
+    catalog = Catalog([make_listing("1")])
+    feed = ChangeFeed(catalog)
+    gone, later = FakeSession(), FakeSession()
+
+    async def watch(session):
+        feed.watch_item(session, "1")
+        await settle()
+
+    # The first loop closes with its watch still registered
+    asyncio.run(watch(gone))
+    catalog.add_offer("1", offer(5))
+    assert feed.stats()["watches"] == 1
+
+    async def rewatch():
+        await watch(later)
+        catalog.add_offer("1", offer(7))
+        await settle()
+
+    asyncio.run(rewatch())
+    assert gone.events == []
+    assert [event["offer"]["amount"] for event in later.events] == [7]
+
+
+def test_slow_sessions_are_dropped_with_a_notice(make_listing):
+    catalog = Catalog([make_listing("1"), make_listing("2")])
+    slow, calm = FakeSession(), FakeSession()
+
+    async def scenario(feed):
+        feed.watch_item(slow, "1")
+        feed.watch_item(calm, "2")
+        for amount in range(3):
+            catalog.add_offer("1", offer(amount))
+        catalog.add_offer("2", offer(9))
+        # A single drain queues everything before either sender runs
+        await settle()
+        assert feed.dropped == 1
+        assert feed.stats()["sessions"] == feed.stats()["watches"] == 1
+
+    run(catalog, scenario, max_queue=2)
+    assert slow.events == [{"event": "dropped", "reason": "slow consumer", "watch_ids": ["w1"]}]
+    assert [event["offer"]["amount"] for event in calm.events] == [9]
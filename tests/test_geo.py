@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from geo import GeoIndex, distance_km, geocode
+
+
+def test_geocodes_cities_and_coordinates():
+    portland = geocode("Portland, OR")
+    assert portland == pytest.approx((45.52, -122.68), abs=0.1)
+    assert geocode("  portland ,  oregon ") == portland
+    assert geocode("45.5, -122.6") == (45.5, -122.6)
+    assert geocode("95, 10") is None
+    assert geocode("Atlantis") is None
+
+
+def test_distance_is_great_circle():
+    assert distance_km((0, 0), (0, 0)) == 0
+    assert distance_km((0, 0), (0, 1)) == pytest.approx(111.2, abs=0.2)
+    assert distance_km((0, 179.5), (0, -179.5)) == pytest.approx(111.2, abs=0.2)
+
+
+@pytest.mark.parametrize("center, radius_km", [
+    ((45.5, -122.6), 50), ((45.5, -122.6), 800), ((0.0, 179.9), 300), ((89.5, 10.0), 200), ((-33.9, 151.2), 5),
+])
+def test_within_matches_a_brute_force_scan(center, radius_km):
+    rnd = random.Random(11)
+    index = GeoIndex()
+    points = {}
+    for n in range(3000):
+        lat = max(-90.0, min(90.0, center[0] + rnd.uniform(-10, 10)))
+        lon = (center[1] + rnd.uniform(-15, 15) + 180) % 360 - 180
+        points[str(n)] = (lat, lon)
+        index.add(str(n), (lat, lon))
+    expected = {item_id for item_id, point in points.items() if distance_km(center, point) <= radius_km}
+    found = index.within(center, radius_km)
+    assert set(found) == expected
+    assert all(found[item_id] == pytest.approx(distance_km(center, points[item_id])) for item_id in found)
+
+
+def test_moved_and_removed_listings_leave_the_index():
+    index = GeoIndex()
+    index.add("1", (45.5, -122.6))
+    index.add("1", (47.6, -122.3))
+    index.add("2", (45.5, -122.6))
+    index.remove("2")
+    index.remove("missing")
+    assert set(index.within((47.6, -122.3), 10)) == {"1"}
+    assert index.within((45.5, -122.6), 10) == {}
+    assert len(index) == 1
+    assert index.within((45.5, -122.6), 0) == {}
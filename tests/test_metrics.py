@@ -0,0 +1,97 @@
+import asyncio
+import inspect
+import logging
+import time
+
+import pytest
+
+from metrics import Histogram, SlowCallProfiler, ToolMetrics, mark_error
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(3.65)
+
+
+def test_instrument_counts_calls_errors_and_bytes():
+    metrics = ToolMetrics()
+
+    @metrics.instrument
+    async def tool(name: str, fail: str = "") -> str:
+        """Docs."""
+        if fail == "raise":
+            raise RuntimeError
+        if fail == "mark":
+            mark_error()
+        return f"héllo {name}"
+
+    async def main():
+        assert await tool("a") == "héllo a"
+        await tool("b", fail="mark")
+        with pytest.raises(RuntimeError):
+            await tool("c", fail="raise")
+        await tool("d")
+
+    asyncio.run(main())
+    stats = metrics.tools["tool"]
+    assert stats.latency.count == 4
+    assert stats.errors == 2
+    assert stats.response_bytes == 3 * len("héllo a".encode())
+    assert stats.in_flight == 0
+    assert list(inspect.signature(tool).parameters) == ["name", "fail"]
+    assert tool.__doc__ == "Docs."
+
+
+def test_render_is_prometheus_text():
+    metrics = ToolMetrics(prefix="m")
+
+    @metrics.instrument
+    async def tool() -> str:
+        return "ok"
+
+    asyncio.run(tool())
+    text = metrics.render([
+        ("cache_hits", "counter", "Hits.", {"cache": "a"}, 3),
+        ("cache_hits", "counter", "Hits.", {"cache": "b"}, 4),
+        ("uptime", "gauge", "Up.", {}, 1.5),
+    ])
+    lines = text.splitlines()
+    assert 'm_tool_duration_seconds_bucket{tool="tool",le="+Inf"} 1' in lines
+    assert 'm_tool_duration_seconds_count{tool="tool"} 1' in lines
+    assert 'm_tool_errors_total{tool="tool"} 0' in lines
+    assert lines.count("# TYPE m_cache_hits counter") == 1
+    assert 'm_cache_hits{cache="b"} 4' in lines
+    assert "m_uptime 1.5" in lines
+    assert text.endswith("\n")
+
+
+def test_profiler_logs_slow_calls_only(caplog):
+    profiler = SlowCallProfiler(threshold=0.05, interval=0.002)
+    metrics = ToolMetrics(profiler=profiler)
+
+    def spin(seconds: float) -> None:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    @metrics.instrument
+    async def slow() -> str:
+        await asyncio.to_thread(spin, 0.1)
+        return ""
+
+    @metrics.instrument
+    async def fast() -> str:
+        return ""
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        asyncio.run(fast())
+        asyncio.run(slow())
+    assert profiler.slow_calls == 1
+    (record,) = caplog.records
+    assert record.getMessage().startswith("Slow call to slow:")
+    assert "spin" in record.getMessage()
+    assert "marketplace_tool_slow_calls_total 1" in metrics.render()
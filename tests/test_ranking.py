@@ -0,0 +1,98 @@
+import random
+import threading
+from datetime import date
+
+import pytest
+
+from catalog import RECENCY_HALF_LIFE_DAYS, Catalog, bm25_scores, listing_signals, static_score
+from geo import geocode
+from snapshot import SnapshotPublisher, open_view
+
+WORDS = ("phone", "sofa", "bike", "lamp", "camera", "desk", "iphone", "lampshade")
+
+
+def test_bm25_favours_rare_terms_and_short_listings():
+    lengths = {"short": 4, "long": 40}
+    rare = bm25_scores({"short": 1, "long": 1}, lengths, matching=2, documents=100, average_length=10)
+    common = bm25_scores({"short": 1}, lengths, matching=90, documents=100, average_length=10)
+    assert rare["short"] > rare["long"] > 0
+    assert rare["short"] > common["short"] > 0
+
+
+def test_bm25_saturates_with_repeats():
+    lengths = {"a": 10}
+    scores = [bm25_scores({"a": n}, lengths, 1, 10, 10)["a"] for n in (1, 2, 4, 8, 100)]
+    assert scores == sorted(scores)
+    assert scores[-1] - scores[-2] < scores[1] - scores[0]
+
+
+def test_signals_clamp_and_tolerate_bad_dates(make_listing):
+    item = make_listing("1", seller_rating=7, posted_date="soon", asking_price=100,
+                        offers=[{"buyer": "b", "amount": 150, "message": "", "date": "2024-01-12"}])
+    assert listing_signals(item) == (1.0, 0, 1.0)
+    unrated = make_listing("2", seller_rating=None, asking_price=0, posted_date="2024-01-10")
+    assert listing_signals(unrated) == (0.0, date(2024, 1, 10).toordinal(), 0.0)
+
+
+def test_recency_halves_every_half_life():
+    fresh = static_score((0.0, 1000, 0.0), 1000)
+    assert static_score((0.0, 1000, 0.0), 1000 + RECENCY_HALF_LIFE_DAYS) == pytest.approx(fresh / 2)
+    assert static_score((0.0, 0, 0.0), 1000) == 0
+
+
+def test_signals_rank_listings_without_a_query(make_listing):
+    catalog = Catalog([
+        make_listing("plain", seller_rating=3),
+        make_listing("rated", seller_rating=5),
+        make_listing("hot", seller_rating=3),
+    ])
+    catalog.add_offer("hot", {"buyer": "b", "amount": 100, "message": "", "date": "2024-01-12"})
+    assert [item_id for _, item_id in catalog.search_keys()] == ["hot", "rated", "plain"]
+    assert [item_id for _, item_id in catalog.search_keys(sort="listed")] == ["plain", "rated", "hot"]
+
+
+SEARCHES = [
+    {},
+    {"query": "lamp"},
+    {"query": "phone"},
+    {"query": "lamp* desk"},
+    {"query": "sofa", "category": "books", "max_price": 250},
+    {"max_price": 100},
+    {"near": geocode("Portland, OR"), "radius_km": 300},
+    {"query": "bike", "near": geocode("Seattle, WA"), "radius_km": 500},
+]
+
+
+def test_snapshot_views_rank_exactly_as_the_catalog(tmp_path, make_listing):
+    rnd = random.Random(11)
+
+    def listing(item_id: str) -> dict:
+        return make_listing(
+            item_id, title=" ".join(rnd.sample(WORDS, 2)), description=" ".join(rnd.choices(WORDS, k=4)),
+            category=rnd.choice(("Books", "Toys")), asking_price=rnd.randint(1, 500),
+            location=rnd.choice(("Portland, OR", "Seattle, WA", "Austin, TX")),
+            seller_rating=rnd.uniform(2, 5), posted_date=f"2024-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)}",
+        )
+
+    catalog = Catalog([listing(str(n)) for n in range(200)])
+    lock = threading.Lock()
+    publisher = SnapshotPublisher(catalog, str(tmp_path), lock, max_deltas=100)
+    with lock:
+        publisher.publish_all()
+    for step in range(3):
+        # Deltas replace, remove and add listings, and change their offer heat
+        with lock:
+            for n in rnd.sample(range(200), 20):
+                if str(n) in catalog:
+                    catalog.add_offer(str(n), {"buyer": "b", "amount": rnd.randint(1, 400), "message": "",
+                                               "date": "2024-01-12"})
+            catalog.remove_item(str(step))
+            catalog.add_item(listing(str(10 + step)))
+            catalog.add_item(listing(f"new{step}"))
+        publisher.publish()
+
+        view = open_view(str(tmp_path), {})
+        assert len(view.segments) == step + 2
+        for search in SEARCHES:
+            for sort in ("relevance", "listed"):
+                assert view.search_keys(sort=sort, **search) == catalog.search_keys(sort=sort, **search)
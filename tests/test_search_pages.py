@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from catalog import Catalog, decode_cursor, encode_cursor, matches_filters, page_keys
+from geo import geocode
+
+WORDS = ("phone", "sofa", "bike", "lamp", "camera", "desk")
+CITIES = ("Portland, OR", "Seattle, WA", "Austin, TX", "Nowhere")
+
+
+@pytest.fixture
+def catalog(make_listing):
+    rnd = random.Random(7)
+    return Catalog([
+        make_listing(
+            str(n), title=f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {n}", description=rnd.choice(WORDS),
+            category=rnd.choice(("Books", "Toys", "Electronics")), asking_price=rnd.randint(1, 500),
+            location=rnd.choice(CITIES), seller_rating=rnd.uniform(3, 5),
+            posted_date=f"2024-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)}",
+        )
+        for n in range(300)
+    ])
+
+
+FILTERS = [
+    {},
+    {"query": "phone"},
+    {"query": "phone lamp"},
+    {"category": "toys"},
+    {"max_price": 120},
+    {"query": "sofa", "category": "Books", "max_price": 300},
+    {"near": geocode("Portland, OR"), "radius_km": 300},
+    {"query": "bike", "near": geocode("Seattle, WA"), "radius_km": 50},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("sort", ["relevance", "listed"])
+def test_search_returns_exactly_the_matching_listings(catalog, filters, sort):
+    expected = {item["id"] for item in catalog if matches_filters(item, **filters)}
+    keys = catalog.search_keys(sort=sort, **filters)
+    assert {item_id for _, item_id in keys} == expected
+    assert keys == sorted(keys)
+    if sort == "listed":
+        assert [item_id for _, item_id in keys] == [item["id"] for item in catalog if item["id"] in expected]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_pages_walk_the_full_result_list(catalog, filters):
+    keys = catalog.search_keys(**filters)
+    walked, after = [], None
+    while True:
+        page, start, total = catalog.search_page(after=after, limit=7, **filters)
+        assert total == len(keys)
+        assert start == len(walked)
+        if not page:
+            break
+        walked.extend(page)
+        after = decode_cursor(encode_cursor(page[-1][0]))
+    assert walked == keys
+
+
+def test_cursor_survives_changes_to_earlier_results(catalog, make_listing):
+    page, _, _ = catalog.search_page(sort="listed", limit=10)
+    rest = [item_id for _, item_id in catalog.search_keys(sort="listed")][10:]
+    catalog.remove_item(page[0][1])
+    catalog.add_item(make_listing("new"))
+    following, start, _ = catalog.search_page(sort="listed", after=page[-1][0], limit=1000)
+    assert start == 9
+    assert [item_id for _, item_id in following] == rest + ["new"]
+
+
+def test_relevance_ranks_title_hits_first(make_listing):
+    catalog = Catalog([
+        make_listing("description", title="Desk", description="with a lamp"),
+        make_listing("title", title="Lamp", description="brass"),
+    ])
+    assert [item_id for _, item_id in catalog.search_keys("lamp")] == ["title", "description"]
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", encode_cursor((1,))[:-1] + "x", "WyJhIl0"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_keys_picks_the_page_from_unsorted_matches():
+    matches = [((n % 7, n), str(n)) for n in range(50)]
+    random.Random(1).shuffle(matches)
+    ordered = sorted(matches)
+    page, start = page_keys(matches, ordered[9][0], 5)
+    assert page == ordered[10:15]
+    assert start == 10
+    assert page_keys(matches, None, 3) == (ordered[:3], 0)
+
+
+def test_unknown_sort_is_rejected(catalog):
+    with pytest.raises(ValueError):
+        catalog.search_keys(sort="price")
@@ -0,0 +1,21 @@
+import json
+
+from serialization import dumps, join_array, loads
+
+
+def test_dumps_is_compact_and_keeps_unicode():
+    text = dumps({"title": "Café sofa", "prices": [1, 2.5], "sold": False, "offer": None})
+    assert " " not in text.replace("Café sofa", "")
+    assert "Café" in text
+    assert json.loads(text) == {"title": "Café sofa", "prices": [1, 2.5], "sold": False, "offer": None}
+
+
+def test_loads_reads_text_and_bytes():
+    assert loads('{"a":[1]}') == {"a": [1]}
+    assert loads('{"a":"é"}'.encode()) == {"a": "é"}
+
+
+def test_join_array_splices_encoded_values():
+    fragments = [dumps({"id": "1"}), dumps({"id": "2"})]
+    assert json.loads(join_array(fragments)) == [{"id": "1"}, {"id": "2"}]
+    assert join_array([]) == "[]"
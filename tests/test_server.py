@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+# Environment that would point the server at other data when it is imported
+SERVER_ENV = ("MARKETPLACE_DB", "MARKETPLACE_SEED", "MARKETPLACE_INDEX_SNAPSHOT", "MARKETPLACE_WORKER",
+              "MARKETPLACE_STORE")
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """The server module over its sample listings; it builds its catalog on import."""
+    saved = {name: os.environ.pop(name) for name in SERVER_ENV if name in os.environ}
+    os.environ["MARKETPLACE_DATA_DIR"] = str(tmp_path_factory.mktemp("data"))
+    try:
+        import server
+        yield server
+    finally:
+        os.environ.update(saved)
+
+
+@pytest.fixture(scope="module")
+def call(server):
+    """Run a tool call to completion on one loop shared by the module, as the server does."""
+    loop = asyncio.new_event_loop()
+    yield lambda coroutine: loop.run_until_complete(coroutine)
+    loop.run_until_complete(server.WRITES.close())
+    loop.close()
+
+
+def listing(server, call, title: str, asking_price: int = 100, **fields) -> str:
+    record = json.loads(call(server.create_listing(
+        title=title, description=fields.pop("description", "Works fine"), category=fields.pop("category", "Toys"),
+        condition="Good", asking_price=asking_price, seller="tester", location="Austin, TX", format="json",
+    )))
+    return record["id"]
+
+
+def test_json_search_pages_follow_their_cursors(server, call):
+    ids = {listing(server, call, f"Zeppelin model {n}", asking_price=10 + n) for n in range(7)}
+    seen, cursor = [], ""
+    while True:
+        page = json.loads(call(server.search_items(query="zeppelin", limit=3, cursor=cursor, format="json")))
+        assert page["total"] == 7 and page["start"] == len(seen)
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert {item["id"] for item in seen} == ids
+    assert set(seen[0]) >= {"id", "title", "asking_price", "highest_offer", "offer_count", "snippet"}
+
+
+def test_text_pages_name_the_next_cursor(server, call):
+    for n in range(3):
+        listing(server, call, f"Quokka plush {n}")
+    text = call(server.search_items(query="quokka", limit=2))
+    assert text.startswith("Found 3 items (showing 1-2):")
+    cursor = text.split('cursor="')[1].split('"')[0]
+    rest = call(server.search_items(query="quokka", limit=2, cursor=cursor))
+    assert rest.startswith("Found 3 items (showing 3-3):")
+    assert rest.count("Quokka plush") == 1 and "cursor=" not in rest
+
+
+def test_query_rules_named_in_the_docstring(server, call):
+    everything = json.loads(call(server.search_items(format="json")))["total"]
+    assert json.loads(call(server.search_items(query=" \t ", format="json")))["total"] == everything
+    literal = listing(server, call, "Gizmo* kit")
+    prefixed = listing(server, call, "Gizmotron kit")
+
+    def found(query):
+        return {item["id"] for item in json.loads(call(server.search_items(query=query, format="json")))["items"]}
+
+    assert found("gizmo*") == {literal}
+    assert found("gizmo* kit") == {literal, prefixed}
+
+def test_json_errors_and_records(server, call):
+    item_id = listing(server, call, "Kazoo", asking_price=12)
+    assert json.loads(call(server.get_item_details(item_id, format="json")))["title"] == "Kazoo"
+    assert json.loads(call(server.get_items([item_id, "missing"], format="json")))["items"][1] is None
+    assert json.loads(call(server.get_item_details("missing", format="json")))["error"].startswith("Item with ID")
+    assert json.loads(call(server.search_items(cursor="!!", format="json")))["error"].startswith("Error searching")
+    assert call(server.get_item_details(item_id, format="xml")).startswith("Error retrieving item details: Unknown format")
+
+
+def test_listing_reads_stay_off_the_event_loop(server, call, monkeypatch):
+    item_id = listing(server, call, "Sitar")
+    get, threads = server.CATALOG.get, []
+
+    def recording_get(requested):
+        threads.append(threading.current_thread())
+        return get(requested)
+
+    monkeypatch.setattr(server.CATALOG, "get", recording_get)
+    call(server.get_item_details(item_id))
+    call(server.get_offers_for_item(item_id))
+    call(server.place_offer(item_id, "ann", 50))
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+def test_offers_and_a_sale(server, call):
+    item_id = listing(server, call, "Banjo", asking_price=300)
+    assert call(server.place_offer(item_id, "ann", 200)) == f"✅ Offer placed on item {item_id}\n💰 $200 from ann"
+    placed = json.loads(call(server.place_offer(item_id, "bob", 250, "cash", format="json")))
+    assert (placed["buyer"], placed["amount"], placed["message"]) == ("bob", 250, "cash")
+    assert "Offer amount must be a positive number" in call(server.place_offer(item_id, "cat", -5))
+
+    sold = json.loads(call(server.accept_offer(item_id, "ann", format="json")))
+    assert (sold["status"], sold["sold_to"], sold["sold_price"]) == ("sold", "ann", 200)
+    assert [offer["buyer"] for offer in sold["offers"]] == ["bob", "ann"]
+    assert "not accepting offers" in call(server.place_offer(item_id, "dan", 400))
+    assert "not accepting offers" in call(server.accept_offer(item_id, "bob"))
+
+
+def test_create_listing_checks_its_input(server, call):
+    assert call(server.create_listing("", "d", "Toys", "Good", 5, "me", "Austin, TX")) == \
+        "A title and a seller are required."
+    assert json.loads(call(server.create_listing("Yo-yo", "d", "Toys", "Good", 0, "me", "Austin, TX",
+                                                 format="json"))) == {"error": "Asking price must be positive."}
+    item_id = listing(server, call, "Slinky", asking_price=4)
+    assert server.CATALOG.get(item_id)["posted_date"] == server.today()
+
+
+def interrupt_reads(server, monkeypatch, item_id: str, times: int) -> list:
+    """Make another writer change a listing right after each of its first `times` reads."""
+    get = server.CATALOG.get
+    interruptions = []
+
+    def get_then_interrupt(requested):
+        item = get(requested)
+        if requested == item_id and len(interruptions) < times:
+            interruptions.append(requested)
+            server.CATALOG.add_offer(item_id, {"buyer": "eve", "amount": 10, "message": "", "date": "2024-01-01"})
+        return item
+
+    monkeypatch.setattr(server.CATALOG, "get", get_then_interrupt)
+    return interruptions
+
+
+def test_accepting_retries_when_the_listing_changes_underneath(server, call, monkeypatch):
+    item_id = listing(server, call, "Theremin", asking_price=500)
+    call(server.place_offer(item_id, "ann", 400))
+    interruptions = interrupt_reads(server, monkeypatch, item_id, 2)
+    assert call(server.accept_offer(item_id, "ann")).startswith("🤝 Sold: Theremin")
+    assert len(interruptions) == 2
+    monkeypatch.undo()
+    assert [offer["buyer"] for offer in server.CATALOG.get(item_id)["offers"]] == ["ann", "eve", "eve"]
+
+
+def test_accepting_gives_up_on_a_listing_that_keeps_changing(server, call, monkeypatch):
+    item_id = listing(server, call, "Ocarina", asking_price=50)
+    call(server.place_offer(item_id, "ann", 40))
+    interrupt_reads(server, monkeypatch, item_id, server.ACCEPT_OFFER_ATTEMPTS)
+    assert call(server.accept_offer(item_id, "ann")) == f"Item '{item_id}' kept changing; try accepting again."
+    monkeypatch.undo()
+    assert server.CATALOG.get(item_id)["status"] == "active"
+
+
+def test_bulk_offers_fail_one_by_one(server, call):
+    item_id = listing(server, call, "Tuba", asking_price=900)
+    reply = json.loads(call(server.bulk_place_offers([
+        {"item_id": item_id, "buyer": "ann", "amount": 500},
+        {"item_id": "missing", "buyer": "bob", "amount": 5},
+        {"item_id": item_id, "buyer": "", "amount": 600},
+        {"item_id": item_id, "buyer": "cat", "amount": 700, "message": "best"},
+    ], format="json")))
+    assert reply["placed"] == 2
+    assert [result["placed"] for result in reply["results"]] == [True, False, False, True]
+    assert reply["results"][1]["error"] == "Item with ID 'missing' not found."
+    assert [offer["amount"] for offer in server.CATALOG.get(item_id)["offers"]] == [700, 500]
+    assert call(server.bulk_place_offers([])) == "No offers given."
+
+
+def test_an_import_reports_the_new_total(server, call):
+    item_id = listing(server, call, "Kalimba", asking_price=60)
+    assert json.loads(call(server.export_catalog("listings.jsonl", format="json")))["exported"] == len(server.CATALOG)
+    server.CATALOG.remove_item(item_id)
+    reply = json.loads(call(server.import_catalog("listings.jsonl", format="json")))
+    assert reply == {"imported": len(server.CATALOG), "total_items": len(server.CATALOG)}
+    assert server.CATALOG.get(item_id)["title"] == "Kalimba"
+
+@pytest.fixture(scope="module")
+def client(server):
+    from starlette.testclient import TestClient
+
+    # Not entered: the app's lifespan would shut down the executor and batcher the other tests share
+    return TestClient(server.create_starlette_app(server.mcp._mcp_server))
+
+
+def test_homepage_revalidates_by_etag(server, call, client):
+    first = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert "Content-Encoding" not in first.headers
+    assert first.headers["Cache-Control"] == "no-cache" and first.headers["Vary"] == "Accept-Encoding"
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    for validator in ({"If-None-Match": etag}, {"If-None-Match": etag.removeprefix("W/")},
+                      {"If-Modified-Since": first.headers["Last-Modified"]}):
+        cached = client.get("/", headers=validator)
+        assert cached.status_code == 304 and cached.content == b""
+        assert cached.headers["ETag"] == etag
+
+    listing(server, call, "Didgeridoo")
+    changed = client.get("/", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert f"{server.CATALOG.stats_snapshot().total_items:,}" in changed.text
+
+
+def test_homepage_is_compressed_for_clients_that_accept_it(client):
+    plain = client.get("/", headers={"Accept-Encoding": "identity"})
+    zipped = client.get("/", headers={"Accept-Encoding": "gzip;q=0.8, br;q=0"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    # The client decodes the body; it must be the same page
+    assert zipped.text == plain.text
+    refused = client.get("/", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in refused.headers
+
+
+def test_metrics_report_tools_catalog_and_caches(server, call, client):
+    listing(server, call, "Harmonica")
+    call(server.search_items(query="harmonica"))
+    reply = client.get("/metrics")
+    assert reply.status_code == 200
+    assert reply.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    lines = reply.text.splitlines()
+    assert f"marketplace_catalog_items {len(server.CATALOG)}" in lines
+    assert f"marketplace_writes_total {server.WRITES.writes}" in lines
+    errors = server.METRICS.tools["search_items"].errors
+    assert f'marketplace_tool_errors_total{{tool="search_items"}} {errors}' in lines and errors >= 1
+    assert any(line.startswith('marketplace_tool_duration_seconds_count{tool="create_listing"} ') for line in lines)
+    for cache in ("fragments", "search_results"):
+        assert any(line.startswith(f'marketplace_cache_hits_total{{cache="{cache}"}} ') for line in lines)
+
+
+def test_cache_stats_name_both_caches(server, call, client):
+    call(server.search_items(query="harmonica"))
+    stats = client.get("/stats/cache").json()
+    assert set(stats) == {"fragments", "search_results"}
+    assert stats["search_results"]["hits"] + stats["search_results"]["coalesced"] >= 1
+    assert set(stats["fragments"]) >= {"entries", "size_bytes", "hits", "misses", "hit_rate"}
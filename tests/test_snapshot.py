@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pytest
+
+from catalog import Catalog, copy_listing
+from snapshot import (PUBLISHER_MARKER, Segment, SnapshotCatalog, SnapshotPublisher, merge_segments, open_view,
+                      save_snapshot, write_segment)
+
+
+def offer(amount: int) -> dict:
+    return {"buyer": "buyer", "amount": amount, "message": "", "date": "2024-01-12"}
+
+
+def settled(publisher: SnapshotPublisher) -> None:
+    deadline = time.monotonic() + 10
+    while publisher._merging:
+        assert time.monotonic() < deadline, "background merge did not finish"
+        time.sleep(0.01)
+
+
+def assert_same(catalog: Catalog, directory: str) -> None:
+    view = SnapshotCatalog(open_view(directory, {}))
+    assert view.generation == catalog.generation
+    assert list(view) == [copy_listing(item) for item in catalog.snapshot()]
+    assert view.versions(catalog.listing_ids()) == catalog.versions(catalog.listing_ids())
+    assert view.stats.total_items == catalog.stats.total_items
+
+
+def test_merged_segments_keep_the_newest_record(tmp_path, make_listing):
+    old, new = str(tmp_path / "old.seg"), str(tmp_path / "new.seg")
+    write_segment(old, [(make_listing("1"), 1, 1), (make_listing("2"), 2, 1)], 2)
+    write_segment(new, [(make_listing("1", asking_price=50), 1, 2)], 4, tombstones=["2", "9"],
+                  changes=[[3, "remove", "2"]])
+
+    delta = str(tmp_path / "delta.seg")
+    assert merge_segments([old, new], delta, into_base=False) == 1
+    merged = Segment(delta)
+    assert merged.generation == 4
+    assert merged.item(merged.find("1"))["asking_price"] == 50
+    assert merged.version[merged.find("1")] == 2
+    assert merged.tombstones == {"2", "9"} and merged.changes == [[3, "remove", "2"]]
+
+    base = str(tmp_path / "base.seg")
+    assert merge_segments([old, new], base, into_base=True) == 1
+    assert Segment(base).tombstones == set() and Segment(base).changes == []
+
+
+def test_publisher_follows_the_catalog_through_merges(tmp_path, make_listing):
+    catalog = Catalog([make_listing(str(i)) for i in range(1, 21)])
+    lock = threading.Lock()
+    directory = str(tmp_path / "snapshot")
+    publisher = SnapshotPublisher(catalog, directory, lock, max_deltas=2, retain_seconds=0)
+    with lock:
+        publisher.publish_all()
+    assert_same(catalog, directory)
+
+    for step in range(12):
+        with lock:
+            catalog.add_offer("1", offer(step))
+            catalog.add_item(make_listing(str(step + 2), asking_price=step))
+            if step % 3 == 0:
+                catalog.remove_item(str(step + 10))
+        publisher.publish()
+        settled(publisher)
+        assert_same(catalog, directory)
+        assert len(publisher._segments) <= 3
+    # Retired segments are deleted once a later manifest no longer names them
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".seg")) == \
+        sorted(name for name, _ in publisher._segments)
+
+
+def test_publish_returns_before_a_merge_finishes(tmp_path, make_listing, monkeypatch):
+    catalog = Catalog([make_listing("1")])
+    lock = threading.Lock()
+    publisher = SnapshotPublisher(catalog, str(tmp_path), lock, max_deltas=1)
+    with lock:
+        publisher.publish_all()
+    release = threading.Event()
+    merge = merge_segments
+
+    def slow_merge(*args):
+        release.wait(10)
+        return merge(*args)
+
+    monkeypatch.setattr("snapshot.merge_segments", slow_merge)
+    for amount in range(3):
+        with lock:
+            catalog.add_offer("1", offer(amount))
+        assert publisher.publish() == catalog.generation
+    assert len(publisher._segments) == 4
+    release.set()
+    settled(publisher)
+    assert len(publisher._segments) == 2
+    assert_same(catalog, str(tmp_path))
+
+
+def test_publisher_refuses_directories_it_does_not_own(tmp_path, make_listing):
+    catalog = Catalog([make_listing("1")])
+    index = str(tmp_path / "index")
+    save_snapshot(catalog, index)
+    before = sorted(os.listdir(index))
+    with pytest.raises(ValueError, match="not empty"):
+        SnapshotPublisher(catalog, index, threading.Lock())
+    assert sorted(os.listdir(index)) == before
+
+    directory = str(tmp_path / "published")
+    lock = threading.Lock()
+    with lock:
+        SnapshotPublisher(catalog, directory, lock).publish_all()
+    assert PUBLISHER_MARKER in os.listdir(directory)
+    # A new publisher clears out an earlier publisher's segments
+    publisher = SnapshotPublisher(catalog, directory, lock)
+    assert sorted(os.listdir(directory)) == [PUBLISHER_MARKER]
+    with lock:
+        publisher.publish_all()
+    assert_same(catalog, directory)
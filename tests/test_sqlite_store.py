@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from catalog import Catalog
+from storage import MemoryStore, SQLiteStore
+
+
+def offer(buyer: str, amount: int) -> dict:
+    return {"buyer": buyer, "amount": amount, "message": "", "date": "2024-01-12"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / "catalog.db"), pool_size=2)
+    yield store
+    store.close()
+
+
+def test_round_trips_listings_with_best_first_offers(store, make_listing):
+    item = make_listing("1", images=["a.jpg"], offers=[offer("a", 10), offer("b", 30)])
+    store.put(item)
+    store.add_offer("1", offer("c", 20))
+    loaded = store.get("1")
+    assert [o["buyer"] for o in loaded["offers"]] == ["b", "c", "a"]
+    assert {key: value for key, value in loaded.items() if key != "offers"} == \
+        {key: value for key, value in item.items() if key != "offers"}
+    assert store.get("missing") is None
+
+
+def test_put_replaces_listing_and_offers(store, make_listing):
+    store.put(make_listing("1", offers=[offer("a", 10)]))
+    store.put(make_listing("1", title="Replaced"))
+    assert store.get("1")["title"] == "Replaced"
+    assert store.get("1")["offers"] == []
+    assert len(store) == 1
+
+
+def test_iterates_in_insertion_order_and_deletes(store, make_listing):
+    store.write_batch([("put", make_listing(str(n))) for n in range(1200)])
+    store.delete("5")
+    ids = [item["id"] for item in store]
+    assert ids == [str(n) for n in range(1200) if n != 5]
+    assert store.get_many(["7", "5", "3"])[1] is None
+
+
+def test_aggregate_matches_a_full_pass(store, make_listing):
+    store.write_batch([
+        ("put", make_listing("1", category="Books", asking_price=10, offers=[offer("a", 4), offer("b", 6)])),
+        ("put", make_listing("2", category="Toys", asking_price=25.5)),
+        ("offer", "2", offer("c", 20)),
+    ])
+    assert store.aggregate() == {
+        "total_items": 2, "total_offers": 3, "asking_sum": 35.5, "offer_sum": 30,
+        "category_items": {"Books": 1, "Toys": 1}, "category_offers": {"Books": 2, "Toys": 1},
+    }
+
+
+
+def test_catalog_stats_verify_against_sql_totals(store, make_listing):
+    catalog = Catalog([make_listing(str(n), category=("A", "B")[n % 2], offers=[offer("a", n)]) for n in range(10)],
+                      store=store)
+    catalog.add_offer("3", offer("b", 7))
+    catalog.remove_item("4")
+    assert catalog.verify_stats()
+
+
+def test_reads_do_not_wait_for_a_busy_pool(store, make_listing):
+    store.put(make_listing("1"))
+    held = [store._pool.get(), store._pool.get()]
+    try:
+        result = []
+        reader = threading.Thread(target=lambda: result.append(store.get("1")))
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+        assert result[0]["id"] == "1"
+    finally:
+        for conn in held:
+            store._pool.put(conn)
+    assert store._pool.qsize() == 2
+
+
+def test_memory_store_keeps_offer_books_sorted(make_listing):
+    store = MemoryStore()
+    store.put(make_listing("1", offers=[offer("a", 30)]))
+    store.add_offer("1", offer("b", 40))
+    store.add_offer("1", offer("c", 30))
+    assert [o["buyer"] for o in store.get("1")["offers"]] == ["b", "a", "c"]
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+import startup
+from catalog import Catalog, copy_listing
+from snapshot import open_view, save_snapshot
+from startup import FirstResponseMiddleware, LazyCatalog, StartupReport
+
+
+def snapshot_view(tmp_path, catalog: Catalog):
+    save_snapshot(catalog, str(tmp_path))
+    return open_view(str(tmp_path), {})
+
+
+@pytest.fixture
+def held_restore(monkeypatch):
+    """Makes Catalog.restore() wait until the returned event is set."""
+    release = threading.Event()
+    restore = Catalog.restore
+
+    def held(*args, **kwargs):
+        release.wait(10)
+        return restore(*args, **kwargs)
+
+    monkeypatch.setattr(startup.Catalog, "restore", held)
+    yield release
+    release.set()
+
+
+def test_restored_catalog_keeps_order_and_versions(tmp_path, make_listing):
+    catalog = Catalog([make_listing(str(i), title=f"Lamp {i}") for i in range(1, 6)])
+    catalog.add_item(make_listing("2", title="Lamp 2", asking_price=50))
+    catalog.remove_item("4")
+    view = snapshot_view(tmp_path, catalog)
+
+    restored = Catalog.restore(view.entries(), view.generation)
+    ids = catalog.listing_ids()
+    assert restored.listing_ids() == ids
+    assert restored.versions(ids) == catalog.versions(ids)
+    assert restored.generation == catalog.generation
+    assert restored.search_keys("lamp") == catalog.search_keys("lamp")
+    assert restored.next_id() == catalog.next_id()
+
+
+def test_lazy_catalog_reads_the_snapshot_until_restored(tmp_path, make_listing, held_restore):
+    catalog = Catalog([make_listing("1"), make_listing("2", asking_price=30)])
+    lazy = LazyCatalog(snapshot_view(tmp_path, catalog))
+    changes = []
+    lazy.add_change_listener(changes.append)
+
+    assert not lazy.ready
+    assert len(lazy) == 2 and "2" in lazy
+    assert lazy.get("2") == copy_listing(catalog.get("2"))
+    assert lazy.search_keys("", max_price=50) == catalog.search_keys("", max_price=50)
+
+    # Anything the snapshot cannot answer waits for the restore
+    added = []
+    writer = threading.Thread(target=lambda: added.append(lazy.add_item(make_listing("3"))))
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+    held_restore.set()
+    writer.join(10)
+
+    assert len(added) == 1
+    assert lazy.ready and isinstance(lazy.wait(), Catalog)
+    assert [change[0] for change in changes] == ["put"]
+    assert len(lazy) == 3
+
+
+def test_lazy_catalog_reports_a_failed_restore(tmp_path, make_listing, monkeypatch):
+    view = snapshot_view(tmp_path, Catalog([make_listing("1")]))
+
+    def broken(*args, **kwargs):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(startup.Catalog, "restore", broken)
+    lazy = LazyCatalog(view)
+    with pytest.raises(RuntimeError) as excinfo:
+        lazy.wait()
+    assert isinstance(excinfo.value.__cause__, OSError)
+    with pytest.raises(RuntimeError):
+        lazy.add_item({})
+
+
+def test_startup_report_keeps_the_first_mark():
+    report = StartupReport()
+    report.mark("imports")
+    first = report.phases["imports"]
+    report.mark("imports")
+    report.mark("catalog_ready")
+    assert report.phases["imports"] == first <= report.phases["catalog_ready"]
+    assert report.summary().startswith("imports ")
+    assert report.stats() == {"catalog_source": "store", "seconds": report.phases}
+
+
+def test_first_response_is_marked_once():
+    report = StartupReport()
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        sent.append(message["type"])
+
+    middleware = FirstResponseMiddleware(app, report)
+    asyncio.run(middleware({"type": "lifespan"}, None, send))
+    assert "first_response" not in report.phases
+    asyncio.run(middleware({"type": "http"}, None, send))
+    first = report.phases["first_response"]
+    asyncio.run(middleware({"type": "http"}, None, send))
+    assert report.phases["first_response"] == first
+    assert sent.count("http.response.start") == 3
@@ -0,0 +1,89 @@
+from catalog import TextIndex, matches_filters, query_terms
+
+
+def make_index() -> TextIndex:
+    index = TextIndex()
+    index.add("1", "Apple iPhone 12", "Unlocked phone, barely used")
+    index.add("2", "Android phone", "Headphones included")
+    index.add("3", "Bookshelf", "Solid oak, fits c++* manuals")
+    return index
+
+
+def listing(title: str, description: str) -> dict:
+    return {"title": title, "description": description, "category": "Books", "asking_price": 10, "location": ""}
+
+
+def test_single_term_is_a_substring_match():
+    index = make_index()
+    assert set(index.search("phone")) == {"1", "2"}
+    assert set(index.search("PHONE")) == {"1", "2"}
+    assert set(index.search("oak,")) == {"3"}
+    assert index.search("tablet") == {}
+
+
+def test_single_term_with_star_stays_literal():
+    index = make_index()
+    assert query_terms("c++*") == [("c++*", False)]
+    assert set(index.search("c++*")) == {"3"}
+    assert index.search("iph*") == {}
+
+
+def test_blank_queries_filter_nothing():
+    assert query_terms(" \t ") == []
+    assert matches_filters(listing("Bookshelf", "Solid oak"), " \t ")
+    assert query_terms(" so* \t oak ") == [("so", True), ("oak", False)]
+
+def test_star_is_a_prefix_operator_in_multi_term_queries():
+    index = make_index()
+    assert query_terms("iph* apple") == [("iph", True), ("apple", False)]
+    assert set(index.search("iph* apple")) == {"1"}
+    # "phone" is inside "headphones" but does not start it
+    assert set(index.search("phone* android")) == {"2"}
+    assert index.search("one* android") == {}
+
+
+def test_terms_must_all_match():
+    index = make_index()
+    assert set(index.search("phone used")) == {"1"}
+    assert index.search("phone oak") == {}
+
+
+def test_title_hits_outscore_description_hits():
+    index = TextIndex()
+    index.add("title", "Lamp", "Bright")
+    index.add("description", "Light", "A lamp")
+    scores = index.search("lamp")
+    assert scores["title"] > scores["description"]
+
+
+def test_remove_and_replace_drop_old_tokens():
+    index = make_index()
+    index.remove("1")
+    assert set(index.search("phone")) == {"2"}
+    index.add("2", "Desk", "Walnut")
+    assert index.search("phone") == {}
+    assert set(index.search("walnut")) == {"2"}
+    assert len(index) == 2
+    index.remove("missing")
+
+
+def test_suffixes_survive_compaction():
+    index = TextIndex()
+    for n in range(50):
+        index.add(str(n), f"token{n}", "")
+    for n in range(45):
+        index.remove(str(n))
+    assert set(index.search("token4")) == {"45", "46", "47", "48", "49"}
+    assert set(index.search("oken49")) == {"49"}
+
+
+def test_matches_filters_agrees_with_the_index():
+    index = make_index()
+    items = {
+        "1": listing("Apple iPhone 12", "Unlocked phone, barely used"),
+        "2": listing("Android phone", "Headphones included"),
+        "3": listing("Bookshelf", "Solid oak, fits c++* manuals"),
+    }
+    for query in ("phone", "c++*", "iph*", "iph* apple", "phone* android", "phone used", "oak"):
+        expected = {item_id for item_id, item in items.items() if matches_filters(item, query)}
+        assert set(index.search(query)) == expected, query
@@ -0,0 +1,85 @@
+import io
+import json
+
+import pytest
+
+from catalog import Catalog
+from storage import ColumnarStore
+from transfer import export_file, import_catalog, import_file, read_listings
+
+
+def test_export_then_import_round_trips(tmp_path, make_listing):
+    items = [make_listing(str(n), offers=[{"buyer": "a", "amount": n, "message": "", "date": "2024-01-12"}])
+             for n in range(1, 30)]
+    source = Catalog(items)
+    path = str(tmp_path / "catalog.jsonl")
+    assert export_file(source, path) == 29
+    assert not (tmp_path / "catalog.jsonl.partial").exists()
+
+    target = Catalog(store=ColumnarStore())
+    assert import_file(target, path) == 29
+    assert list(target) == list(source)
+    assert target.search_keys("listing") == source.search_keys("listing")
+    assert target.verify_stats()
+
+
+def test_import_replaces_listings_with_the_same_id(make_listing):
+    catalog = Catalog([make_listing("1", title="Old")])
+    lines = "\n".join(json.dumps(make_listing(n, title="New")) for n in ("1", "2")) + "\n\n"
+    assert import_catalog(catalog, io.StringIO(lines), batch_size=1) == 2
+    assert catalog.get("1")["title"] == "New"
+    assert [item_id for _, item_id in catalog.search_keys("old")] == []
+    assert len(catalog) == 2
+
+
+def test_numeric_ids_become_strings(make_listing):
+    (item,) = read_listings([json.dumps(make_listing(7))])
+    assert item["id"] == "7"
+
+
+@pytest.mark.parametrize("line, message", [
+    ("{not json", "Line 1: invalid JSON"),
+    ("[1, 2]", "Line 1: expected a JSON object"),
+    ('{"id": "1"}', "Line 1: missing title"),
+])
+def test_bad_lines_are_reported_by_number(line, message):
+    with pytest.raises(ValueError, match=message):
+        list(read_listings([line]))
+
+
+def test_bad_offers_are_reported(make_listing):
+    item = make_listing("1", offers=[{"buyer": "a"}])
+    with pytest.raises(ValueError, match="Line 2: offer missing amount, message, date"):
+        list(read_listings(["", json.dumps(item)]))
+
+
+def test_listings_before_a_bad_line_are_kept(make_listing):
+    catalog = Catalog()
+    lines = [json.dumps(make_listing("1")), "oops"]
+    with pytest.raises(ValueError):
+        import_catalog(catalog, io.StringIO("\n".join(lines)))
+    assert "1" in catalog
+
+
+@pytest.mark.parametrize("fields, message", [
+    ({"seller_rating": "4.5"}, "Line 1: seller_rating must be a number"),
+    ({"asking_price": True, "title": None}, "Line 1: title must be a string, asking_price must be a number"),
+    ({"images": "photo.jpg"}, "Line 1: images must be a list of strings"),
+    ({"offers": {"buyer": "a"}}, "Line 1: offers must be a list"),
+    ({"offers": ["cheap"]}, "Line 1: offers must be JSON objects"),
+    ({"offers": [{"buyer": "a", "amount": "5", "message": "", "date": "2024-01-01"}]},
+     "Line 1: offer amount must be a number"),
+])
+def test_mistyped_fields_are_reported_by_line(make_listing, fields, message):
+    with pytest.raises(ValueError, match=message):
+        list(read_listings([json.dumps(make_listing("1", **fields))]))
+
+
+def test_a_mistyped_line_leaves_the_catalog_writable(make_listing):
+    catalog = Catalog(store=ColumnarStore())
+    lines = [json.dumps(make_listing("1")), json.dumps(make_listing("2", seller_rating="4.5"))]
+    with pytest.raises(ValueError, match="Line 2"):
+        import_catalog(catalog, io.StringIO("\n".join(lines)))
+    catalog.add_item(make_listing("3"))
+    assert sorted(item["id"] for item in catalog) == ["1", "3"]
+    assert catalog.verify_stats()
@@ -0,0 +1,29 @@
+import io
+import json
+
+from catalog import Catalog
+from transfer import import_catalog
+from workers import SharedCatalog, WriterClient, WriterService
+
+
+def test_imports_through_the_writer_hold_its_write_lock(tmp_path, make_listing, monkeypatch):
+    catalog = Catalog([make_listing("1")])
+    snapshot_dir, address = str(tmp_path / "snapshot"), str(tmp_path / "writer.sock")
+    service = WriterService(catalog, snapshot_dir, address, b"key")
+    service.start()
+    held = []
+    bulk_load = catalog.bulk_load
+
+    def checked(*args, **kwargs):
+        held.append(service.lock.locked())
+        return bulk_load(*args, **kwargs)
+
+    monkeypatch.setattr(catalog, "bulk_load", checked)
+    try:
+        shared = SharedCatalog(snapshot_dir, WriterClient(address, b"key"))
+        lines = "\n".join(json.dumps(make_listing(str(n))) for n in range(2, 12))
+        assert import_catalog(shared, io.StringIO(lines), batch_size=3) == 10
+        assert held == [True]
+        assert len(shared) == 11 and shared.get("11")["id"] == "11"
+    finally:
+        service.close()
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from catalog import Catalog, WriteConflict
+from writer import KeyedLocks, WriteBatcher
+
+
+def offer(amount: int) -> dict:
+    return {"buyer": "buyer", "amount": amount, "message": "", "date": "2024-01-12"}
+
+
+def test_concurrent_writes_share_a_commit(make_listing):
+    catalog = Catalog([make_listing("1"), make_listing("2")])
+    batcher = WriteBatcher(catalog, max_delay=0.01)
+
+    async def main():
+        await asyncio.gather(*(batcher.write(("offer", str(n % 2 + 1), offer(n))) for n in range(1, 41)))
+        await batcher.close()
+
+    asyncio.run(main())
+    assert batcher.writes == 40
+    assert batcher.batches == 1
+    assert len(catalog.get("1")["offers"]) == 20
+    assert catalog.get("2")["offers"][0]["amount"] == 39
+
+
+def test_batches_are_capped_at_max_batch(make_listing):
+    catalog = Catalog([make_listing("1")])
+    batcher = WriteBatcher(catalog, max_batch=8)
+
+    async def main():
+        await asyncio.gather(*(batcher.write(("offer", "1", offer(n))) for n in range(1, 21)))
+        await batcher.close()
+
+    asyncio.run(main())
+    assert batcher.batches == 3
+    assert catalog.stats_snapshot().total_offers == 20
+
+
+def test_only_the_bad_writes_in_a_batch_fail(make_listing):
+    catalog = Catalog([make_listing("1")])
+    batcher = WriteBatcher(catalog, max_delay=0.01)
+    stale = make_listing("1", title="Stale")
+
+    async def main():
+        version = catalog.version("1")
+        catalog.add_item(make_listing("1", title="Newer"))
+        results = await asyncio.gather(
+            batcher.write(("offer", "1", offer(5))),
+            batcher.write(("offer", "missing", offer(6))),
+            batcher.write(("put", stale, version)),
+            batcher.write(("put", make_listing("2"))),
+            return_exceptions=True,
+        )
+        await batcher.close()
+        return results
+
+    ok, missing, conflict, created = asyncio.run(main())
+    assert ok is None and created is None
+    assert isinstance(missing, KeyError)
+    assert isinstance(conflict, WriteConflict)
+    assert catalog.get("1")["title"] == "Newer"
+    assert len(catalog.get("1")["offers"]) == 1
+    assert "2" in catalog
+
+
+def test_settle_waits_for_queued_writes(make_listing):
+    catalog = Catalog([make_listing("1")])
+    batcher = WriteBatcher(catalog, max_delay=0.02)
+
+    async def main():
+        batcher.submit(("offer", "1", offer(5)))
+        batcher.submit(("offer", "1", offer(7)))
+        await batcher.settle("1")
+        offers = len(catalog.get("1")["offers"])
+        await batcher.settle("unknown")
+        await batcher.close()
+        return offers
+
+    assert asyncio.run(main()) == 2
+    assert batcher._outstanding == {}
+
+
+def test_keyed_locks_serialize_one_key_only():
+    locks = KeyedLocks()
+    events = []
+
+    async def worker(key, name):
+        async with locks.hold(key):
+            events.append(("start", name))
+            await asyncio.sleep(0.01)
+            events.append(("end", name))
+
+    async def main():
+        await asyncio.gather(worker("a", 1), worker("a", 2), worker("b", 3))
+
+    asyncio.run(main())
+    assert events.index(("end", 1)) < events.index(("start", 2))
+    assert events.index(("start", 3)) < events.index(("end", 1))
+    assert len(locks) == 0
+
+
+def test_keyed_locks_are_dropped_after_errors():
+    locks = KeyedLocks()
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            async with locks.hold("a"):
+                raise RuntimeError
+
+    asyncio.run(main())
+    assert len(locks) == 0
@@ -0,0 +1,116 @@
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Tuple
+import json
+import os
+import sys
+
+from catalog import Catalog
+from serialization import dumps
+
+# Fields every imported listing and offer must carry; anything else is kept as is
+LISTING_FIELDS = ("id", "title", "description", "category", "condition", "seller", "seller_rating",
+                  "location", "posted_date", "images", "offers", "asking_price", "status")
+OFFER_FIELDS = ("buyer", "amount", "message", "date")
+
+# Types those fields must have: (what error messages call it, check)
+_TEXT = ("a string", lambda value: isinstance(value, str))
+_NUMBER = ("a number", lambda value: isinstance(value, (int, float)) and not isinstance(value, bool))
+_TEXT_LIST = ("a list of strings", lambda value: isinstance(value, list) and all(isinstance(v, str) for v in value))
+LISTING_TYPES = {
+    "title": _TEXT, "description": _TEXT, "category": _TEXT, "condition": _TEXT, "seller": _TEXT,
+    "location": _TEXT, "status": _TEXT, "seller_rating": _NUMBER, "asking_price": _NUMBER, "images": _TEXT_LIST,
+    "offers": ("a list", lambda value: isinstance(value, list)),
+}
+OFFER_TYPES = {"buyer": _TEXT, "message": _TEXT, "amount": _NUMBER}
+
+# Listings per store write during an import
+IMPORT_BATCH_SIZE = 1000
+
+
+def _mistyped(record: Dict[str, Any], types: Dict[str, Tuple[str, Callable[[Any], bool]]]) -> List[str]:
+    """A "<field> must be <type>" message for each field of record whose value has the wrong type."""
+    return [f"{field} must be {kind}" for field, (kind, check) in types.items() if not check(record[field])]
+
+
+def read_listings(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Parse and check JSONL listings one line at a time. Blank lines are skipped.
+
+    Every listing and offer field the store relies on must be present and of
+    the right type, so a bad line is reported here, by number, rather than
+    failing part-way through a store write.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number}: invalid JSON ({e.msg})") from None
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {number}: expected a JSON object")
+        missing = [field for field in LISTING_FIELDS if field not in item]
+        if missing:
+            raise ValueError(f"Line {number}: missing {', '.join(missing)}")
+        wrong = _mistyped(item, LISTING_TYPES)
+        if wrong:
+            raise ValueError(f"Line {number}: {', '.join(wrong)}")
+        for offer in item["offers"]:
+            if not isinstance(offer, dict):
+                raise ValueError(f"Line {number}: offers must be JSON objects")
+            missing = [field for field in OFFER_FIELDS if field not in offer]
+            if missing:
+                raise ValueError(f"Line {number}: offer missing {', '.join(missing)}")
+            wrong = _mistyped(offer, OFFER_TYPES)
+            if wrong:
+                raise ValueError(f"Line {number}: offer {', '.join(wrong)}")
+        item["id"] = str(item["id"])
+        yield item
+
+
+def import_catalog(catalog: Catalog, source: IO[str], batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Stream JSONL listings into the catalog, replacing listings with the same ID.
+
+    Listings go to the store in batches and the indexes are rebuilt once at
+    the end. The import is not atomic: on a bad line, listings before it are
+    kept. Returns the number of listings imported.
+    """
+    return catalog.bulk_load(read_listings(source), batch_size=batch_size)
+
+
+def export_catalog(catalog: Catalog, dest: IO[str]) -> int:
+    """Write every listing as one JSON object per line, from a consistent snapshot.
+
+    Returns the number of listings written.
+    """
+    count = 0
+    for item in catalog.snapshot():
+        dest.write(dumps(item))
+        dest.write("\n")
+        count += 1
+    return count
+
+
+def import_file(catalog: Catalog, path: str) -> int:
+    """import_catalog() from a file, or from stdin when path is "-"."""
+    if path == "-":
+        return import_catalog(catalog, sys.stdin)
+    with open(path, encoding="utf-8") as source:
+        return import_catalog(catalog, source)
+
+
+def export_file(catalog: Catalog, path: str) -> int:
+    """export_catalog() to a file, or to stdout when path is "-".
+
+    The file is written under a temporary name and moved into place when
+    complete, so readers never see a partial export.
+    """
+    if path == "-":
+        return export_catalog(catalog, sys.stdout)
+    partial = path + ".partial"
+    try:
+        with open(partial, "w", encoding="utf-8") as dest:
+            count = export_catalog(catalog, dest)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return count
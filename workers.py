@@ -0,0 +1,424 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from multiprocessing.connection import Client, Connection, Listener
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from starlette.responses import Response
+
+from catalog import Catalog, Change
+from snapshot import MANIFEST_NAME, Segment, SnapshotCatalog, SnapshotPublisher, SnapshotView, open_view
+from storage import WriteOp
+
+logger = logging.getLogger(__name__)
+
+# Environment a worker process is started with
+WORKER_ENV = "MARKETPLACE_WORKER"  # worker index, 0-based
+LISTEN_FD_ENV = "MARKETPLACE_LISTEN_FD"  # inherited listening TCP socket
+RUN_DIR_ENV = "MARKETPLACE_RUN_DIR"  # writer and worker Unix sockets
+SNAPSHOT_DIR_ENV = "MARKETPLACE_SNAPSHOT_DIR"
+WRITER_KEY_ENV = "MARKETPLACE_WRITER_KEY"  # hex authkey for the writer socket
+
+# Seconds a crashed worker stays down before it is started again
+RESPAWN_DELAY = 1.0
+
+
+def writer_address(run_dir: str) -> str:
+    return os.path.join(run_dir, "writer.sock")
+
+
+def worker_address(run_dir: str, worker: int) -> str:
+    return os.path.join(run_dir, f"worker-{worker}.sock")
+
+
+class WriterService:
+    """The one process that writes the catalog, serving writes for every worker.
+
+    Workers connect over a Unix socket and send requests as tuples:
+    ("apply", ops), ("next_id",), ("verify",), or ("load", batch_size)
+    followed by ("items", listings) messages and a final ("end",). Each gets
+    ("ok", result) or ("error", exception) back. Every committed write is
+    published as a new snapshot generation before it is acknowledged, so a
+    worker that refreshes after the reply sees its own write.
+    """
+
+    def __init__(self, catalog: Catalog, snapshot_dir: str, address: str, authkey: bytes, **publisher_options: Any) -> None:
+        self.catalog = catalog
+        self.lock = threading.Lock()
+        self.publisher = SnapshotPublisher(catalog, snapshot_dir, self.lock, **publisher_options)
+        self._listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self.lock:
+            self.publisher.publish_all()
+        self._thread = threading.Thread(target=self._accept, name="catalog-writer", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._listener.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # closed
+            except Exception:
+                logger.warning("Rejected a writer connection", exc_info=True)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="catalog-writer-conn", daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self._handle(request, conn))
+                except Exception as e:
+                    reply = ("error", e)
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def _handle(self, request: Tuple[Any, ...], conn: Connection) -> Any:
+        kind = request[0]
+        if kind == "apply":
+            with self.lock:
+                self.catalog.apply_writes(request[1])
+            return self.publisher.publish()
+        if kind == "next_id":
+            return self.catalog.next_id()
+        if kind == "offer_report":
+            return self.catalog.offer_report(*request[1:])
+        if kind == "verify":
+            with self.lock:
+                intact = self.catalog.verify_stats()
+            self.publisher.publish()
+            return intact
+        if kind == "load":
+            return self._load(request[1], conn)
+        raise ValueError(f"Unknown writer request '{kind}'")
+
+    def _load(self, batch_size: int, conn: Connection) -> int:
+        ended = False
+
+        def items() -> Iterator[Dict[str, Any]]:
+            nonlocal ended
+            while True:
+                message = conn.recv()
+                if message[0] == "end":
+                    ended = True
+                    return
+                yield from message[1]
+
+        try:
+            # Held for the whole load, like every other write, so no publish
+            # captures a half-loaded catalog; other writers wait for it
+            with self.lock:
+                try:
+                    return self.catalog.bulk_load(items(), batch_size=batch_size)
+                finally:
+                    self.publisher.publish_all()
+        finally:
+            # Read the rest of the stream so the connection stays in step
+            while not ended:
+                ended = conn.recv()[0] == "end"
+
+
+class WriterClient:
+    """Worker-side connections to the WriterService, one per concurrent caller."""
+
+    def __init__(self, address: str, authkey: bytes) -> None:
+        self.address = address
+        self.authkey = authkey
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def call(self, *request: Any) -> Any:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        try:
+            conn.send(request)
+            status, value = conn.recv()
+        except BaseException:
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+        if status == "error":
+            raise value
+        return value
+
+    def load(self, items: Iterable[Dict[str, Any]], batch_size: int) -> int:
+        """Stream listings to the writer for Catalog.bulk_load() on a connection of their own."""
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send(("load", batch_size))
+            try:
+                batch: List[Dict[str, Any]] = []
+                for item in items:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        conn.send(("items", batch))
+                        batch = []
+                if batch:
+                    conn.send(("items", batch))
+            finally:
+                # Listings sent before a bad one are still loaded, as with Catalog.bulk_load()
+                conn.send(("end",))
+                status, value = conn.recv()
+        if status == "error":
+            raise value
+        return value
+
+
+class SharedCatalog(SnapshotCatalog):
+    """Read-only catalog served from the snapshot a WriterService publishes.
+
+    Reads come from the current SnapshotView; writes are forwarded to the
+    writer. refresh() moves to the newest published generation and replays
+    the changes it brings to the registered listeners, so caches and watches
+    in this worker follow writes made through any worker. Changes dropped by
+    a base compaction before this worker refreshed are not replayed; caches
+    keyed on listing versions stay correct regardless.
+    """
+
+    def __init__(self, directory: str, writer: WriterClient) -> None:
+        self.directory = directory
+        self.writer = writer
+        self._listeners: List[Callable[[str], None]] = []
+        self._change_listeners: List[Callable[[Change], None]] = []
+        self._segments: Dict[str, Segment] = {}  # file name -> mapped segment
+        self._manifest: Optional[Tuple[int, int]] = None  # (inode, mtime) of the manifest in use
+        self._lock = threading.Lock()
+        super().__init__(self._open())
+        # Generation of the last change passed to listeners
+        self._replayed = self._view.generation
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Register a callback run, from refresh(), with the item_id of each changed listing."""
+        self._listeners.append(callback)
+
+    def add_change_listener(self, callback: Callable[[Change], None]) -> None:
+        """Register a callback run, from refresh(), with what each published write changed."""
+        self._change_listeners.append(callback)
+
+    def changed(self) -> bool:
+        """Whether the writer has published a manifest this worker has not read yet."""
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST_NAME))
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != self._manifest
+
+    def refresh(self) -> None:
+        """Switch to the newest published view and replay its new changes to listeners."""
+        with self._lock:
+            if not self.changed():
+                return
+            view = self._open()
+            changes = sorted((change for segment in view.segments for change in segment.changes
+                              if change[0] > self._replayed), key=lambda change: change[0])
+            if changes and changes[0][0] > self._replayed + 1:
+                logger.debug("Snapshot changes %d-%d were compacted away before replay",
+                             self._replayed + 1, changes[0][0] - 1)
+            self._view = view
+            self._replayed = max(self._replayed, view.generation)
+            if self._listeners or self._change_listeners:
+                self._replay(view, changes)
+
+    def _open(self) -> SnapshotView:
+        stat = os.stat(os.path.join(self.directory, MANIFEST_NAME))
+        view = open_view(self.directory, self._segments)
+        self._segments = {segment.name: segment for segment in view.segments}
+        self._manifest = (stat.st_ino, stat.st_mtime_ns)
+        return view
+
+    def _replay(self, view: SnapshotView, changes: List[List[Any]]) -> None:
+        puts = [change[2] for change in changes if change[1] == "put"]
+        items = dict(zip(puts, (item for _, item in view.get_versioned(puts))))
+        for change in changes:
+            item_id = change[2]
+            for callback in self._listeners:
+                callback(item_id)
+            if change[1] == "put":
+                if items[item_id] is None:
+                    continue  # removed again later in this batch
+                event: Change = ("put", items[item_id], change[3], change[4])
+            elif change[1] == "offer":
+                event = ("offer", item_id, change[3])
+            else:
+                event = ("remove", item_id)
+            for change_callback in self._change_listeners:
+                change_callback(event)
+
+    def next_id(self) -> str:
+        return self.writer.call("next_id")
+
+    def apply_writes(self, ops: List[WriteOp]) -> None:
+        """Commit writes through the writer, then refresh so they are visible here."""
+        try:
+            self.writer.call("apply", ops)
+        finally:
+            # A WriteConflict means this worker's view is behind; catch up either way
+            self.refresh()
+
+    def add_item(self, item: Dict[str, Any]) -> None:
+        self.apply_writes([("put", item)])
+
+    def add_offer(self, item_id: str, offer: Dict[str, Any]) -> None:
+        self.apply_writes([("offer", item_id, offer)])
+
+    def bulk_load(self, items: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        try:
+            return self.writer.load(items, batch_size)
+        finally:
+            self.refresh()
+
+    def offer_report(
+        self, category: str = "", days: int = 30, first: Optional[int] = None, last: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Catalog.offer_report(), answered by the writer, whose catalog keeps the offer rollups."""
+        return self.writer.call("offer_report", category, days, first, last)
+
+    def verify_stats(self) -> bool:
+        """Have the writer check its running totals; corrected totals arrive with the next refresh."""
+        intact = self.writer.call("verify")
+        self.refresh()
+        return intact
+
+
+class MessageRouter:
+    """ASGI app for /messages/{worker}/ that keeps each POST on the worker owning its session.
+
+    Requests for this worker's sessions go to the local SSE transport; others
+    are forwarded, body and status unchanged, over the owner's Unix socket.
+    """
+
+    def __init__(self, worker: int, run_dir: str, local: Callable[..., Any]) -> None:
+        self.worker = worker
+        self.run_dir = run_dir
+        self.local = local
+        self._clients: Dict[int, Any] = {}  # httpx.AsyncClient by owner
+        self.forwarded = 0
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        owner = scope["path_params"]["worker"]
+        if owner == self.worker:
+            await self.local(scope, receive, send)
+            return
+        import httpx
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]
+                   if key in (b"content-type", b"accept")}
+        url = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope["query_string"] else "")
+        client = self._clients.get(owner)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=worker_address(self.run_dir, owner))
+            client = self._clients[owner] = httpx.AsyncClient(transport=transport, base_url="http://worker")
+        try:
+            forwarded = await client.request(scope["method"], url, content=body, headers=headers)
+        except httpx.TransportError:
+            response = Response(f"Worker {owner} is unavailable", status_code=503)
+        else:
+            self.forwarded += 1
+            response = Response(forwarded.content, status_code=forwarded.status_code,
+                                media_type=forwarded.headers.get("content-type"))
+        await response(scope, receive, send)
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+def run_worker(app: Any, worker: int, log_level: str = "info") -> None:
+    """Serve the app in a worker process on the inherited TCP socket and the worker's Unix socket."""
+    import uvicorn
+
+    listen = socket.socket(fileno=int(os.environ[LISTEN_FD_ENV]))
+    path = worker_address(os.environ[RUN_DIR_ENV], worker)
+    if os.path.exists(path):
+        os.remove(path)
+    local = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    local.bind(path)
+    local.listen(128)
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[listen, local])
+
+
+def serve_workers(
+    catalog: Catalog, command: List[str], workers: int, host: str, port: int,
+    snapshot_dir: Optional[str] = None, **publisher_options: Any,
+) -> None:
+    """Run ``workers`` server processes on one port, with this process as their catalog writer.
+
+    Each worker runs ``command`` with the worker environment set and accepts
+    connections on the shared listening socket. Workers that exit are
+    started again until SIGINT or SIGTERM, which stops them all.
+    """
+    run_dir = tempfile.mkdtemp(prefix="marketplace-")
+    authkey = os.urandom(16)
+    writer = WriterService(catalog, snapshot_dir or os.path.join(run_dir, "snapshot"), writer_address(run_dir),
+                           authkey, **publisher_options)
+    writer.start()
+    listen = socket.create_server((host, port), backlog=2048)
+    env = dict(os.environ)
+    env.update({
+        LISTEN_FD_ENV: str(listen.fileno()),
+        RUN_DIR_ENV: run_dir,
+        SNAPSHOT_DIR_ENV: writer.publisher.directory,
+        WRITER_KEY_ENV: authkey.hex(),
+    })
+
+    def spawn(worker: int) -> subprocess.Popen:
+        return subprocess.Popen(command, env=dict(env, **{WORKER_ENV: str(worker)}), pass_fds=[listen.fileno()])
+
+    stopping = threading.Event()
+    previous = {sig: signal.signal(sig, lambda *_: stopping.set()) for sig in (signal.SIGINT, signal.SIGTERM)}
+    children = {worker: spawn(worker) for worker in range(workers)}
+    restart_at: Dict[int, float] = {}
+    try:
+        while not stopping.wait(0.2):
+            for worker, child in children.items():
+                if child.poll() is None or worker in restart_at:
+                    continue
+                logger.warning("Worker %d exited with status %s; restarting", worker, child.returncode)
+                restart_at[worker] = time.monotonic() + RESPAWN_DELAY
+            for worker, when in list(restart_at.items()):
+                if time.monotonic() >= when:
+                    children[worker] = spawn(worker)
+                    del restart_at[worker]
+    finally:
+        for child in children.values():
+            if child.poll() is None:
+                child.terminate()
+        deadline = time.monotonic() + 10
+        for child in children.values():
+            try:
+                child.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                child.kill()
+                child.wait()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        listen.close()
+        writer.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,150 @@
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Set, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+
+from catalog import Catalog, WriteConflict
+from storage import WriteOp
+
+
+class KeyedLocks:
+    """One asyncio lock per key, created on demand and dropped when unused.
+
+    Holders of different keys never wait on each other, so contention on
+    one hot listing does not slow writes to the rest of the catalog.
+    """
+
+    def __init__(self) -> None:
+        # key -> (lock, number of tasks holding or waiting for it)
+        self._locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+class WriteBatcher:
+    """Group-commits catalog writes submitted by concurrent tool calls.
+
+    Writes queue up while the previous batch is being committed, and each
+    batch of up to ``max_batch`` writes reaches the store in a single commit
+    on a worker thread. A write submitted to an idle batcher waits at most
+    ``max_delay`` seconds for company before it is flushed.
+    """
+
+    def __init__(self, catalog: Catalog, max_batch: int = 256, max_delay: float = 0.002) -> None:
+        self.catalog = catalog
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.writes = 0
+        self._queue: List[Tuple[WriteOp, "asyncio.Future[None]"]] = []
+        # item_id -> futures of its queued, not yet committed writes
+        self._outstanding: Dict[str, Set["asyncio.Future[None]"]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def submit(self, op: WriteOp) -> "asyncio.Future[None]":
+        """Queue a write; the returned future resolves once it is committed."""
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = loop.create_task(self._flush_loop())
+        future = loop.create_future()
+        item_id = op[1]["id"] if op[0] == "put" else op[1]
+        outstanding = self._outstanding.setdefault(item_id, set())
+        outstanding.add(future)
+        future.add_done_callback(lambda done: self._settled(item_id, done))
+        self._queue.append((op, future))
+        self._wakeup.set()
+        return future
+
+    async def write(self, op: WriteOp) -> None:
+        await self.submit(op)
+
+    async def settle(self, item_id: str) -> None:
+        """Wait until every write already queued for a listing is committed or failed.
+
+        Call this before a read-modify-write of the whole listing, so the
+        put does not overwrite offers that are still in the queue.
+        """
+        outstanding = self._outstanding.get(item_id)
+        if outstanding:
+            await asyncio.gather(*outstanding, return_exceptions=True)
+
+    def _settled(self, item_id: str, future: "asyncio.Future[None]") -> None:
+        outstanding = self._outstanding.get(item_id)
+        if outstanding is not None:
+            outstanding.discard(future)
+            if not outstanding:
+                del self._outstanding[item_id]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if len(self._queue) < self.max_batch:
+                await asyncio.sleep(self.max_delay)
+            while self._queue:
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                await self._commit(batch)
+
+    async def _commit(self, batch: List[Tuple[WriteOp, "asyncio.Future[None]"]]) -> None:
+        ops = [op for op, _ in batch]
+        try:
+            await asyncio.to_thread(self.catalog.apply_writes, ops)
+        except Exception as e:
+            if isinstance(e, (KeyError, WriteConflict)) and len(batch) > 1:
+                # Rejected before anything was written; retry one by one so
+                # only the writes to missing or changed listings fail
+                for entry in batch:
+                    await self._commit([entry])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(ops)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._queue),
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": self.writes / self.batches if self.batches else 0.0,
+        }
+
+    async def close(self) -> None:
+        """Commit whatever is still queued, then stop the flush loop."""
+        outstanding = [future for futures in self._outstanding.values() for future in futures]
+        await asyncio.gather(*outstanding, return_exceptions=True)
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None